@@ -23,26 +23,8 @@ class ChamberAgent(BaseAgent):
         self.discount_factor = 0.9
     
     def get_state(self, environment) -> np.ndarray:
-        """获取腔室状态"""
-        state = self.chamber.get_state_vector(environment.current_time)
-        
-        # 添加环境信息
-        env_info = np.zeros(5)
-        
-        # 等待进入的晶圆数量
-        waiting_for_chamber = 0
-        for wafer in environment.wafers:
-            if (not wafer.is_completed() and 
-                wafer.can_enter_chamber(self.chamber.chamber_id)):
-                waiting_for_chamber += 1
-        env_info[0] = waiting_for_chamber
-        
-        # 当前时间
-        env_info[1] = environment.current_time % 1000  # 归一化
-        
-        # 合并状态
-        full_state = np.concatenate([state, env_info])
-        return full_state[:self.state_dim]
+        """获取腔室状态：读取环境批量观测中本腔室的一行"""
+        return environment.get_observations().chamber(self.chamber)[:self.state_dim]
     
     def get_action_space(self) -> List[int]:
         """获取动作空间"""
@@ -57,8 +39,7 @@ class ChamberAgent(BaseAgent):
             
             # 如果有晶圆等待且门关闭，可以开门
             if (not self.chamber.door_open and 
-                any(w.current_location == self.chamber.chamber_name 
-                    for w in environment.wafers)):
+                environment.count_wafers_at(self.chamber.chamber_name) > 0):
                 valid_actions.append(1)  # 开门
             
             # 如果需要清洁
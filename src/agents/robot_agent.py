@@ -23,34 +23,8 @@ class RobotAgent(BaseAgent):
         self.discount_factor = 0.9
     
     def get_state(self, environment) -> np.ndarray:
-        """获取机械臂状态"""
-        state = self.robot_arm.get_state_vector(environment.current_time)
-        
-        # 添加环境信息
-        env_info = np.zeros(6)
-        
-        # 可取的晶圆数量
-        pickable_wafers = 0
-        for wafer in environment.wafers:
-            if (wafer.status == 'waiting' and 
-                wafer.current_location and
-                not wafer.is_completed()):
-                pickable_wafers += 1
-        env_info[0] = pickable_wafers
-        
-        # 可放置的腔室数量
-        available_chambers = 0
-        for chamber in environment.chambers.values():
-            if chamber.can_accept_wafer(None):  # 简化检查
-                available_chambers += 1
-        env_info[1] = available_chambers
-        
-        # 当前时间
-        env_info[2] = environment.current_time % 1000
-        
-        # 合并状态
-        full_state = np.concatenate([state, env_info])
-        return full_state[:self.state_dim]
+        """获取机械臂状态：读取环境批量观测中本机械臂的一行"""
+        return environment.get_observations().arm(self.robot_arm)[:self.state_dim]
     
     def get_action_space(self) -> List[int]:
         """获取动作空间"""
@@ -23,27 +23,8 @@ class WaferAgent(BaseAgent):
         self.discount_factor = 0.95
     
     def get_state(self, environment) -> np.ndarray:
-        """获取晶圆状态"""
-        state = self.wafer.get_state_vector()
-        
-        # 添加环境信息
-        env_state = np.zeros(10)
-        
-        # 可用腔室数量
-        available_chambers = environment.get_available_chambers_for_wafer(self.wafer)
-        env_state[0] = len(available_chambers)
-        
-        # 当前时间
-        env_state[1] = environment.current_time
-        
-        # 等待的晶圆数量
-        waiting_wafers = sum(1 for w in environment.wafers 
-                           if w.status == 'waiting' and not w.is_completed())
-        env_state[2] = waiting_wafers
-        
-        # 合并状态
-        full_state = np.concatenate([state, env_state])
-        return full_state[:self.state_dim]  # 截断到固定维度
+        """获取晶圆状态：读取环境批量观测中本晶圆的一行"""
+        return environment.get_observations().wafer(self.wafer)[:self.state_dim]
     
     def get_action_space(self) -> List[int]:
         """获取动作空间"""
@@ -55,7 +36,8 @@ class WaferAgent(BaseAgent):
         
         # 获取柔性腔室选项
         flexible_options = self.wafer.get_flexible_chamber_options()
-        available_chambers = environment.get_available_chambers_for_wafer(self.wafer)
+        # 只保留送入后不会导致死锁的腔室
+        available_chambers = environment.get_safe_chambers(self.wafer)
         
         # 检查每个柔性选项是否可用
         for i, chamber_id in enumerate(flexible_options[:4]):  # 最多4个选项
@@ -37,70 +37,8 @@ class WaferAgent(BaseAgent):
         return tuple(state_quantized)
     
     def get_state(self, environment) -> np.ndarray:
-        """获取晶圆状态"""
-        state = np.zeros(self.state_dim, dtype=np.float32)
-        
-        # 基本信息
-        state[0] = float(self.wafer.lot_id)
-        state[1] = float(self.wafer.wafer_num)
-        state[2] = float(self.wafer.current_step)
-        state[3] = float(len(self.wafer.process_route))
-        
-        # 当前目标腔室
-        current_target = self.wafer.get_current_target_chamber()
-        if current_target is not None:
-            state[4] = float(current_target)
-        
-        # 下一个目标腔室
-        next_target = self.wafer.get_next_target_chamber()
-        if next_target is not None:
-            state[5] = float(next_target)
-        
-        # 状态编码
-        status_encoding = {
-            'waiting': 1.0, 'processing': 2.0, 'moving': 3.0, 'completed': 4.0
-        }
-        state[6] = status_encoding.get(self.wafer.status, 0.0)
-        
-        # 当前位置编码
-        if self.wafer.current_location is not None:
-            # 将位置名称转换为数字编码
-            location_encoding = self._encode_location(self.wafer.current_location)
-            state[7] = float(location_encoding)
-        
-        # 完成进度
-        if self.wafer.process_route:
-            state[8] = float(self.wafer.current_step) / float(len(self.wafer.process_route))
-        else:
-            state[8] = 1.0
-        
-        # 柔性选项数量
-        state[9] = float(len(self.wafer.get_flexible_chamber_options()))
-        
-        # 环境信息
-        available_chambers = environment.get_available_chambers_for_wafer(self.wafer)
-        state[10] = float(len(available_chambers))
-        
-        # 当前时间（归一化）
-        state[11] = float(environment.current_time % 1000) / 1000.0
-        
-        # 等待的晶圆数量
-        waiting_wafers = sum(1 for w in environment.wafers 
-                           if w.status == 'waiting' and not w.is_completed())
-        state[12] = float(waiting_wafers)
-        
-        return self._clean_state(state)
-    
-    def _encode_location(self, location: str) -> int:
-        """将位置名称编码为数字"""
-        location_map = {
-            'LoadPort1': 1, 'LoadPort2': 2, 'LoadPort3': 3,
-            'LLA': 11, 'LLB': 12, 'LLC': 13, 'LLD': 14,
-            'PM1': 21, 'PM2': 22, 'PM3': 23, 'PM4': 24, 'PM5': 25,
-            'PM6': 26, 'PM7': 27, 'PM8': 28, 'PM9': 29, 'PM10': 30,
-            'TM1': 31, 'TM2_R1': 32, 'TM2_R2': 33, 'TM3_R1': 34, 'TM3_R2': 35
-        }
-        return location_map.get(location, 0)
+        """获取晶圆状态：读取环境批量观测中本晶圆的一行"""
+        return self._clean_state(environment.get_observations().wafer(self.wafer))
     
     def get_action_space(self) -> List[int]:
         """获取动作空间"""
@@ -115,7 +53,8 @@ class WaferAgent(BaseAgent):
         
         # 获取柔性腔室选项
         flexible_options = self.wafer.get_flexible_chamber_options()
-        available_chambers = environment.get_available_chambers_for_wafer(self.wafer)
+        # 只保留送入后不会导致死锁的腔室
+        available_chambers = environment.get_safe_chambers(self.wafer)
         
         # 检查每个柔性选项是否可用
         for i, chamber_id in enumerate(flexible_options[:4]):  # 最多4个选项
@@ -0,0 +1,86 @@
+"""
+环境吞吐量测试
+以随机策略比较单环境与多副本向量化环境每秒执行的决策步数；VecFabEnv只批量计算观测，
+事件推进仍逐个副本执行，加速主要来自ParallelVecFabEnv的多进程
+"""
+
+import argparse
+import os
+import random
+import time
+import numpy as np
+from environment.fab_environment import FabEnvironment
+from environment.vec_env import make_vec_env
+from config.task_config import task_name
+
+def run_scalar(task: str, steps: int, seed: int) -> float:
+    """单环境随机策略，返回每秒决策步数"""
+    rng = random.Random(seed)
+    env = FabEnvironment(task, history='off')
+    initial_snapshot = env.snapshot()
+    env.advance_to_next_decision()
+    
+    start = time.perf_counter()
+    for _ in range(steps):
+        if env.is_done():
+            env.restore(initial_snapshot)
+            env.advance_to_next_decision()
+        dispatched = 0
+        for wafer in env.get_decision_wafers():
+            # 等待与各可送入腔室等概率选择
+            choice = rng.choice([None] + env.get_dispatchable_chambers(wafer))
+            if choice is not None:
+                dispatched += env.dispatch_wafer(wafer, choice)
+        if not dispatched:
+            env.advance_to_next_event()
+        env.advance_to_next_decision()
+    return steps / (time.perf_counter() - start)
+
+def run_vectorized(task: str, num_envs: int, steps: int, seed: int, num_workers: int = 1) -> float:
+    """向量化环境随机策略，返回每秒决策步数（各副本合计）"""
+    rng = np.random.default_rng(seed)
+    vec_env = make_vec_env(task, num_envs, num_workers)
+    _, masks = vec_env.reset()
+    
+    start = time.perf_counter()
+    for _ in range(steps):
+        # 在有效动作中均匀采样
+        actions = (rng.random(masks.shape) * masks).argmax(axis=-1)
+        _, _, dones, masks = vec_env.step(actions)
+        if dones.any():
+            _, masks = vec_env.reset(np.flatnonzero(dones))
+    elapsed = time.perf_counter() - start
+    vec_env.close()
+    return steps * num_envs / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='环境吞吐量测试')
+    parser.add_argument('--task', type=task_name, default='a',
+                       help='测试任务 (a-d或gen:生成任务，默认a)')
+    parser.add_argument('--num_envs', type=int, default=16,
+                       help='向量化环境副本数 (默认16)')
+    parser.add_argument('--num_workers', type=int, default=os.cpu_count() or 1,
+                       help='多进程向量化环境的工作进程数 (默认CPU核数)')
+    parser.add_argument('--steps', type=int, default=2000,
+                       help='决策步数 (默认2000)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='随机种子')
+    
+    args = parser.parse_args()
+    
+    scalar_rate = run_scalar(args.task, args.steps, args.seed)
+    vector_rate = run_vectorized(args.task, args.num_envs, args.steps // args.num_envs or 1, args.seed)
+    parallel_rate = None
+    if args.num_workers > 1:
+        parallel_rate = run_vectorized(args.task, args.num_envs, args.steps // args.num_envs or 1, args.seed,
+                                       args.num_workers)
+    
+    print(f"任务 {args.task.upper()} 随机策略吞吐量:")
+    print(f"- FabEnvironment: {scalar_rate:.0f} 步/秒")
+    print(f"- VecFabEnv(N={args.num_envs}): {vector_rate:.0f} 步/秒 ({vector_rate / scalar_rate:.2f}x)")
+    if parallel_rate is not None:
+        print(f"- ParallelVecFabEnv(N={args.num_envs}, 进程={args.num_workers}): {parallel_rate:.0f} 步/秒 "
+              f"({parallel_rate / scalar_rate:.2f}x)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
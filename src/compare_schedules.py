@@ -0,0 +1,53 @@
+"""
+调度方案对比
+重放多个结果文件（main.py、训练器或求解器输出）的MoveList，并排列出主要指标；
+给出--task时另按各PM清洁策略与换片开关仿真内置调度，一并对比
+"""
+
+import argparse
+import json
+import os
+from environment.fab_environment import FabEnvironment, CLEANING_POLICIES
+from environment.replay import compare_schedules
+from environment.result_writer import load_results
+from config.task_config import task_name
+
+def engine_variants(task: str):
+    """按各PM清洁策略与换片开关仿真内置调度，返回{标签: MoveList}"""
+    schedules = {}
+    for cleaning in CLEANING_POLICIES:
+        for swap in ('on', 'off'):
+            env = FabEnvironment(task, history='off', cleaning=cleaning, swap=swap == 'on')
+            schedules[f"{task} cleaning={cleaning} swap={swap}"] = env.run_simulation()['MoveList']
+    return schedules
+
+def main():
+    parser = argparse.ArgumentParser(description='调度方案指标对比')
+    parser.add_argument('results', nargs='*',
+                       help='结果文件 (json或ndjson)')
+    parser.add_argument('--task', type=task_name, default=None,
+                       help='同时按清洁策略off/naive/opportunistic与换片on/off仿真该任务的内置调度 (a-d或gen:生成任务)')
+    parser.add_argument('--output', type=str, default=None,
+                       help='把全部指标写入的JSON文件')
+    
+    args = parser.parse_args()
+    if not args.results and args.task is None:
+        parser.error('需要结果文件或--task')
+    
+    schedules = {os.path.basename(filename): load_results(filename)['MoveList'] for filename in args.results}
+    if args.task is not None:
+        schedules.update(engine_variants(args.task))
+    summaries = compare_schedules(schedules)
+    
+    print(f"{'结果文件':<40}{'完工时间':>12}{'平均周期':>12}{'平均WIP':>10}{'最大WIP':>10}{'平均排队':>10}")
+    for label, summary in summaries.items():
+        print(f"{label:<40}{summary['Makespan']:>12.2f}{summary['CycleTime']['Mean']:>12.2f}"
+              f"{summary['WIP']['Mean']:>10.2f}{summary['WIP']['Max']:>10d}{summary['QueueTime']['Mean']:>10.2f}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+        print(f"指标已保存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -44,6 +44,11 @@ DOOR_PARAMS = {
     'close_time': 1.0
 }
 
+# 换片参数：双臂机械手持后继晶圆在PM前等待当前晶圆完工的最长时间
+SWAP_PARAMS = {
+    'max_wait': 120.0
+}
+
 # 清洁参数
 CLEAN_PARAMS = {
     'idle_threshold': 80.0,
@@ -3,6 +3,8 @@
 定义所有工艺路径和处理时间
 """
 
+import numpy as np
+
 # 工艺路径定义
 PROCESS_ROUTES = {
     'A': [11, 7, 8, 13, 14, 12, 7, 8, 13, 14, 12, 7, 8, 13, 14, 12],
@@ -47,16 +49,72 @@ FLEXIBLE_CHAMBERS = {
     'K': {1: [1, 2, 3, 4], 7: [7, 8], 9: [9, 10], 11: [11, 12]}
 }
 
+# 编译后的稠密查找表，按(工艺类型编号, 工艺步)索引
+# NumPy数组供批量计算使用，同内容的嵌套列表供单个查询使用（Python标量下标比NumPy更快）
+PROCESS_TYPE_IDS = {process_type: i for i, process_type in enumerate(sorted(PROCESS_ROUTES))}
+MAX_ROUTE_STEPS = max(len(route) for route in PROCESS_ROUTES.values())
+MAX_CHAMBER_ID = max(max(route) for route in PROCESS_ROUTES.values())
+
+
+def _compile_flexible_options(process_type, chamber_id):
+    """从柔性腔室定义中查找包含指定腔室的选项组"""
+    for options in FLEXIBLE_CHAMBERS.get(process_type, {}).values():
+        if chamber_id in options:
+            return list(options)
+    return [chamber_id]
+
+
+# 按(工艺类型编号, 腔室编号)的柔性选项与工艺时间
+CHAMBER_OPTION_LISTS = [[_compile_flexible_options(process_type, chamber_id)
+                         for chamber_id in range(MAX_CHAMBER_ID + 1)]
+                        for process_type in sorted(PROCESS_ROUTES)]
+CHAMBER_PROCESS_TIMES = [[PROCESS_TIMES.get(process_type, {}).get(chamber_id, 0)
+                          for chamber_id in range(MAX_CHAMBER_ID + 1)]
+                         for process_type in sorted(PROCESS_ROUTES)]
+
+ROUTE_LENGTH_TABLE = np.zeros(len(PROCESS_TYPE_IDS), dtype=np.int16)
+ROUTE_TABLE = np.zeros((len(PROCESS_TYPE_IDS), MAX_ROUTE_STEPS), dtype=np.int16)  # 0表示路径结束
+PROCESS_TIME_TABLE = np.zeros((len(PROCESS_TYPE_IDS), MAX_ROUTE_STEPS), dtype=np.float64)
+OPTION_MASK_TABLE = np.zeros((len(PROCESS_TYPE_IDS), MAX_ROUTE_STEPS), dtype=np.uint16)  # 腔室k对应第k-1位
+OPTION_COUNT_TABLE = np.zeros((len(PROCESS_TYPE_IDS), MAX_ROUTE_STEPS), dtype=np.int8)
+for _process_type, _type_id in PROCESS_TYPE_IDS.items():
+    ROUTE_LENGTH_TABLE[_type_id] = len(PROCESS_ROUTES[_process_type])
+    for _step, _chamber_id in enumerate(PROCESS_ROUTES[_process_type]):
+        _options = CHAMBER_OPTION_LISTS[_type_id][_chamber_id]
+        ROUTE_TABLE[_type_id, _step] = _chamber_id
+        PROCESS_TIME_TABLE[_type_id, _step] = CHAMBER_PROCESS_TIMES[_type_id][_chamber_id]
+        OPTION_MASK_TABLE[_type_id, _step] = sum(1 << (option - 1) for option in _options)
+        OPTION_COUNT_TABLE[_type_id, _step] = len(_options)
+
+# 按(工艺类型编号, 工艺步)的柔性选项、选项位掩码和工艺时间
+STEP_OPTION_LISTS = [[CHAMBER_OPTION_LISTS[type_id][chamber_id] for chamber_id in PROCESS_ROUTES[process_type]]
+                     for type_id, process_type in enumerate(sorted(PROCESS_ROUTES))]
+STEP_OPTION_MASKS = OPTION_MASK_TABLE.tolist()
+STEP_PROCESS_TIMES = PROCESS_TIME_TABLE.tolist()
+
+
 def get_flexible_options(process_type, chamber_id):
     """获取柔性腔室选项"""
-    if process_type in FLEXIBLE_CHAMBERS:
-        for key, options in FLEXIBLE_CHAMBERS[process_type].items():
-            if chamber_id in options:
-                return options
+    type_id = PROCESS_TYPE_IDS.get(process_type)
+    if type_id is not None and 0 <= chamber_id <= MAX_CHAMBER_ID:
+        return CHAMBER_OPTION_LISTS[type_id][chamber_id]
     return [chamber_id]
 
 def get_process_time(process_type, chamber_id):
     """获取工艺处理时间"""
-    if process_type in PROCESS_TIMES:
-        return PROCESS_TIMES[process_type].get(chamber_id, 0)
-    return 0
\ No newline at end of file
+    type_id = PROCESS_TYPE_IDS.get(process_type)
+    if type_id is not None and 0 <= chamber_id <= MAX_CHAMBER_ID:
+        return CHAMBER_PROCESS_TIMES[type_id][chamber_id]
+    return 0
+
+def get_step_options(type_id, step):
+    """获取指定工艺类型编号与工艺步的柔性腔室选项"""
+    return STEP_OPTION_LISTS[type_id][step]
+
+def get_step_option_mask(type_id, step):
+    """获取指定工艺类型编号与工艺步的柔性腔室位掩码"""
+    return STEP_OPTION_MASKS[type_id][step]
+
+def get_step_process_time(type_id, step):
+    """获取指定工艺类型编号与工艺步的工艺时间"""
+    return STEP_PROCESS_TIMES[type_id][step]
\ No newline at end of file
@@ -3,6 +3,10 @@
 定义所有晶圆任务分配
 """
 
+import random
+import re
+from functools import lru_cache
+
 # 任务a: 75片晶圆全部执行工艺A
 TASK_A = []
 for lot in range(1, 4):  # 1.x, 2.x, 3.x
@@ -112,10 +116,94 @@ TASKS = {
     'd': TASK_D
 }
 
+# 生成任务的名称前缀，如 gen:lots=400,size=25,mix=A:2/B:1,seed=7
+GENERATED_TASK_PREFIX = 'gen:'
+
+def generate_task(lots=3, lot_size=25, mix=None, seed=0):
+    """按参数生成晶圆任务
+    
+    lots为批次数；lot_size为每批片数，或(最少, 最多)片数范围，按种子随机抽取；
+    mix为工艺类型到权重的字典，默认PROCESS_ROUTES中全部工艺等权。
+    每片晶圆的工艺按权重独立抽取，批内同工艺晶圆编号连续（与任务d的分段方式一致）。
+    相同参数与种子生成的任务完全相同。
+    """
+    from .process_config import PROCESS_ROUTES
+    if mix is None:
+        mix = {process_type: 1.0 for process_type in sorted(PROCESS_ROUTES)}
+    unknown = [process_type for process_type in mix if process_type not in PROCESS_ROUTES]
+    if unknown:
+        raise ValueError(f"未知的工艺类型: {unknown}")
+    if isinstance(lot_size, int):
+        lot_size = (lot_size, lot_size)
+    if lots < 1 or lot_size[0] < 1 or lot_size[0] > lot_size[1]:
+        raise ValueError(f"无效的批次参数: lots={lots}, lot_size={lot_size}")
+    
+    rng = random.Random(seed)
+    process_types = list(mix)
+    weights = [mix[process_type] for process_type in process_types]
+    order = {process_type: i for i, process_type in enumerate(process_types)}
+    wafers = []
+    for lot in range(1, lots + 1):
+        size = rng.randint(*lot_size)
+        lot_types = sorted(rng.choices(process_types, weights, k=size), key=order.get)
+        for wafer, process_type in enumerate(lot_types, 1):
+            wafers.append({
+                'wafer_id': f"{lot}.{wafer}",
+                'process_type': process_type,
+                'lot_id': lot,
+                'wafer_num': wafer
+            })
+    return wafers
+
+def parse_task_spec(spec):
+    """解析生成任务名称，返回generate_task的参数
+    
+    格式为 gen:key=value,...，可用的键为 lots、size（片数或 最少-最多）、
+    mix（工艺:权重 以/分隔，权重省略为1）、seed。
+    """
+    params = {}
+    body = spec[len(GENERATED_TASK_PREFIX):]
+    for item in filter(None, body.split(',')):
+        key, _, value = item.partition('=')
+        if key == 'lots':
+            params['lots'] = int(value)
+        elif key == 'size':
+            low, _, high = value.partition('-')
+            params['lot_size'] = (int(low), int(high or low))
+        elif key == 'mix':
+            mix = {}
+            for part in value.split('/'):
+                process_type, _, weight = part.partition(':')
+                mix[process_type.upper()] = float(weight or 1)
+            params['mix'] = mix
+        elif key == 'seed':
+            params['seed'] = int(value)
+        else:
+            raise ValueError(f"未知的任务生成参数: {key}")
+    return params
+
+@lru_cache(maxsize=16)
+def _generated_task(spec):
+    """按名称生成任务并缓存，缓存为不可变的(键, 值)元组，避免调用方修改配置影响之后的环境实例"""
+    return tuple(tuple(wafer.items()) for wafer in generate_task(**parse_task_spec(spec)))
+
 def get_task_wafers(task_name):
-    """获取指定任务的晶圆列表"""
+    """获取指定任务的晶圆列表，gen:开头的名称按参数生成"""
+    if task_name.startswith(GENERATED_TASK_PREFIX):
+        return [dict(items) for items in _generated_task(task_name)]
     return TASKS.get(task_name.lower(), [])
 
+def task_name(value):
+    """校验任务名称（a-d或gen:参数），用作命令行参数类型"""
+    if not value.startswith(GENERATED_TASK_PREFIX) and value.lower() not in TASKS:
+        raise ValueError(f"未知的任务: {value}")
+    get_task_wafers(value)
+    return value
+
+def task_label(name):
+    """任务名称转为可用于文件名的标签"""
+    return re.sub(r'[^0-9A-Za-z.-]+', '_', name).strip('_')
+
 def get_wafer_process_route(wafer_info):
     """获取晶圆的工艺路径"""
     from .process_config import PROCESS_ROUTES
@@ -0,0 +1,154 @@
+"""
+设备拓扑编译
+由各传输模块（TM）的布局编译出位置查找表、臂移动时间表和模块间全源最短搬运时间矩阵
+"""
+
+import numpy as np
+from typing import Dict, List, Optional
+
+from .equipment_config import TM1_PARAMS, TM23_PARAMS, TM2_LAYOUT, TM3_LAYOUT
+
+# 默认布局：TM1在LoadPort与LLA/LLB之间直线往返，TM2/TM3为正八边形，经LLA/LLB、LLC/LLD交接
+DEFAULT_LAYOUT = {
+    'transfer_modules': {
+        'TM1': {
+            'kind': 'linear',
+            'move_time': TM1_PARAMS['move_time'],
+            'pick_time': TM1_PARAMS['pick_time'],
+            'place_time': TM1_PARAMS['place_time'],
+            'modules': ['LoadPort1', 'LoadPort2', 'LoadPort3', 'LLA', 'LLB'],
+        },
+        'TM2': {
+            'kind': 'ring',
+            'positions': 8,
+            'step_time': TM23_PARAMS['move_time_adjacent'],
+            'pick_time': TM23_PARAMS['pick_time_single'],
+            'place_time': TM23_PARAMS['place_time_single'],
+            'modules': dict(TM2_LAYOUT),
+        },
+        'TM3': {
+            'kind': 'ring',
+            'positions': 8,
+            'step_time': TM23_PARAMS['move_time_adjacent'],
+            'pick_time': TM23_PARAMS['pick_time_single'],
+            'place_time': TM23_PARAMS['place_time_single'],
+            'modules': dict(TM3_LAYOUT),
+        },
+    }
+}
+
+
+class Topology:
+    """编译后的设备拓扑
+    
+    move_times[tm]为该TM各位置之间的臂移动时间表，position_modules[tm]为位置到模块名的查找表。
+    transfer_times[i, j]为一片晶圆从模块i送到模块j的最短时间（取片、旋转、放片，跨TM时经
+    两侧共有的LoadLock交接），不含臂从当前位置赶到模块i的时间；不可达为inf。
+    """
+    
+    def __init__(self, layout: Dict):
+        self.layout = layout
+        self.positions: Dict[str, Dict[str, int]] = {}
+        self.position_modules: Dict[str, List[Optional[str]]] = {}
+        self.move_times: Dict[str, np.ndarray] = {}
+        self.pick_times: Dict[str, float] = {}
+        self.place_times: Dict[str, float] = {}
+        
+        modules = []
+        for tm, spec in layout['transfer_modules'].items():
+            positions = spec['modules']
+            if not isinstance(positions, dict):
+                positions = {module: position for position, module in enumerate(positions)}
+            num_positions = max(spec.get('positions', 0), max(positions.values()) + 1)
+            position_modules = [None] * num_positions
+            # 按位置顺序登记模块，模块编号与布局文件中的键顺序无关
+            positions = dict(sorted(positions.items(), key=lambda item: item[1]))
+            for module, position in positions.items():
+                position_modules[position] = module
+                if module not in modules:
+                    modules.append(module)
+            
+            index = np.arange(num_positions)
+            if spec['kind'] == 'ring':
+                distance = np.abs(index[:, None] - index[None, :])
+                move_times = np.minimum(distance, num_positions - distance) * spec['step_time']
+            elif spec['kind'] == 'linear':
+                move_times = np.where(index[:, None] == index[None, :], 0.0, spec['move_time'])
+            else:
+                raise ValueError(f"未知的传输模块类型: {spec['kind']}")
+            
+            self.positions[tm] = positions
+            self.position_modules[tm] = position_modules
+            self.move_times[tm] = move_times.astype(np.float64)
+            self.pick_times[tm] = float(spec['pick_time'])
+            self.place_times[tm] = float(spec['place_time'])
+        
+        self.modules = modules
+        self.module_index = {module: i for i, module in enumerate(modules)}
+        self._compile_transfers()
+    
+    def _compile_transfers(self):
+        """单TM直达搬运作为边，Floyd-Warshall求全源最短搬运时间及路径"""
+        size = len(self.modules)
+        transfer_times = np.full((size, size), np.inf)
+        direct_tm = np.full((size, size), -1, dtype=np.int8)
+        self.transfer_modules = list(self.positions)
+        for tm_code, tm in enumerate(self.transfer_modules):
+            rows = np.array([self.module_index[module] for module in self.positions[tm]])
+            positions = np.array(list(self.positions[tm].values()))
+            times = (self.pick_times[tm] + self.place_times[tm]
+                     + self.move_times[tm][positions[:, None], positions[None, :]])
+            better = times < transfer_times[rows[:, None], rows[None, :]]
+            transfer_times[rows[:, None], rows[None, :]] = np.where(
+                better, times, transfer_times[rows[:, None], rows[None, :]])
+            direct_tm[rows[:, None], rows[None, :]] = np.where(better, tm_code, direct_tm[rows[:, None], rows[None, :]])
+        np.fill_diagonal(transfer_times, 0.0)
+        
+        # next_hop[i, j]为从i送往j时第一段直达搬运的终点
+        next_hop = np.where(np.isfinite(transfer_times), np.arange(size)[None, :], -1)
+        for k in range(size):
+            through = transfer_times[:, k, None] + transfer_times[None, k, :]
+            better = through < transfer_times
+            transfer_times = np.where(better, through, transfer_times)
+            next_hop = np.where(better, next_hop[:, k, None], next_hop)
+        
+        self.transfer_times = transfer_times
+        self.direct_tm = direct_tm
+        self.next_hop = next_hop
+    
+    def move_time(self, tm: str, from_position: int, to_position: int) -> float:
+        """TM臂在两个位置之间的移动时间"""
+        return self.move_times[tm].item(from_position, to_position)
+    
+    def module_at(self, tm: str, position: int) -> Optional[str]:
+        """TM指定位置上的模块名"""
+        position_modules = self.position_modules[tm]
+        return position_modules[position] if 0 <= position < len(position_modules) else None
+    
+    def transfer_time(self, source: str, target: str) -> float:
+        """晶圆从source送到target的最短搬运时间"""
+        return self.transfer_times.item(self.module_index[source], self.module_index[target])
+    
+    def transfer_path(self, source: str, target: str) -> List[tuple]:
+        """最短搬运路径，每段为(TM, 起点模块, 终点模块)，不可达时为空"""
+        i, j = self.module_index[source], self.module_index[target]
+        path = []
+        while i != j:
+            hop = self.next_hop.item(i, j)
+            if hop < 0:
+                return []
+            path.append((self.transfer_modules[self.direct_tm.item(i, hop)], self.modules[i], self.modules[hop]))
+            i = hop
+        return path
+
+
+def load_topology(path: Optional[str] = None) -> Topology:
+    """编译拓扑，path为YAML布局文件，省略时使用默认布局"""
+    if path is None:
+        return DEFAULT_TOPOLOGY
+    import yaml
+    with open(path, 'r', encoding='utf-8') as f:
+        return Topology(yaml.safe_load(f))
+
+
+DEFAULT_TOPOLOGY = Topology(DEFAULT_LAYOUT)
\ No newline at end of file
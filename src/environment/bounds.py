@@ -0,0 +1,167 @@
+"""
+完工时间下界
+由单片最短路径、柔性腔室组的工作量、各TM的搬运工作量与LoadLock抽充气占用推出整个任务完工时间的下界，
+用于评价调度结果与最优解的差距
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+from config.equipment_config import DOOR_PARAMS, CLEAN_PARAMS
+from config.process_config import PROCESS_TIME_TABLE
+
+BOUND_COMPONENTS = ('Route', 'Chamber', 'LoadLock', 'Robot')
+
+
+def optimality_gap(makespan: float, bound: float) -> float:
+    """完工时间相对下界的差距，0表示已证明最优"""
+    return (makespan - bound) / bound if bound > 0 else 0.0
+
+
+class RouteTable:
+    """一种(工艺类型, LoadPort)的路径在最优选择下的各段时间
+    
+    路径为LoadPort、各步可选腔室、LoadPort，第s段搬运把晶圆送入第s步的腔室（最后一段送回LoadPort）。
+    对相邻两段的每种腔室选择做动态规划：forward[s][(a, b)]为从出发到第s段放片结束的最短时间，
+    backward[s][(a, b)]为从第s段取片开始到回到LoadPort的最短时间。腔室内的时间为关门、工艺，
+    以及LoadLock放片侧与取片侧气氛不同时的抽充气；开门与机械臂转动同时进行，不计入。
+    """
+    
+    def __init__(self, env, type_id: int, loadport: str):
+        topology = env.topology
+        modules = [[loadport], *env._step_option_names[type_id], [loadport]]
+        self.hops = [[(a, b) for a in sources for b in targets] for sources, targets in zip(modules, modules[1:])]
+        self.hop_tm, self.hop_time = {}, {}
+        for pairs in self.hops:
+            for a, b in pairs:
+                code = topology.direct_tm.item(topology.module_index[a], topology.module_index[b])
+                if code < 0:
+                    continue
+                tm = topology.transfer_modules[code]
+                positions = topology.positions[tm]
+                self.hop_tm[a, b] = tm
+                self.hop_time[a, b] = topology.pick_times[tm] + topology.place_times[tm] \
+                    + topology.move_time(tm, positions[a], positions[b])
+        self.hops = [[pair for pair in pairs if pair in self.hop_tm] for pairs in self.hops]
+        self.env, self.type_id = env, type_id
+        
+        self.forward = [{pair: self.hop_time[pair] for pair in self.hops[0]}]
+        for step, pairs in enumerate(self.hops[1:]):
+            previous = self.forward[-1]
+            self.forward.append({(b, c): min((time + self.stay(step, a, b, c) for (a, head), time in previous.items()
+                                              if head == b), default=math.inf) + self.hop_time[b, c]
+                                 for b, c in pairs})
+        self.backward = [None] * len(self.hops)
+        self.backward[-1] = {pair: self.hop_time[pair] for pair in self.hops[-1]}
+        for step in range(len(self.hops) - 2, -1, -1):
+            following = self.backward[step + 1]
+            self.backward[step] = {(a, b): self.hop_time[a, b] + min(
+                (self.stay(step, a, b, c) + time for (head, c), time in following.items() if head == b),
+                default=math.inf) for a, b in self.hops[step]}
+        self.length = min(self.forward[-1].values(), default=math.inf)
+    
+    def stay(self, step: int, source: str, chamber: str, target: str) -> float:
+        """晶圆在第step步腔室内从放片结束到可以取片的最短时间"""
+        chamber_obj = self.env.chambers[chamber]
+        time = DOOR_PARAMS['close_time'] + PROCESS_TIME_TABLE.item(self.type_id, step)
+        place_vacuum = self.hop_tm[source, chamber] != 'TM1'
+        pick_vacuum = self.hop_tm[chamber, target] != 'TM1'
+        if place_vacuum != pick_vacuum and getattr(chamber_obj, 'can_pump_vent', False):
+            time += chamber_obj.pump_time if pick_vacuum else chamber_obj.vent_time
+        return time
+    
+    def visits(self) -> List[Tuple[List[str], float, float, float]]:
+        """各步腔室的(可选腔室, 开始占用前的最短时间, 最少占用时间, 取走后到完工的最短时间)
+        
+        占用从放片开始到取片结束；换片时前后两片共用一次开门，因此不计开门时间。
+        """
+        topology = self.env.topology
+        result = []
+        for step, (entering, leaving) in enumerate(zip(self.hops, self.hops[1:])):
+            head = min((self.forward[step][pair] - topology.place_times[self.hop_tm[pair]] for pair in entering),
+                       default=math.inf)
+            occupation = min((topology.place_times[self.hop_tm[a, b]] + self.stay(step, a, b, c)
+                              + topology.pick_times[self.hop_tm[b, c]]
+                              for a, b in entering for head_module, c in leaving if head_module == b),
+                             default=math.inf)
+            tail = min((self.backward[step + 1][pair] - topology.pick_times[self.hop_tm[pair]] for pair in leaving),
+                       default=math.inf)
+            result.append((sorted({b for _, b in entering}), head, occupation, tail))
+        return result
+    
+    def transfers(self) -> List[Tuple[Optional[str], float, float, float]]:
+        """各段搬运的(TM, 开始前的最短时间, 最少作业时间, 结束后到完工的最短时间)，可选腔室分属不同TM时TM为None"""
+        result = []
+        for step, pairs in enumerate(self.hops):
+            tms = {self.hop_tm[pair] for pair in pairs}
+            work = min(self.hop_time[pair] for pair in pairs)
+            head = min(self.forward[step][pair] - self.hop_time[pair] for pair in pairs)
+            tail = min(self.backward[step][pair] - self.hop_time[pair] for pair in pairs)
+            result.append((tms.pop() if len(tms) == 1 else None, head, work, tail))
+        return result
+
+
+def makespan_lower_bound(env) -> Dict:
+    """整个任务从时刻0开始的完工时间下界
+    
+    取以下各项的最大值，各项都忽略其它资源的冲突，因此都是完工时间的下界：
+    Route为单片晶圆在最优腔室选择下无等待走完路径的时间；
+    Chamber与LoadLock为每个柔性腔室组（某一步的可选腔室集合）的工作量平均分到组内各腔室，
+    只计可选腔室全在组内的步，加上最早开始占用前与最后取走后的最短时间，PM组另计处理满片数必需的清洁，
+    LoadLock的占用含放片侧与取片侧气氛不同时的抽充气；
+    Robot为每个TM的取放与转动工作量平均分到各手臂，同样加上首尾的最短时间。
+    返回下界、各项的值与各项取到最大值的资源。
+    """
+    tables = {}
+    for wafer in env.wafers:
+        key = wafer.process_type_id, env.get_loadport_name(wafer)
+        if key not in tables:
+            tables[key] = [RouteTable(env, *key), 0]
+        tables[key][1] += 1
+    
+    visits, transfers = [], {}  # [(可选腔室, 开始前, 占用, 取走后, 片数)]，TM -> [(开始前, 作业, 结束后, 片数)]
+    route = 0.0
+    for table, count in tables.values():
+        route = max(route, table.length)
+        visits.extend((*visit, count) for visit in table.visits())
+        for tm, head, work, tail in table.transfers():
+            if tm is not None:
+                transfers.setdefault(tm, []).append((head, work, tail, count))
+    
+    components = {'Route': (route, 'Route')}
+    for group in {tuple(options) for options, *_ in visits}:
+        items = [visit[1:] for visit in visits if set(visit[0]) <= set(group)]
+        load = sum(occupation * count for _, occupation, _, count in items)
+        if env.cleaning != 'off' and all(name.startswith('PM') for name in group):
+            # 每个PM处理满片数后须清洁，组内至少需要 ceil(片数/上限) - 腔室数 次
+            wafers = sum(count for *_, count in items)
+            cleans = max(0, math.ceil(wafers / CLEAN_PARAMS['wafer_count_threshold']) - len(group))
+            load += cleans * CLEAN_PARAMS['wafer_count_clean_time']
+        bound = min(head for head, *_ in items) + load / len(group) + min(tail for _, _, tail, _ in items)
+        kind = 'Chamber' if all(name.startswith('PM') for name in group) else 'LoadLock'
+        if bound > components.get(kind, (0.0, None))[0]:
+            components[kind] = (bound, '/'.join(group))
+    for tm, items in transfers.items():
+        capacity = sum(1 for arm in env.robot_arms.values() if arm.arm_type == tm)
+        load = sum(work * count for _, work, _, count in items)
+        bound = min(head for head, *_ in items) + load / capacity + min(tail for *_, tail, _ in items)
+        if bound > components.get('Robot', (0.0, None))[0]:
+            components['Robot'] = (bound, tm)
+    
+    name = max(components, key=lambda kind: components[kind][0])
+    return {
+        'LowerBound': float(components[name][0]),
+        'Components': {kind: float(components[kind][0]) for kind in BOUND_COMPONENTS if kind in components},
+        'Bottleneck': components[name][1],
+    }
+
+
+def bound_report(env, makespan: float) -> Dict:
+    """结果文件中的下界与差距字段"""
+    bound = makespan_lower_bound(env)
+    return {
+        'LowerBound': bound['LowerBound'],
+        'OptimalityGap': optimality_gap(makespan, bound['LowerBound']),
+        'BoundComponents': bound['Components'],
+        'Bottleneck': bound['Bottleneck'],
+    }
\ No newline at end of file
@@ -6,11 +6,31 @@
 import numpy as np
 from typing import Optional, List, Dict
 from config.equipment_config import CLEAN_PARAMS, LOADLOCK_PARAMS, DOOR_PARAMS
+from .history import DEFAULT_HISTORY_POLICY, create_history
+from .fab_state import FabState, StateColumn, CodeColumn, WaferColumn, CHAMBER_STATUS_CODES, PROCESS_TYPE_CODES
 
 class Chamber:
-    """腔室智能体基类"""
+    """腔室智能体基类
+    
+    动态状态存放在FabState的腔室列中，以下属性为所在行的视图
+    """
+    
+    chamber_id = StateColumn('chamber_id')
+    status = CodeColumn('chamber_status', CHAMBER_STATUS_CODES)
+    current_wafer = WaferColumn('chamber_wafer')
+    is_occupied = StateColumn('chamber_occupied')
+    needs_cleaning = StateColumn('chamber_needs_cleaning')
+    door_open = StateColumn('chamber_door_open')
+    wafer_count = StateColumn('chamber_wafer_count')
+    last_process_type = CodeColumn('chamber_last_type', PROCESS_TYPE_CODES)
+    last_activity_time = StateColumn('chamber_last_activity_time')
+    process_start_time = StateColumn('chamber_process_start_time')
+    process_end_time = StateColumn('chamber_process_end_time')
     
     def __init__(self, chamber_id: int, chamber_name: str):
+        # 独立的单行存储，环境构建后迁入共享存储
+        self._state, self._row = FabState(num_chambers=1), 0
+        
         self.chamber_id = chamber_id
         self.chamber_name = chamber_name
         
@@ -33,12 +53,31 @@ class Chamber:
         self.door_open = False
         
         # 历史记录
-        self.processing_history = []
+        self.set_history_policy(DEFAULT_HISTORY_POLICY)
         
+        # 空闲腔室位掩码，由环境注册
+        self.free_mask = None
+    
+    def set_history_policy(self, policy: str):
+        """设置历史记录策略：off、ring:N或full"""
+        self.processing_history = create_history(policy)
+        self.record_history = policy != 'off'
+    
+    def _sync_free_mask(self):
+        """状态变化后同步空闲腔室位掩码"""
+        if self.free_mask is not None:
+            self.free_mask.update(self)
+    
     def can_accept_wafer(self, wafer) -> bool:
         """检查是否可以接受晶圆"""
         return not self.is_occupied and self.status == 'idle'
     
+    def reserve(self, wafer):
+        """为即将放入的晶圆预约腔室"""
+        self.is_occupied = True
+        self.current_wafer = wafer
+        self._sync_free_mask()
+    
     def start_processing(self, wafer, current_time: float, process_time: float):
         """开始处理晶圆"""
         self.is_occupied = True
@@ -50,28 +89,36 @@ class Chamber:
         
         # 更新晶圆计数
         self.wafer_count += 1
+        self._sync_free_mask()
         
         # 记录历史
-        self.processing_history.append({
-            'wafer_id': wafer.wafer_id,
-            'start_time': current_time,
-            'end_time': self.process_end_time,
-            'process_type': wafer.process_type
-        })
+        if self.record_history:
+            self.processing_history.append({
+                'wafer_id': wafer.wafer_id,
+                'start_time': current_time,
+                'end_time': self.process_end_time,
+                'process_type': wafer.process_type
+            })
     
     def finish_processing(self, current_time: float):
-        """完成处理"""
+        """完成处理，晶圆留在腔室内等待取走"""
         if self.current_wafer:
             self.last_process_type = self.current_wafer.process_type
         
-        self.is_occupied = False
-        self.current_wafer = None
         self.status = 'idle'
         self.last_activity_time = current_time
+        self._sync_free_mask()
         
         # 检查是否需要清洁
         self.check_cleaning_requirements(current_time)
     
+    def release_wafer(self, current_time: float):
+        """晶圆被取走，腔室释放"""
+        self.is_occupied = False
+        self.current_wafer = None
+        self.last_activity_time = current_time
+        self._sync_free_mask()
+    
     def check_cleaning_requirements(self, current_time: float):
         """检查清洁需求"""
         # 晶圆计数清洁
@@ -86,7 +133,7 @@ class Chamber:
             return
     
     def start_cleaning(self, current_time: float, clean_type: str = 'idle'):
-        """开始清洁"""
+        """开始清洁，清洁后腔室恢复洁净：片数清零，下一片任意工艺均无需切换清洁"""
         self.status = 'cleaning'
         self.needs_cleaning = False
         
@@ -96,17 +143,20 @@ class Chamber:
             clean_time = CLEAN_PARAMS['process_switch_clean_time']
         elif clean_type == 'wafer_count':
             clean_time = CLEAN_PARAMS['wafer_count_clean_time']
-            self.wafer_count = 0  # 重置计数
         else:
             clean_time = CLEAN_PARAMS['idle_clean_time']
+        self.wafer_count = 0  # 重置计数
+        self.last_process_type = None
         
         self.process_start_time = current_time
         self.process_end_time = current_time + clean_time
+        self._sync_free_mask()
     
     def finish_cleaning(self, current_time: float):
         """完成清洁"""
         self.status = 'idle'
         self.last_activity_time = current_time
+        self._sync_free_mask()
     
     def open_door(self, current_time: float):
         """开门"""
@@ -114,6 +164,7 @@ class Chamber:
             self.status = 'door_opening'
             self.process_start_time = current_time
             self.process_end_time = current_time + DOOR_PARAMS['open_time']
+            self._sync_free_mask()
     
     def close_door(self, current_time: float):
         """关门"""
@@ -121,6 +172,7 @@ class Chamber:
             self.status = 'door_closing'
             self.process_start_time = current_time
             self.process_end_time = current_time + DOOR_PARAMS['close_time']
+            self._sync_free_mask()
     
     def finish_door_operation(self, current_time: float):
         """完成门操作"""
@@ -131,6 +183,7 @@ class Chamber:
         
         self.status = 'idle'
         self.last_activity_time = current_time
+        self._sync_free_mask()
     
     def is_process_complete(self, current_time: float) -> bool:
         """检查当前操作是否完成"""
@@ -172,6 +225,8 @@ class Chamber:
 class LoadLock(Chamber):
     """LoadLock特殊腔室类"""
     
+    is_vacuum = StateColumn('chamber_vacuum')
+    
     def __init__(self, chamber_id: int, chamber_name: str):
         super().__init__(chamber_id, chamber_name)
         self.is_vacuum = chamber_name in ['LLC', 'LLD']  # 固定真空
@@ -187,6 +242,7 @@ class LoadLock(Chamber):
             self.status = 'pumping'
             self.process_start_time = current_time
             self.process_end_time = current_time + self.pump_time
+            self._sync_free_mask()
     
     def start_vent(self, current_time: float):
         """开始充气"""
@@ -194,6 +250,7 @@ class LoadLock(Chamber):
             self.status = 'venting'
             self.process_start_time = current_time
             self.process_end_time = current_time + self.vent_time
+            self._sync_free_mask()
     
     def finish_pump_vent(self, current_time: float):
         """完成抽充气"""
@@ -203,4 +260,5 @@ class LoadLock(Chamber):
             self.is_vacuum = False
         
         self.status = 'idle'
-        self.last_activity_time = current_time
\ No newline at end of file
+        self.last_activity_time = current_time
+        self._sync_free_mask()
\ No newline at end of file
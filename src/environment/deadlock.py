@@ -0,0 +1,74 @@
+"""
+死锁检测
+在制晶圆的资源等待图：就绪晶圆等待下一步可选腔室的占用者，或等待超片约束下同步中编号更小的晶圆
+"""
+
+from typing import Dict, FrozenSet, List, Optional
+
+DEADLOCK_PENALTY = 10000.0  # 回合因死锁终止时扣除的奖励
+
+
+class DeadlockDetector:
+    """资源等待图上的增量死锁检测
+    
+    节点为在制晶圆。未就绪（工艺中、搬运中、抽充气中）或已完工待返回的晶圆还会产生事件，是活节点；
+    下一步可选腔室中有未被占用且不受超片约束阻挡的就绪晶圆也是活节点。
+    其余就绪晶圆等待各可选腔室的占用者，被超片约束挡住时等待同步中编号最小的待进入晶圆，
+    任一等待对象是活节点即还能推进。
+    
+    死锁的最后一步总是某片晶圆转为就绪，因此只需在晶圆就绪时从该晶圆出发搜索可达子图并反向传播活性，
+    剩下互相等待的节点即死锁集合。
+    """
+    
+    def __init__(self, env):
+        self.env = env
+        self._lot_index = {(wafer.lot_id, wafer.wafer_num): i for i, wafer in enumerate(env.wafers)}
+    
+    def _waits(self, index: int, holders: Dict[str, int]) -> Optional[List[int]]:
+        """晶圆等待的晶圆索引，活节点返回None"""
+        env = self.env
+        wafer = env.wafers[index]
+        if index not in env._ready or wafer.is_completed():
+            return None
+        waits = []
+        options = env._step_option_names[env._wafer_type_column.item(index)][env._wafer_step_column.item(index)]
+        for name in options:
+            holder = holders.get(name)
+            if holder is not None:
+                waits.append(holder)
+            elif env.check_overtaking_constraint(wafer, env.chambers[name]):
+                return None
+            else:
+                predecessor = self._lot_index.get((wafer.lot_id, env._overtaking_index.lowest_pending(wafer)))
+                if predecessor is None or predecessor not in env._committed:
+                    return None
+                waits.append(predecessor)
+        return waits
+    
+    def check(self, start: int) -> FrozenSet[int]:
+        """从晶圆start出发检测死锁，返回死锁晶圆索引集合，无死锁时为空"""
+        env = self.env
+        holders = {name: index for index, name in env._committed.items()}
+        waits = {}
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            if index in waits:
+                continue
+            waits[index] = self._waits(index, holders)
+            if waits[index] is None:
+                if index == start:
+                    return frozenset()
+                continue
+            stack.extend(waits[index])
+        
+        # 反向传播活性：等待对象中有活节点的晶圆也是活节点
+        live = {index for index, targets in waits.items() if targets is None}
+        changed = True
+        while changed:
+            changed = False
+            for index, targets in waits.items():
+                if index not in live and any(target in live for target in targets):
+                    live.add(index)
+                    changed = True
+        return frozenset(waits) - live
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+派发规则库
+决策时刻按规则决定候选晶圆的派发先后，并为每片晶圆在可立即送入的腔室中选择目标，
+各规则对每个候选晶圆、每个候选腔室只做常数次查表
+"""
+
+import numpy as np
+from typing import List, Union
+
+from config.process_config import PROCESS_TIME_TABLE, MAX_ROUTE_STEPS
+
+# 按(工艺类型编号, 工艺步)的剩余工艺时间（含该步），末尾多一列0对应已完成全部工艺
+REMAINING_WORK_TABLE = np.zeros((PROCESS_TIME_TABLE.shape[0], MAX_ROUTE_STEPS + 1))
+REMAINING_WORK_TABLE[:, :MAX_ROUTE_STEPS] = np.cumsum(PROCESS_TIME_TABLE[:, ::-1], axis=1)[:, ::-1]
+NEXT_PROCESS_TIME_TABLE = np.zeros((PROCESS_TIME_TABLE.shape[0], MAX_ROUTE_STEPS + 1))
+NEXT_PROCESS_TIME_TABLE[:, :MAX_ROUTE_STEPS] = PROCESS_TIME_TABLE
+
+
+class DispatchRule:
+    """派发规则基类，即按批次先后派发（FIFO-by-lot）
+    
+    wafer_key越小越先派发；select_chamber在非空的可送入腔室中选择目标，
+    默认优先选已处于放片一侧气氛、无需抽充气的LoadLock，其余按柔性选项顺序。
+    wafer_key依赖机械臂等随派发而变化的状态时置dynamic_key为True，每派发一片后重新排序其余候选。
+    """
+    
+    name = 'fifo'
+    dynamic_key = False
+    
+    def wafer_key(self, env, wafer):
+        """候选晶圆的派发先后"""
+        return wafer.lot_id, wafer.wafer_num
+    
+    def chamber_key(self, env, wafer, chamber):
+        """候选腔室的优先级，越小越优先"""
+        return env._conditioning(chamber, wafer.current_location in env.chambers) is not None
+    
+    def select_chamber(self, env, wafer, chambers: List):
+        """在可立即送入的腔室中选择目标"""
+        return min(chambers, key=lambda chamber: self.chamber_key(env, wafer, chamber))
+
+
+class ShortestProcessingTimeRule(DispatchRule):
+    """下一步工艺时间最短的晶圆先派发（SPT），完工待返回的晶圆工艺时间为0"""
+    
+    name = 'spt'
+    
+    def wafer_key(self, env, wafer):
+        return NEXT_PROCESS_TIME_TABLE.item(wafer.process_type_id, wafer.current_step), wafer.lot_id, wafer.wafer_num
+
+
+class LeastWorkRemainingRule(DispatchRule):
+    """剩余工艺时间最少的晶圆先派发，尽早腾出在制品位置"""
+    
+    name = 'lwr'
+    
+    def wafer_key(self, env, wafer):
+        return REMAINING_WORK_TABLE.item(wafer.process_type_id, wafer.current_step), wafer.lot_id, wafer.wafer_num
+
+
+class EarliestFinishRule(DispatchRule):
+    """柔性腔室中选预计最早完成本步的：搬运时间加上LoadLock需要的抽充气时间
+    
+    同一步的柔性腔室工艺时间相同，因此只比较晶圆到达并可开始工艺的时刻。
+    """
+    
+    name = 'eft'
+    
+    def chamber_key(self, env, wafer, chamber):
+        source = wafer.current_location
+        arrival = env.topology.transfer_time(source, chamber.chamber_name)
+        action = env._conditioning(chamber, source in env.chambers)
+        if action is not None:
+            arrival = max(arrival, chamber.pump_time if action == 'PUMP' else chamber.vent_time)
+        return arrival
+
+
+class LeastLoadedRule(DispatchRule):
+    """柔性PM中选负载最轻的：距上次清洁处理片数最少，其次空闲最久"""
+    
+    name = 'least_loaded'
+    
+    def chamber_key(self, env, wafer, chamber):
+        return super().chamber_key(env, wafer, chamber), chamber.wafer_count, chamber.last_activity_time
+
+
+class NearestArmRule(DispatchRule):
+    """空闲机械臂离晶圆最近的先派发，目标选离源模块转动最少的腔室"""
+    
+    name = 'nearest_arm'
+    dynamic_key = True
+    
+    def wafer_key(self, env, wafer):
+        source = wafer.current_location
+        approach = min((env.topology.move_time(arm.arm_type, arm.current_position,
+                                               env.topology.positions[arm.arm_type][source])
+                        for arm in env._arm_list
+                        if arm.can_perform_action() and source in env.topology.positions[arm.arm_type]),
+                       default=np.inf)
+        return approach, wafer.lot_id, wafer.wafer_num
+    
+    def chamber_key(self, env, wafer, chamber):
+        return env.topology.transfer_time(wafer.current_location, chamber.chamber_name)
+
+
+DISPATCH_RULES = {rule.name: rule for rule in (DispatchRule, ShortestProcessingTimeRule, LeastWorkRemainingRule,
+                                               EarliestFinishRule, LeastLoadedRule, NearestArmRule)}
+DEFAULT_DISPATCH_RULE = 'fifo'
+
+
+def get_dispatch_rule(policy: Union[str, DispatchRule]) -> DispatchRule:
+    """按名称创建派发规则，传入规则对象时原样返回"""
+    if isinstance(policy, DispatchRule):
+        return policy
+    if policy not in DISPATCH_RULES:
+        raise ValueError(f"未知的派发规则: {policy}")
+    return DISPATCH_RULES[policy]()
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+离散事件队列
+基于二叉堆按时间顺序弹出资源完成事件
+"""
+
+import heapq
+from typing import Any, List, Optional, Tuple
+
+# 事件类型
+EVENT_PICK_DONE = 'pick_done'        # 取片完成，源腔室释放
+EVENT_PLACE_DONE = 'place_done'      # 放片完成，机械臂空闲
+EVENT_PROCESS_DONE = 'process_done'  # 工艺完成，晶圆可被取走
+EVENT_SWAP_DONE = 'swap_done'        # 换片完成，后继晶圆放入PM，成品晶圆留在机械臂上
+EVENT_PUMP_VENT_DONE = 'pump_vent_done'  # LoadLock抽气或充气完成
+EVENT_CLEAN_DONE = 'clean_done'      # 腔室清洁完成
+
+
+class EventQueue:
+    """按时间排序的事件队列，同一时刻按入队顺序弹出"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str, Any]] = []
+        self._sequence = 0
+
+    def push(self, time: float, event_type: str, payload: Any = None):
+        """加入事件"""
+        heapq.heappush(self._heap, (time, self._sequence, event_type, payload))
+        self._sequence += 1
+
+    def pop(self) -> Tuple[float, str, Any]:
+        """弹出最早的事件"""
+        time, _, event_type, payload = heapq.heappop(self._heap)
+        return time, event_type, payload
+
+    def pop_due(self, time: float) -> List[Tuple[float, str, Any]]:
+        """弹出所有不晚于指定时刻的事件"""
+        events = []
+        while self._heap and self._heap[0][0] <= time:
+            events.append(self.pop())
+        return events
+
+    def peek_time(self) -> Optional[float]:
+        """查看下一个事件的时刻"""
+        if self._heap:
+            return self._heap[0][0]
+        return None
+
+    def clear(self):
+        """清空队列"""
+        self._heap.clear()
+        self._sequence = 0
+    
+    def snapshot(self) -> Tuple[List[Tuple[float, int, str, Any]], int]:
+        """导出队列状态，载荷须为不可变值"""
+        return list(self._heap), self._sequence
+    
+    def restore(self, state: Tuple[List[Tuple[float, int, str, Any]], int]):
+        """从快照恢复队列状态"""
+        heap, sequence = state
+        self._heap = list(heap)
+        self._sequence = sequence
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __bool__(self) -> bool:
+        return bool(self._heap)
\ No newline at end of file
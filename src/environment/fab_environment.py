@@ -4,48 +4,137 @@
 """
 
 import numpy as np
-from typing import Dict, List, Optional, Tuple
-import json
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from collections import deque
+from functools import partial
 
 from .wafer import Wafer
 from .chamber import Chamber, LoadLock
 from .robot_arm import TM1Arm, TM2Arm, TM3Arm
-from config.equipment_config import EQUIPMENT_MAPPING, EQUIPMENT_ID_TO_NAME, MOVE_TYPES
+from .overtaking_index import OvertakingIndex
+from .free_chamber_mask import FreeChamberMask
+from .deadlock import DeadlockDetector
+from .dispatch_rules import DispatchRule, DEFAULT_DISPATCH_RULE, get_dispatch_rule
+from .move_log import MoveLog
+from .result_writer import ResultWriter
+from .bounds import bound_report
+from .observation import ObservationBuilder
+from .history import DEFAULT_HISTORY_POLICY, parse_history_policy
+from .fab_state import FabState, CHAMBER_COLUMNS, ARM_COLUMNS, WAFER_STATUS_CODES
+from .event_queue import (EventQueue, EVENT_PICK_DONE, EVENT_PLACE_DONE, EVENT_PROCESS_DONE, EVENT_SWAP_DONE,
+                          EVENT_PUMP_VENT_DONE, EVENT_CLEAN_DONE)
+from config.equipment_config import (EQUIPMENT_MAPPING, EQUIPMENT_ID_TO_NAME, MOVE_TYPES, DOOR_PARAMS, SWAP_PARAMS,
+                                     CLEAN_PARAMS)
 from config.task_config import get_task_wafers
-from config.process_config import get_process_time
+from config.topology import DEFAULT_TOPOLOGY, Topology
+from config.process_config import (PROCESS_ROUTES, STEP_OPTION_LISTS, STEP_OPTION_MASKS, MAX_ROUTE_STEPS,
+                                   ROUTE_LENGTH_TABLE, OPTION_MASK_TABLE, PROCESS_TIME_TABLE, get_flexible_options)
+
+CLEANING_POLICIES = ('off', 'naive', 'opportunistic')
+DEFAULT_CLEANING_POLICY = 'opportunistic'
+
 
 class FabEnvironment:
-    """半导体制造环境"""
+    """半导体制造环境
+    
+    离散事件仿真：每个腔室、LoadLock和机械臂各自维护时间线，
+    取片、放片、工艺完成作为事件进入堆队列，step()只处理到期事件。
+    swap为True时，内置调度在后继晶圆没有空闲腔室可去时，由TM2/TM3双臂机械手与PM内的当前晶圆换片。
+    cleaning为PM清洁策略：off不建模清洁；naive在就绪晶圆只能等待需清洁的PM时才清洁；
+    opportunistic另在PM清空时提前完成即将到期的清洁，使清洁落在预测的空闲时段内，其间由柔性孪生腔室接片。
+    policy为内置调度的派发规则名（见dispatch_rules.DISPATCH_RULES）或DispatchRule对象。
+    """
     
-    def __init__(self, task_name: str):
+    def __init__(self, task_name: str, max_wip: Optional[int] = None,
+                 history: str = DEFAULT_HISTORY_POLICY, state: Optional[FabState] = None,
+                 topology: Optional[Topology] = None, swap: bool = True,
+                 cleaning: str = DEFAULT_CLEANING_POLICY, policy: Union[str, DispatchRule] = DEFAULT_DISPATCH_RULE):
+        parse_history_policy(history)
+        if cleaning not in CLEANING_POLICIES:
+            raise ValueError(f"未知的清洁策略: {cleaning}")
         self.task_name = task_name
+        self.history = history
+        self.swap = swap
+        self.cleaning = cleaning
+        self.policy = get_dispatch_rule(policy)
+        self.topology = topology if topology is not None else DEFAULT_TOPOLOGY
+        self._build(get_task_wafers(task_name), max_wip, state=state)
+    
+    def _build(self, wafer_configs: List[Dict], max_wip: Optional[int],
+               cycle_free_wip: Optional[int] = None, state: Optional[FabState] = None):
+        """根据晶圆配置构建对象图和仿真状态，state为外部提供的列式状态存储（如多副本共享列的视图）"""
         self.current_time = 0.0
         self.move_counter = 0
+        self.state_version = 0  # 派发、事件处理、恢复快照时递增，用于判断观测是否需要重建
+        self._observation_builder = None
+        self._wafer_configs = wafer_configs
         
         # 初始化所有智能体
-        self.wafers = self._initialize_wafers()
+        self.wafers = self._initialize_wafers(wafer_configs, state)
         self.chambers = self._initialize_chambers()
         self.robot_arms = self._initialize_robot_arms()
         
-        # 输出记录
-        self.move_list = []
+        # 输出记录，模块编号依次为腔室与机械臂，晶圆编号为wafers中的索引
+        self.move_log = MoveLog(list(self.chambers) + list(self.robot_arms),
+                                [wafer.wafer_id for wafer in self.wafers])
         
         # 约束检查
         self.constraint_violations = []
         
-    def _initialize_wafers(self) -> List[Wafer]:
-        """初始化晶圆智能体"""
-        wafer_configs = get_task_wafers(self.task_name)
-        wafers = []
+        # 事件驱动仿真状态
+        self.event_queue = EventQueue()
+        self.max_wip = max_wip if max_wip is not None else len(self.wafers)
+        self.wip = 0  # 已离开LoadPort但尚未返回的晶圆数
+        self.finished_count = 0
+        self._wafer_index = {wafer.wafer_id: i for i, wafer in enumerate(self.wafers)}
+        self._ready = set()  # 在腔室内等待取走的晶圆索引
+        self._committed = {}  # 在制晶圆索引 -> 已占用或已预约的腔室名
+        if cycle_free_wip is None:
+            cycle_free_wip = self._shortest_route_cycle() - 1
+        self._cycle_free_wip = cycle_free_wip
+        self._loadport_queues = self._build_loadport_queues()
+        self._arm_cache = {}
+        
+        # 事件载荷使用的整数索引
+        self._chamber_list = list(self.chambers.values())
+        self._chamber_index = {name: i for i, name in enumerate(self.chambers)}
+        # 按设备编号索引的腔室与按(工艺类型编号, 工艺步)索引的可选腔室名
+        self._chambers_by_id = [self.chambers.get(EQUIPMENT_ID_TO_NAME.get(equipment_id))
+                                for equipment_id in range(max(EQUIPMENT_ID_TO_NAME) + 1)]
+        self._step_option_names = [[[EQUIPMENT_ID_TO_NAME[option] for option in options] for options in route]
+                                   for route in STEP_OPTION_LISTS]
+        self._arm_list = list(self.robot_arms.values())
+        self._arm_index = {name: i for i, name in enumerate(self.robot_arms)}
         
-        for config in wafer_configs:
+        # 腔室与机械臂迁入列式状态存储，晶圆行号与wafers中的索引一致
+        self.state.adopt(CHAMBER_COLUMNS, self._chamber_list)
+        self.state.adopt(ARM_COLUMNS, self._arm_list)
+        self._wafer_step_column = self.state.columns['wafer_step']
+        self._wafer_type_column = self.state.columns['wafer_type']
+        self._overtaking_index = OvertakingIndex(self.wafers)
+        self._free_mask = FreeChamberMask(self._chamber_list)
+        self._deadlock_detector = DeadlockDetector(self)
+        self.deadlocked = frozenset()  # 互相等待、不再能推进的在制晶圆索引
+        
+        # 对象历史记录不属于仿真状态，不进入快照；训练时可关闭以免逐步增长
+        for obj in self.wafers + self._chamber_list + self._arm_list:
+            obj.set_history_policy(self.history)
+    
+    def _initialize_wafers(self, wafer_configs: List[Dict], state: Optional[FabState] = None) -> List[Wafer]:
+        """初始化晶圆智能体，晶圆直接创建在列式状态存储的对应行"""
+        self.state = state if state is not None else FabState(num_wafers=len(wafer_configs))
+        wafers = self.state.wafers
+        
+        for row, config in enumerate(wafer_configs):
             wafer = Wafer(
                 wafer_id=config['wafer_id'],
                 process_type=config['process_type'],
                 lot_id=config['lot_id'],
-                wafer_num=config['wafer_num']
+                wafer_num=config['wafer_num'],
+                state=self.state,
+                row=row
             )
+            wafer.current_location = self.get_loadport_name(wafer)
             wafers.append(wafer)
         
         return wafers
@@ -81,231 +170,1037 @@ class FabEnvironment:
         arms['TM3_R1'] = TM3Arm(1)
         arms['TM3_R2'] = TM3Arm(2)
         
+        for arm in arms.values():
+            arm.set_topology(self.topology)
         return arms
     
+    def _build_loadport_queues(self) -> Dict[str, deque]:
+        """按LoadPort建立出片队列：同一LoadPort上的批次依批次号先后出片，批内按晶圆编号先后出片
+        
+        每个LoadPort同一时刻只有队首一片可出片，批次数远多于LoadPort时候选晶圆数也不随批次数增长。
+        """
+        self._loadport_order = {}
+        order = sorted(range(len(self.wafers)),
+                       key=lambda i: (self.wafers[i].lot_id, self.wafers[i].wafer_num))
+        for index in order:
+            self._loadport_order.setdefault(self.get_loadport_name(self.wafers[index]), []).append(index)
+        return {loadport: deque(indices) for loadport, indices in self._loadport_order.items()}
+    
+    def _shortest_route_cycle(self) -> int:
+        """腔室有向图（工艺相邻步之间连边）中最短环的长度
+
+        死锁需要一组全被占满且互相等待的单槽腔室，其中必含一个环，
+        因此在制品数小于最短环长度时必不死锁。
+        """
+        edges = {}
+        for process_type in {wafer.process_type for wafer in self.wafers}:
+            route = PROCESS_ROUTES.get(process_type, [])
+            for current_id, next_id in zip(route, route[1:]):
+                for source in get_flexible_options(process_type, current_id):
+                    edges.setdefault(source, set()).update(
+                        get_flexible_options(process_type, next_id))
+
+        shortest = len(self.wafers) + 1
+        for start in edges:
+            frontier, seen, depth = [start], {start}, 0
+            while frontier and depth < shortest:
+                depth += 1
+                next_frontier = []
+                for node in frontier:
+                    for neighbor in edges.get(node, ()):
+                        if neighbor == start:
+                            shortest = min(shortest, depth)
+                        elif neighbor not in seen:
+                            seen.add(neighbor)
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+        return shortest
+
+    @staticmethod
+    def get_loadport_name(wafer: Wafer) -> str:
+        """获取晶圆所属批次的LoadPort"""
+        return f"LoadPort{(wafer.lot_id - 1) % 3 + 1}"
+    
     def get_available_chambers_for_wafer(self, wafer: Wafer) -> List[Chamber]:
         """获取晶圆可用的腔室列表"""
-        available = []
-        flexible_options = wafer.get_flexible_chamber_options()
+        chambers_by_id = self._chambers_by_id
+        return [chambers_by_id[chamber_id]
+                for chamber_id in FreeChamberMask.chamber_ids(self.get_available_chamber_mask(wafer))]
+    
+    def get_available_chamber_mask(self, wafer: Wafer) -> int:
+        """晶圆当前步可用腔室的位掩码：空闲腔室掩码与工艺步选项掩码相与"""
+        index = self._wafer_index[wafer.wafer_id]
+        step = self._wafer_step_column.item(index)
+        if step < len(wafer.process_route):
+            return self._free_mask.mask & STEP_OPTION_MASKS[self._wafer_type_column.item(index)][step]
+        return 0
+    
+    def get_available_chamber_masks(self, wafers: Optional[List[Wafer]] = None) -> np.ndarray:
+        """一次计算多片晶圆的可用腔室位掩码，已完成晶圆为0"""
+        rows = None if wafers is None else [self._wafer_index[wafer.wafer_id] for wafer in wafers]
+        return self._step_option_masks(rows) & np.uint16(self._free_mask.mask)
+    
+    def _step_option_masks(self, rows: Optional[List[int]] = None) -> np.ndarray:
+        """各晶圆当前工艺步的柔性选项位掩码，已完成晶圆为0"""
+        columns = self.state.columns
+        type_ids, steps = columns['wafer_type'], columns['wafer_step']
+        if rows is not None:
+            type_ids, steps = type_ids[rows], steps[rows]
+        in_route = steps < ROUTE_LENGTH_TABLE[type_ids]
+        option_masks = OPTION_MASK_TABLE[type_ids, np.minimum(steps, MAX_ROUTE_STEPS - 1)]
+        return np.where(in_route, option_masks, 0).astype(np.uint16)
+    
+    # 基于状态列的整厂查询
+    def count_waiting_wafers(self) -> int:
+        """处于等待状态且工艺未完成的晶圆数量"""
+        columns = self.state.columns
+        return int(np.count_nonzero((columns['wafer_status'] == WAFER_STATUS_CODES['waiting']) &
+                                    (columns['wafer_step'] < ROUTE_LENGTH_TABLE[columns['wafer_type']])))
+    
+    def count_wafers_for_chamber(self, chamber_id: int) -> int:
+        """当前工艺步可以进入指定腔室的未完工晶圆数量"""
+        return int(np.count_nonzero(self._step_option_masks() & np.uint16(1 << (chamber_id - 1))))
+    
+    def count_wafers_at(self, location: str) -> int:
+        """位于指定位置的晶圆数量"""
+        code = self.state.location_codes.get(location)
+        if code is None:
+            return 0
+        return int(np.count_nonzero(self.state.columns['wafer_location'] == code))
+    
+    def count_free_chambers(self) -> int:
+        """当前可接收晶圆的腔室数量"""
+        return bin(self._free_mask.mask).count('1')
+    
+    def get_available_arm(self, source_name: str, target_name: str) -> Optional[object]:
+        """获取能在源与目标之间搬运且当前空闲的机械臂"""
+        key = (source_name, target_name)
+        candidates = self._arm_cache.get(key)
+        if candidates is None:
+            candidates = [arm for arm in self.robot_arms.values()
+                          if source_name in arm.accessible_chambers
+                          and target_name in arm.accessible_chambers]
+            self._arm_cache[key] = candidates
         
-        for chamber_id in flexible_options:
-            chamber_name = EQUIPMENT_ID_TO_NAME.get(chamber_id)
-            if chamber_name and chamber_name in self.chambers:
-                chamber = self.chambers[chamber_name]
-                if chamber.can_accept_wafer(wafer):
-                    available.append(chamber)
+        for arm in candidates:
+            if arm.can_perform_action():
+                return arm
+        return None
+    
+    def get_swap_arm(self, source_name: str, chamber_name: str, target_name: str) -> Optional[object]:
+        """获取能在源模块、换片PM与下一目标之间作业且当前空闲的双臂机械手"""
+        key = (source_name, chamber_name, target_name)
+        candidates = self._arm_cache.get(key)
+        if candidates is None:
+            candidates = [arm for arm in self.robot_arms.values()
+                          if getattr(arm, 'can_hold_two_wafers', False)
+                          and all(name in arm.accessible_chambers for name in key)]
+            self._arm_cache[key] = candidates
         
-        return available
+        for arm in candidates:
+            if arm.can_perform_action():
+                return arm
+        return None
     
     def check_overtaking_constraint(self, wafer: Wafer, target_chamber: Chamber) -> bool:
         """检查超片约束：同一PM、同工艺步，不允许大编号晶圆先于小编号进入"""
         if not target_chamber.chamber_name.startswith('PM'):
             return True  # 非PM腔室不检查
         
-        current_target = wafer.get_current_target_chamber()
-        
-        # 检查同批次中编号更小的晶圆
-        for other_wafer in self.wafers:
-            if (other_wafer.lot_id == wafer.lot_id and 
-                other_wafer.wafer_num < wafer.wafer_num and
-                other_wafer.process_type == wafer.process_type and
-                other_wafer.get_current_target_chamber() == current_target and
-                other_wafer.current_step == wafer.current_step and
-                other_wafer.status != 'completed'):
-                
-                # 如果小编号晶圆还未进入相同步骤的腔室，则大编号不能进入
-                if other_wafer.current_location != target_chamber.chamber_name:
-                    return False
+        # 同批次同工艺同步中仍有编号更小的晶圆未进入时，大编号不能进入
+        return self._overtaking_index.is_first_pending(wafer)
+    
+    def _is_safe_state(self, committed: Dict[int, str], advanced: Tuple[int, ...] = ()) -> bool:
+        """银行家式安全性检查
+
+        单槽腔室下，若存在一个顺序使在制晶圆逐片独自走完剩余路径并返回LoadPort，
+        则该状态不会陷入死锁。advanced为按送入后工艺步检查的晶圆索引。
+        """
+        steps, type_ids = self._wafer_step_column, self._wafer_type_column
+        step_option_names = self._step_option_names
+        routes = {index: step_option_names[type_ids.item(index)][steps.item(index) + (index in advanced):]
+                  for index in committed}
+        free = set(self.chambers) - set(committed.values())
+        remaining = dict(committed)
+        progress = True
+        while remaining and progress:
+            progress = False
+            for index, chamber_name in list(remaining.items()):
+                location = chamber_name
+                available = set(free)
+                finished = True
+                for options in routes[index]:
+                    choice = next((name for name in options if name in available), None)
+                    if choice is None:
+                        finished = False
+                        break
+                    available.discard(choice)
+                    available.add(location)
+                    location = choice
+                if finished:
+                    free.add(chamber_name)
+                    del remaining[index]
+                    progress = True
+        return not remaining
+
+    def is_safe_move(self, wafer: Wafer, target_chamber: Chamber) -> bool:
+        """检查将晶圆送入目标腔室后系统是否仍可避免死锁"""
+        index = self._wafer_index[wafer.wafer_id]
+        committed = dict(self._committed)
+        committed[index] = target_chamber.chamber_name
+        if len(committed) <= self._cycle_free_wip:
+            return True
+
+        # 按送入后的工艺步检查
+        return self._is_safe_state(committed, advanced=(index,))
+    
+    def get_safe_chambers(self, wafer: Wafer) -> List[Chamber]:
+        """安全动作过滤：晶圆下一步的空闲腔室中送入后系统仍可避免死锁的"""
+        return [chamber for chamber in self.get_available_chambers_for_wafer(wafer)
+                if self.is_safe_move(wafer, chamber)]
+
+    def _swap_plan(self, wafer: Wafer, chamber: Chamber) -> Optional[Tuple[Chamber, object]]:
+        """检查晶圆能否与PM内的当前晶圆换片，可以时返回(当前晶圆的下一目标腔室, 机械臂)
         
-        return True
+        当前晶圆须已放入PM且尚未派发，并在最长等待时间内完工；两片晶圆均须满足超片约束，
+        换片后系统须仍然安全。
+        """
+        chamber_name = chamber.chamber_name
+        resident = chamber.current_wafer
+        if resident is None or resident is wafer or resident.current_location != chamber_name:
+            return None
+        resident_index = self._wafer_index[resident.wafer_id]
+        if self._committed.get(resident_index) != chamber_name or resident.is_completed():
+            return None
+        if (chamber.status == 'processing'
+                and chamber.process_end_time - self.current_time > SWAP_PARAMS['max_wait']):
+            return None
+        if not self.check_overtaking_constraint(wafer, chamber):
+            return None
+        if self.cleaning != 'off' and (chamber.wafer_count >= CLEAN_PARAMS['wafer_count_threshold']
+                                       or resident.process_type != wafer.process_type):
+            return None  # 换片之间来不及清洁
+        
+        index = self._wafer_index[wafer.wafer_id]
+        for target_chamber in self.get_available_chambers_for_wafer(resident):
+            if not self.check_overtaking_constraint(resident, target_chamber):
+                continue
+            if self.clean_required(target_chamber, resident) is not None:
+                continue
+            arm = self.get_swap_arm(wafer.current_location, chamber_name, target_chamber.chamber_name)
+            if arm is None:
+                continue
+            committed = dict(self._committed)
+            committed[index] = chamber_name
+            committed[resident_index] = target_chamber.chamber_name
+            if len(committed) > self._cycle_free_wip and not self._is_safe_state(
+                    committed, advanced=(index, resident_index)):
+                continue
+            return target_chamber, arm
+        return None
+    
+    def get_swap_options(self, wafer: Wafer) -> List[Tuple[Chamber, Chamber, object]]:
+        """就绪晶圆可换片进入的PM，每项为(PM, PM内晶圆的下一目标腔室, 机械臂)，按PM内晶圆完工先后排序"""
+        index = self._wafer_index[wafer.wafer_id]
+        if not self.swap or index not in self._ready or wafer.is_completed():
+            return []
+        
+        options = []
+        for chamber_name in self._step_option_names[self._wafer_type_column.item(index)][
+                self._wafer_step_column.item(index)]:
+            chamber = self.chambers[chamber_name]
+            if not chamber_name.startswith('PM') or not chamber.is_occupied:
+                continue
+            plan = self._swap_plan(wafer, chamber)
+            if plan is not None:
+                options.append((chamber, *plan))
+        options.sort(key=lambda option: option[0].process_end_time if option[0].status == 'processing' else 0.0)
+        return options
     
-    def execute_wafer_move(self, wafer: Wafer, target_chamber: Chamber, 
-                          robot_arm: object) -> List[Dict]:
-        """执行晶圆移动操作"""
-        moves = []
+    def get_observations(self) -> ObservationBuilder:
+        """当前状态下全部晶圆、腔室、机械臂的批量观测，状态变化后首次访问时整批重建"""
+        if self._observation_builder is None:
+            self._observation_builder = ObservationBuilder(self)
+        return self._observation_builder.refresh()
+    
+    @property
+    def move_list(self) -> List[Dict]:
+        """按记录顺序导出的MoveList"""
+        return self.move_log.to_dicts()
+    
+    def _record_move(self, start_time: float, end_time: float, move_type: str,
+                     module_name: str, index: int):
+        """追加一条移动记录"""
+        self.move_log.append(start_time, end_time, self.move_counter, MOVE_TYPES[move_type],
+                             self.move_log.module_codes[module_name], index)
+        self.move_counter += 1
+    
+    @staticmethod
+    def _conditioning(chamber: Chamber, vacuum: bool) -> Optional[str]:
+        """LoadLock切换到所需气氛的动作：抽气PUMP、充气VENT，无需切换或非LLA/LLB时为None"""
+        if not getattr(chamber, 'can_pump_vent', False) or chamber.is_vacuum == vacuum:
+            return None
+        return 'PUMP' if vacuum else 'VENT'
+    
+    def _start_conditioning(self, chamber: Chamber, action: str, time: float):
+        """LoadLock开始抽气或充气"""
+        if action == 'PUMP':
+            chamber.start_pump(time)
+        else:
+            chamber.start_vent(time)
+    
+    def _precondition(self, chamber: Chamber, robot_arm: object, index: int) -> float:
+        """放片前把LLA/LLB切换到放片机械臂一侧的气氛，返回可放片的最早时刻
+        
+        TM1在大气侧，TM2/TM3在真空侧。腔室此时为空并已预约，抽充气从派发时刻开始，
+        与机械臂赶到源模块、取片、旋转的时间重叠。
+        """
+        action = self._conditioning(chamber, robot_arm.arm_type != 'TM1')
+        if action is None:
+            return self.current_time
+        t = self.current_time
+        duration = chamber.pump_time if action == 'PUMP' else chamber.vent_time
+        self._record_move(t, t + duration, action, chamber.chamber_name, index)
+        self._start_conditioning(chamber, action, t)
+        self.event_queue.push(t + duration, EVENT_PUMP_VENT_DONE, (self._chamber_index[chamber.chamber_name], -1))
+        return t + duration
+    
+    def _postcondition(self, chamber: Chamber, wafer: Wafer, index: int, t: float, vacuum: bool) -> float:
+        """工艺完成后把LLA/LLB切换到晶圆下一次被取走一侧的气氛，返回晶圆就绪时刻
         
+        vacuum为放片后腔室的气氛。完工晶圆由TM1取回LoadPort，需要充气；其余晶圆由TM2取走，需要抽气。
+        工艺完成事件中开始切换，切换完成事件中晶圆才就绪。
+        """
+        if not getattr(chamber, 'can_pump_vent', False) or wafer.is_completed() != vacuum:
+            return t
+        action, duration = ('VENT', chamber.vent_time) if vacuum else ('PUMP', chamber.pump_time)
+        self._record_move(t, t + duration, action, chamber.chamber_name, index)
+        self.event_queue.push(t + duration, EVENT_PUMP_VENT_DONE, (self._chamber_index[chamber.chamber_name], index))
+        return t + duration
+    
+    def execute_wafer_move(self, wafer: Wafer, target_chamber: Optional[Chamber],
+                          robot_arm: object) -> int:
+        """执行晶圆移动操作
+        
+        从当前时刻起在机械臂和目标腔室的时间线上排定整段搬运，
+        并将取片完成、放片完成、工艺完成登记为事件。
+        target_chamber为None表示完工晶圆返回LoadPort。返回记录的移动条数。
+        """
         # 检查约束
-        if not self.check_overtaking_constraint(wafer, target_chamber):
+        if target_chamber is not None and not self.check_overtaking_constraint(wafer, target_chamber):
             self.constraint_violations.append({
                 'type': 'overtaking',
                 'wafer_id': wafer.wafer_id,
                 'chamber': target_chamber.chamber_name,
                 'time': self.current_time
             })
-            return moves
-        
-        # 1. 机械臂移动到晶圆位置
-        if wafer.current_location and wafer.current_location != robot_arm.arm_id:
-            # 计算移动时间和位置
-            move_time = 1.0  # 简化计算
-            moves.append({
-                'StartTime': self.current_time,
-                'EndTime': self.current_time + move_time,
-                'MoveID': self.move_counter,
-                'MoveType': MOVE_TYPES['TRANS'],
-                'ModuleName': robot_arm.arm_id,
-                'MatID': wafer.wafer_id,
-                'SlotID': 1
-            })
-            self.move_counter += 1
-            self.current_time += move_time
-        
-        # 2. 开门
-        if hasattr(target_chamber, 'door_open') and not target_chamber.door_open:
-            target_chamber.open_door(self.current_time)
-            door_time = 1.0
-            moves.append({
-                'StartTime': self.current_time,
-                'EndTime': self.current_time + door_time,
-                'MoveID': self.move_counter,
-                'MoveType': MOVE_TYPES['PREPARE'],
-                'ModuleName': target_chamber.chamber_name,
-                'MatID': wafer.wafer_id,
-                'SlotID': 1
-            })
-            self.move_counter += 1
-            self.current_time += door_time
+            return 0
+        
+        index = self._wafer_index[wafer.wafer_id]
+        first_move = len(self.move_log)
+        self.state_version += 1
+        source_name = wafer.current_location
+        source_chamber = self.chambers.get(source_name)
+        
+        if source_chamber is None:
+            # 从LoadPort出片
+            self._loadport_queues[source_name].popleft()
+            self.wip += 1
+            wafer.start_time = self.current_time
+        else:
+            self._ready.discard(index)
+        
+        # 工艺时间按路径上的名义腔室计算，柔性替代腔室沿用同一时间
+        process_time = 0.0
+        if target_chamber is not None:
+            process_time = float(wafer.get_step_processing_time())
+            target_chamber.reserve(wafer)
+            wafer.advance_step()
+            self._committed[index] = target_chamber.chamber_name
+            ready_time = self._precondition(target_chamber, robot_arm, index)
+        else:
+            self._committed.pop(index, None)
+        target_name = target_chamber.chamber_name if target_chamber else self.get_loadport_name(wafer)
+        
+        # 1. 机械臂从当前位置转到晶圆所在模块，移动时间查拓扑编译出的时间表
+        positions = self.topology.positions[robot_arm.arm_type]
+        move_times = self.topology.move_times[robot_arm.arm_type]
+        source_position, target_position = positions[source_name], positions[target_name]
+        t = self.current_time
+        move_time = move_times.item(robot_arm.current_position, source_position)
+        if move_time > 0:
+            self._record_move(t, t + move_time, 'TRANS', robot_arm.arm_id, index)
+            t += move_time
         
-        # 3. 取晶圆
-        robot_arm.start_pick(wafer, self.current_time)
+        # 2. 取晶圆
+        robot_arm.start_pick(wafer, t)
         pick_time = robot_arm.action_end_time - robot_arm.action_start_time
-        moves.append({
-            'StartTime': self.current_time,
-            'EndTime': self.current_time + pick_time,
-            'MoveID': self.move_counter,
-            'MoveType': MOVE_TYPES['PICK'],
-            'ModuleName': robot_arm.arm_id,
-            'MatID': wafer.wafer_id,
-            'SlotID': 1
-        })
-        self.move_counter += 1
-        self.current_time += pick_time
-        robot_arm.finish_pick(wafer, self.current_time)
-        
-        # 4. 移动到目标腔室
-        move_time = 1.0  # 简化计算
-        moves.append({
-            'StartTime': self.current_time,
-            'EndTime': self.current_time + move_time,
-            'MoveID': self.move_counter,
-            'MoveType': MOVE_TYPES['TRANS'],
-            'ModuleName': robot_arm.arm_id,
-            'MatID': wafer.wafer_id,
-            'SlotID': 1
-        })
-        self.move_counter += 1
-        self.current_time += move_time
+        self._record_move(t, t + pick_time, 'PICK', robot_arm.arm_id, index)
+        t += pick_time
+        source_code = self._chamber_index[source_name] if source_chamber else -1
+        arm_code = self._arm_index[robot_arm.arm_id]
+        self.event_queue.push(t, EVENT_PICK_DONE, (index, arm_code, source_code))
+        
+        # 3. 移动到目标腔室，机械臂在放片完成前一直被占用，此时即可登记其终点位置
+        move_time = move_times.item(source_position, target_position)
+        if move_time > 0:
+            self._record_move(t, t + move_time, 'TRANS', robot_arm.arm_id, index)
+            t += move_time
+        robot_arm.current_position = target_position
+        if target_chamber is not None:
+            # LoadLock抽充气未完成时在腔室前等待
+            t = max(t, ready_time)
+        
+        # 4. 开门（与机械臂移动重叠）
+        if target_chamber is not None:
+            door_time = DOOR_PARAMS['open_time']
+            self._record_move(t - door_time, t, 'PREPARE', target_chamber.chamber_name, index)
         
         # 5. 放晶圆
-        robot_arm.start_place(self.current_time)
-        place_time = robot_arm.action_end_time - robot_arm.action_start_time
-        moves.append({
-            'StartTime': self.current_time,
-            'EndTime': self.current_time + place_time,
-            'MoveID': self.move_counter,
-            'MoveType': MOVE_TYPES['PLACE'],
-            'ModuleName': robot_arm.arm_id,
-            'MatID': wafer.wafer_id,
-            'SlotID': 1
-        })
-        self.move_counter += 1
-        self.current_time += place_time
-        robot_arm.finish_place(target_chamber, self.current_time)
+        place_time = robot_arm.get_place_time()
+        self._record_move(t, t + place_time, 'PLACE', robot_arm.arm_id, index)
+        t += place_time
+        target_code = self._chamber_index[target_name] if target_chamber else -1
+        self.event_queue.push(t, EVENT_PLACE_DONE, (index, arm_code, target_code, process_time))
         
-        # 6. 关门
-        if hasattr(target_chamber, 'door_open') and target_chamber.door_open:
-            target_chamber.close_door(self.current_time)
-            door_time = 1.0
-            moves.append({
-                'StartTime': self.current_time,
-                'EndTime': self.current_time + door_time,
-                'MoveID': self.move_counter,
-                'MoveType': MOVE_TYPES['COMPLETE'],
-                'ModuleName': target_chamber.chamber_name,
-                'MatID': wafer.wafer_id,
-                'SlotID': 1
+        if wafer.record_history:
+            wafer.move_history.append({
+                'from': source_name,
+                'to': target_name,
+                'arm': robot_arm.arm_id,
+                'start_time': self.current_time,
+                'end_time': t
             })
-            self.move_counter += 1
-            self.current_time += door_time
+        
+        if target_chamber is None:
+            return len(self.move_log) - first_move
+        
+        # 6. 关门
+        door_time = DOOR_PARAMS['close_time']
+        self._record_move(t, t + door_time, 'COMPLETE', target_chamber.chamber_name, index)
+        t += door_time
         
         # 7. 开始处理
-        process_time = get_process_time(wafer.process_type, target_chamber.chamber_id)
         if process_time > 0:
-            target_chamber.start_processing(wafer, self.current_time, process_time)
-            moves.append({
-                'StartTime': self.current_time,
-                'EndTime': self.current_time + process_time,
-                'MoveID': self.move_counter,
-                'MoveType': MOVE_TYPES['PROCESS'],
-                'ModuleName': target_chamber.chamber_name,
-                'MatID': wafer.wafer_id,
-                'SlotID': 1
+            self._record_move(t, t + process_time, 'PROCESS', target_chamber.chamber_name, index)
+            t += process_time
+        self.event_queue.push(t, EVENT_PROCESS_DONE, (index, target_code))
+        
+        # 8. LoadLock切换到晶圆下一次被取走一侧的气氛
+        self._postcondition(target_chamber, wafer, index, t, robot_arm.arm_type != 'TM1')
+        
+        return len(self.move_log) - first_move
+    
+    def execute_swap(self, wafer: Wafer, chamber: Chamber, target_chamber: Chamber,
+                     robot_arm: object) -> int:
+        """执行换片操作
+        
+        双臂机械手取出晶圆后转到PM，待PM内的当前晶圆完工，空臂取出当前晶圆、另一臂放入所持晶圆，
+        再把取出的晶圆送往target_chamber。两段搬运共用一次到PM的旋转。返回记录的移动条数。
+        """
+        index = self._wafer_index[wafer.wafer_id]
+        resident = chamber.current_wafer
+        resident_index = self._wafer_index[resident.wafer_id]
+        first_move = len(self.move_log)
+        self.state_version += 1
+        source_name, chamber_name = wafer.current_location, chamber.chamber_name
+        target_name = target_chamber.chamber_name
+        ready_time = self.current_time if resident_index in self._ready else chamber.process_end_time
+        self._ready.discard(index)
+        self._ready.discard(resident_index)
+        
+        # PM在换片过程中始终被占用，不需要预约；当前晶圆的下一目标照常预约
+        process_time = float(wafer.get_step_processing_time())
+        wafer.advance_step()
+        self._committed[index] = chamber_name
+        target_process_time = float(resident.get_step_processing_time())
+        target_chamber.reserve(resident)
+        resident.advance_step()
+        self._committed[resident_index] = target_name
+        target_ready_time = self._precondition(target_chamber, robot_arm, resident_index)
+        
+        positions = self.topology.positions[robot_arm.arm_type]
+        move_times = self.topology.move_times[robot_arm.arm_type]
+        source_position, chamber_position = positions[source_name], positions[chamber_name]
+        target_position = positions[target_name]
+        arm_code = self._arm_index[robot_arm.arm_id]
+        chamber_code = self._chamber_index[chamber_name]
+        
+        # 1. 转到晶圆所在模块取片
+        t = self.current_time
+        move_time = move_times.item(robot_arm.current_position, source_position)
+        if move_time > 0:
+            self._record_move(t, t + move_time, 'TRANS', robot_arm.arm_id, index)
+            t += move_time
+        robot_arm.start_pick(wafer, t)
+        pick_time = robot_arm.action_end_time - robot_arm.action_start_time
+        self._record_move(t, t + pick_time, 'PICK', robot_arm.arm_id, index)
+        t += pick_time
+        self.event_queue.push(t, EVENT_PICK_DONE, (index, arm_code, self._chamber_index[source_name]))
+        
+        # 2. 转到PM，在PM前等待当前晶圆完工
+        move_time = move_times.item(source_position, chamber_position)
+        if move_time > 0:
+            self._record_move(t, t + move_time, 'TRANS', robot_arm.arm_id, index)
+            t += move_time
+        t = max(t, ready_time)
+        
+        # 3. 开门后换片：空臂取出当前晶圆，另一臂放入所持晶圆
+        door_time = DOOR_PARAMS['open_time']
+        self._record_move(t - door_time, t, 'PREPARE', chamber_name, index)
+        self._record_move(t, t + pick_time, 'PICK', robot_arm.arm_id, resident_index)
+        t += pick_time
+        place_time = robot_arm.get_place_time()
+        self._record_move(t, t + place_time, 'PLACE', robot_arm.arm_id, index)
+        t += place_time
+        swap_time = t
+        self.event_queue.push(t, EVENT_SWAP_DONE, (resident_index, index, arm_code, chamber_code, process_time))
+        
+        # 4. 关门并开始处理放入的晶圆
+        door_time = DOOR_PARAMS['close_time']
+        self._record_move(t, t + door_time, 'COMPLETE', chamber_name, index)
+        t += door_time
+        if process_time > 0:
+            self._record_move(t, t + process_time, 'PROCESS', chamber_name, index)
+            t += process_time
+        self.event_queue.push(t, EVENT_PROCESS_DONE, (index, chamber_code))
+        
+        # 5. 把取出的晶圆送往下一目标腔室
+        t = swap_time
+        move_time = move_times.item(chamber_position, target_position)
+        if move_time > 0:
+            self._record_move(t, t + move_time, 'TRANS', robot_arm.arm_id, resident_index)
+            t += move_time
+        robot_arm.current_position = target_position
+        t = max(t, target_ready_time)
+        door_time = DOOR_PARAMS['open_time']
+        self._record_move(t - door_time, t, 'PREPARE', target_name, resident_index)
+        self._record_move(t, t + place_time, 'PLACE', robot_arm.arm_id, resident_index)
+        t += place_time
+        target_code = self._chamber_index[target_name]
+        self.event_queue.push(t, EVENT_PLACE_DONE, (resident_index, arm_code, target_code, target_process_time))
+        place_end = t
+        
+        door_time = DOOR_PARAMS['close_time']
+        self._record_move(t, t + door_time, 'COMPLETE', target_name, resident_index)
+        t += door_time
+        if target_process_time > 0:
+            self._record_move(t, t + target_process_time, 'PROCESS', target_name, resident_index)
+            t += target_process_time
+        self.event_queue.push(t, EVENT_PROCESS_DONE, (resident_index, target_code))
+        self._postcondition(target_chamber, resident, resident_index, t, True)
+        
+        if wafer.record_history:
+            wafer.move_history.append({
+                'from': source_name,
+                'to': chamber_name,
+                'arm': robot_arm.arm_id,
+                'start_time': self.current_time,
+                'end_time': swap_time
+            })
+        if resident.record_history:
+            resident.move_history.append({
+                'from': chamber_name,
+                'to': target_name,
+                'arm': robot_arm.arm_id,
+                'start_time': swap_time - place_time - pick_time,
+                'end_time': place_end
             })
-            self.move_counter += 1
-            self.current_time += process_time
-            
-            # 完成处理
-            target_chamber.finish_processing(self.current_time)
-            wafer.advance_step()
         
-        return moves
+        return len(self.move_log) - first_move
     
-    def step(self) -> bool:
-        """环境步进，返回是否所有晶圆完成"""
-        # 简化的调度逻辑：按顺序处理晶圆
-        for wafer in self.wafers:
-            if not wafer.is_completed():
-                available_chambers = self.get_available_chambers_for_wafer(wafer)
-                if available_chambers:
-                    # 选择第一个可用腔室
-                    target_chamber = available_chambers[0]
-                    # 选择第一个可用机械臂
-                    available_arm = None
-                    for arm in self.robot_arms.values():
-                        if arm.can_perform_action():
-                            available_arm = arm
-                            break
-                    
-                    if available_arm:
-                        moves = self.execute_wafer_move(wafer, target_chamber, available_arm)
-                        self.move_list.extend(moves)
-                        break
+    def _start_processing(self, wafer: Wafer, chamber: Chamber, time: float, process_time: float):
+        """放片完成后关门并开始处理"""
+        process_start = time + DOOR_PARAMS['close_time']
+        chamber.start_processing(wafer, process_start, process_time)
+        wafer.status = 'processing'
+        if wafer.record_history:
+            wafer.processing_history.append({
+                'chamber': chamber.chamber_name,
+                'start_time': process_start,
+                'end_time': process_start + process_time
+            })
+    
+    def _handle_event(self, time: float, event_type: str, payload):
+        """处理到期事件，更新各资源状态"""
+        self.state_version += 1
+        if event_type == EVENT_PICK_DONE:
+            wafer_index, arm_code, source_code = payload
+            wafer = self.wafers[wafer_index]
+            robot_arm = self._arm_list[arm_code]
+            if source_code >= 0:
+                source_chamber = self._chamber_list[source_code]
+                source_chamber.release_wafer(time)
+                self._anticipate_conditioning(source_chamber, wafer_index, time)
+                self._anticipate_clean(source_chamber, wafer_index, time)
+            robot_arm.finish_pick(wafer, time)
+            robot_arm.start_place(time)
         
-        # 检查是否所有晶圆完成
-        return all(wafer.is_completed() for wafer in self.wafers)
-    
-    def run_simulation(self) -> Dict:
-        """运行完整仿真"""
-        max_steps = 10000  # 防止无限循环
-        step_count = 0
-        
-        while step_count < max_steps:
-            all_completed = self.step()
-            step_count += 1
-            
-            if all_completed:
-                break
+        elif event_type == EVENT_PLACE_DONE:
+            wafer_index, arm_code, target_code, process_time = payload
+            wafer = self.wafers[wafer_index]
+            robot_arm = self._arm_list[arm_code]
+            if target_code < 0:
+                robot_arm.finish_place(self.get_loadport_name(wafer), time)
+                # 返回LoadPort，晶圆完工
+                wafer.status = 'completed'
+                wafer.completion_time = time
+                self.wip -= 1
+                self.finished_count += 1
+            else:
+                target_chamber = self._chamber_list[target_code]
+                robot_arm.finish_place(target_chamber, time)
+                self._start_processing(wafer, target_chamber, time, process_time)
+        
+        elif event_type == EVENT_SWAP_DONE:
+            resident_index, wafer_index, arm_code, chamber_code, process_time = payload
+            wafer = self.wafers[wafer_index]
+            robot_arm = self._arm_list[arm_code]
+            chamber = self._chamber_list[chamber_code]
+            robot_arm.finish_swap(self.wafers[resident_index], chamber, time)
+            robot_arm.start_place(time)
+            self._start_processing(wafer, chamber, time, process_time)
+        
+        elif event_type == EVENT_PROCESS_DONE:
+            wafer_index, target_code = payload
+            wafer = self.wafers[wafer_index]
+            target_chamber = self._chamber_list[target_code]
+            target_chamber.finish_processing(time)
+            action = self._conditioning(target_chamber, not wafer.is_completed())
+            if action is not None:
+                # LoadLock先抽气或充气，完成后晶圆才就绪
+                self._start_conditioning(target_chamber, action, time)
+                return
+            self._set_ready(wafer_index, target_chamber, time)
+        
+        elif event_type == EVENT_CLEAN_DONE:
+            self._chamber_list[payload].finish_cleaning(time)
+        
+        elif event_type == EVENT_PUMP_VENT_DONE:
+            chamber_code, wafer_index = payload
+            chamber = self._chamber_list[chamber_code]
+            chamber.finish_pump_vent(time)
+            if wafer_index >= 0:
+                self._set_ready(wafer_index, chamber, time)
+    
+    def _anticipate_conditioning(self, chamber: Chamber, index: int, time: float):
+        """LLA/LLB清空后立即切换到下一片晶圆将从哪一侧进入的气氛
+        
+        有在制晶圆下一步可进入时抽气等待TM2，否则有LoadPort队首晶圆可进入时充气等待TM1。
+        移动记录归到刚取走的晶圆index名下。
+        """
+        if not getattr(chamber, 'can_pump_vent', False):
+            return
+        name = chamber.chamber_name
+        steps, type_ids = self._wafer_step_column, self._wafer_type_column
+        step_option_names = self._step_option_names
+        vacuum = any(name in step_option_names[type_ids.item(i)][steps.item(i)]
+                     for i in self._committed if steps.item(i) < len(step_option_names[type_ids.item(i)]))
+        if not vacuum and not (self.wip < self.max_wip and any(
+                queue and name in step_option_names[type_ids.item(queue[0])][0]
+                for queue in self._loadport_queues.values())):
+            return
+        action = self._conditioning(chamber, vacuum)
+        if action is None:
+            return
+        duration = chamber.pump_time if action == 'PUMP' else chamber.vent_time
+        self._record_move(time, time + duration, action, chamber.chamber_name, index)
+        self._start_conditioning(chamber, action, time)
+        self.event_queue.push(time + duration, EVENT_PUMP_VENT_DONE, (self._chamber_index[chamber.chamber_name], -1))
+    
+    def clean_required(self, chamber: Chamber, wafer: Wafer) -> Optional[str]:
+        """晶圆此刻进入PM前需要的清洁：wafer_count、process_switch或idle，不需要时为None"""
+        if self.cleaning == 'off' or not chamber.chamber_name.startswith('PM'):
+            return None
+        if chamber.wafer_count >= CLEAN_PARAMS['wafer_count_threshold']:
+            return 'wafer_count'
+        if chamber.last_process_type is not None and chamber.last_process_type != wafer.process_type:
+            return 'process_switch'
+        if self.current_time - chamber.last_activity_time >= CLEAN_PARAMS['idle_threshold']:
+            return 'idle'
+        return None
+    
+    @staticmethod
+    def _clean_time(clean_type: str) -> float:
+        """清洁时长"""
+        return CLEAN_PARAMS[{'wafer_count': 'wafer_count_clean_time',
+                             'process_switch': 'process_switch_clean_time'}.get(clean_type, 'idle_clean_time')]
+    
+    def _twin_available_before(self, wafer: Wafer, deadline: float) -> bool:
+        """晶圆可选的PM中是否有正在加工、deadline前完工且接片时无需片数或工艺切换清洁的"""
+        for name in self._step_option_names[wafer.process_type_id][wafer.current_step]:
+            chamber = self.chambers[name]
+            resident = chamber.current_wafer
+            if (chamber.status == 'processing' and resident is not None
+                    and chamber.process_end_time < deadline
+                    and resident.process_type == wafer.process_type
+                    and chamber.wafer_count < CLEAN_PARAMS['wafer_count_threshold']):
+                return True
+        return False
+    
+    def _start_clean(self, chamber: Chamber, clean_type: str, index: int, time: float):
+        """开始清洁空闲PM，移动记录归到触发清洁的晶圆index名下"""
+        chamber.start_cleaning(time, clean_type)
+        self._record_move(time, chamber.process_end_time, 'CLEAN', chamber.chamber_name, index)
+        self.event_queue.push(chamber.process_end_time, EVENT_CLEAN_DONE, self._chamber_index[chamber.chamber_name])
+    
+    def _clean_on_demand(self):
+        """就绪晶圆的可选PM中空闲的都需要清洁时，清洁其中第一个"""
+        steps, type_ids = self._wafer_step_column, self._wafer_type_column
+        for index in sorted(self._ready):
+            if steps.item(index) >= len(self._step_option_names[type_ids.item(index)]):
+                continue
+            wafer = self.wafers[index]
+            free_mask = self._free_mask.mask
+            free_options = [chamber for chamber in (self.chambers[name] for name in
+                                                    self._step_option_names[type_ids.item(index)][steps.item(index)])
+                            if free_mask & (1 << (chamber.chamber_id - 1))]
+            clean_types = [self.clean_required(chamber, wafer) for chamber in free_options]
+            if not free_options or None in clean_types:
+                continue
+            clean_type = clean_types[0]
+            if self.cleaning == 'opportunistic' and self._twin_available_before(
+                    wafer, self.current_time + self._clean_time(clean_type)):
+                continue  # 等待无需清洁的柔性孪生腔室
+            self._start_clean(free_options[0], clean_type, index, self.current_time)
+    
+    def _anticipate_clean(self, chamber: Chamber, index: int, time: float):
+        """PM清空时提前清洁（opportunistic策略）
+        
+        仍有晶圆会进入本PM时：片数到期，或下一步可进入本PM的在制晶圆均与上一片工艺不同则立即清洁；
+        否则若预测下一片晶圆最早也要在片数清洁时长之后才到达，趁空闲提前做片数清洁。
+        """
+        if self.cleaning != 'opportunistic' or not chamber.chamber_name.startswith('PM'):
+            return
+        arrival = self._predicted_arrival(chamber)
+        if arrival == float('inf'):
+            return  # 不会再有晶圆进入
+        name = chamber.chamber_name
+        steps, type_ids = self._wafer_step_column, self._wafer_type_column
+        step_option_names = self._step_option_names
+        users = [i for i in self._committed if steps.item(i) < len(step_option_names[type_ids.item(i)])
+                 and name in step_option_names[type_ids.item(i)][steps.item(i)]]
+        
+        if chamber.wafer_count >= CLEAN_PARAMS['wafer_count_threshold']:
+            clean_type = 'wafer_count'
+        elif users and all(self.wafers[i].process_type != chamber.last_process_type for i in users):
+            clean_type = 'process_switch'
+        elif chamber.wafer_count > 0 and arrival - time >= CLEAN_PARAMS['wafer_count_clean_time']:
+            clean_type = 'wafer_count'
+        else:
+            return
+        self._start_clean(chamber, clean_type, index, time)
+    
+    def _predicted_arrival(self, chamber: Chamber) -> float:
+        """预测下一片晶圆最早到达PM的时刻
+        
+        对在制晶圆及LoadPort队首，从其预计就绪时刻起累加剩余路径上到达本PM前各步的工艺时间，
+        不计搬运，因此是偏早的估计。
+        """
+        name = chamber.chamber_name
+        type_ids, steps = self._wafer_type_column, self._wafer_step_column
+        candidates = [(index, self._ready_estimate(index)) for index in self._committed]
+        candidates.extend((queue[0], self.current_time) for queue in self._loadport_queues.values() if queue)
+        arrival = float('inf')
+        for index, elapsed in candidates:
+            type_id = type_ids.item(index)
+            route = self._step_option_names[type_id]
+            for step in range(steps.item(index), len(route)):
+                if elapsed >= arrival:
+                    break
+                if name in route[step]:
+                    arrival = elapsed
+                    break
+                elapsed += PROCESS_TIME_TABLE.item(type_id, step)
+        return arrival
+    
+    def _ready_estimate(self, index: int) -> float:
+        """在制晶圆预计可被取走的时刻"""
+        chamber = self.chambers[self._committed[index]]
+        if index in self._ready or chamber.current_wafer is not self.wafers[index]:
+            return self.current_time
+        return max(self.current_time, chamber.process_end_time)
+    
+    def _set_ready(self, wafer_index: int, chamber: Chamber, time: float):
+        """晶圆在腔室内就绪，等待取走"""
+        wafer = self.wafers[wafer_index]
+        wafer.status = 'waiting'
+        wafer.ready_time = time
+        # 完工前已被换片派发的晶圆由等在PM前的机械臂直接取走，不再进入就绪集合
+        if self._committed.get(wafer_index) == chamber.chamber_name:
+            self._ready.add(wafer_index)
+            if not self.deadlocked:
+                self.deadlocked = self._deadlock_detector.check(wafer_index)
+    
+    def advance_to_next_event(self) -> bool:
+        """推进到下一个事件时刻并处理该时刻的全部事件"""
+        next_time = self.event_queue.peek_time()
+        if next_time is None:
+            return False
         
-        # 设置完成时间
-        for wafer in self.wafers:
+        self.current_time = max(self.current_time, next_time)
+        for time, event_type, payload in self.event_queue.pop_due(next_time):
+            self._handle_event(time, event_type, payload)
+        if self.cleaning != 'off':
+            self._clean_on_demand()
+        return True
+    
+    def advance_time(self, duration: float):
+        """按固定时长推进时钟，处理期间到期的全部事件"""
+        target_time = self.current_time + duration
+        for time, event_type, payload in self.event_queue.pop_due(target_time):
+            self._handle_event(time, event_type, payload)
+        self.current_time = target_time
+        if self.cleaning != 'off':
+            self._clean_on_demand()
+    
+    def _dispatch_candidates(self) -> List[Wafer]:
+        """当前可派发的晶圆：腔室内就绪晶圆及各批次LoadPort队首"""
+        indices = list(self._ready)
+        if self.wip < self.max_wip:
+            indices.extend(queue[0] for queue in self._loadport_queues.values() if queue)
+        return [self.wafers[i] for i in sorted(indices)]
+    
+    def get_decision_wafers(self) -> List[Wafer]:
+        """当前时刻存在非等待动作的未完工晶圆"""
+        return [wafer for wafer in self._dispatch_candidates()
+                if not wafer.is_completed() and self.get_dispatchable_chambers(wafer)]
+    
+    def get_dispatchable_chambers(self, wafer: Wafer) -> List[Chamber]:
+        """当前时刻可以立即送入的腔室：空闲、满足超片约束、安全且有空闲机械臂"""
+        index = self._wafer_index[wafer.wafer_id]
+        if index not in self._ready:
+            queue = self._loadport_queues.get(self.get_loadport_name(wafer))
+            if not queue or queue[0] != index or self.wip >= self.max_wip:
+                return []
+        
+        dispatchable = []
+        for target_chamber in self.get_available_chambers_for_wafer(wafer):
+            if not self.check_overtaking_constraint(wafer, target_chamber):
+                continue
+            if self.clean_required(target_chamber, wafer) is not None:
+                continue
+            if not self.is_safe_move(wafer, target_chamber):
+                continue
+            if self.get_available_arm(wafer.current_location, target_chamber.chamber_name):
+                dispatchable.append(target_chamber)
+        return dispatchable
+    
+    def dispatch_wafer(self, wafer: Wafer, target_chamber: Chamber) -> int:
+        """将晶圆送入指定腔室，返回记录的移动条数，目标不可立即送入时返回0"""
+        if target_chamber not in self.get_dispatchable_chambers(wafer):
+            return 0
+        arm = self.get_available_arm(wafer.current_location, target_chamber.chamber_name)
+        return self.execute_wafer_move(wafer, target_chamber, arm)
+    
+    def dispatch_swap(self, wafer: Wafer, chamber: Chamber) -> int:
+        """晶圆与指定PM内的当前晶圆换片，返回记录的移动条数，不能换片时返回0"""
+        for option in self.get_swap_options(wafer):
+            if option[0] is chamber:
+                return self.execute_swap(wafer, *option)
+        return 0
+    
+    def dispatch_exits(self) -> int:
+        """将已完成全部工艺的就绪晶圆送回LoadPort"""
+        dispatched = 0
+        for index in sorted(self._ready):
+            wafer = self.wafers[index]
             if wafer.is_completed():
-                wafer.completion_time = self.current_time
+                arm = self.get_available_arm(wafer.current_location, self.get_loadport_name(wafer))
+                if arm:
+                    self.execute_wafer_move(wafer, None, arm)
+                    dispatched += 1
+        return dispatched
+    
+    def advance_to_next_decision(self) -> float:
+        """跳过无决策可做的时段，推进到下一个存在非等待动作的时刻
+        
+        返回跳过的仿真时长。期间完工晶圆的返回LoadPort搬运自动派发。
+        """
+        start_time = self.current_time
+        self.dispatch_exits()
+        while not self.is_done() and not self.deadlocked and not self.get_decision_wafers():
+            if not self.advance_to_next_event():
+                break
+            self.dispatch_exits()
+        return self.current_time - start_time
+    
+    def _try_dispatch(self, wafer: Wafer) -> bool:
+        """尝试为晶圆派发一次搬运"""
+        if wafer.is_completed():
+            arm = self.get_available_arm(wafer.current_location, self.get_loadport_name(wafer))
+            if arm:
+                self.execute_wafer_move(wafer, None, arm)
+                return True
+            return False
+        
+        dispatchable = self.get_dispatchable_chambers(wafer)
+        if dispatchable:
+            target_chamber = self.policy.select_chamber(self, wafer, dispatchable)
+            arm = self.get_available_arm(wafer.current_location, target_chamber.chamber_name)
+            self.execute_wafer_move(wafer, target_chamber, arm)
+            return True
+        
+        # 没有空闲腔室时与即将完工的PM换片
+        swap_options = self.get_swap_options(wafer)
+        if swap_options:
+            self.execute_swap(wafer, *swap_options[0])
+            return True
+        return False
+    
+    def dispatch(self) -> int:
+        """在当前决策时刻按派发规则的先后尽可能多地派发搬运，返回派发数量"""
+        dispatched = 0
+        progress = True
+        while progress and (self.wip < self.max_wip or self._ready):
+            progress = False
+            key = partial(self.policy.wafer_key, self)
+            candidates = sorted(self._dispatch_candidates(), key=key)
+            while candidates:
+                wafer = candidates.pop(0)
+                if self._try_dispatch(wafer):
+                    dispatched += 1
+                    progress = True
+                    if self.policy.dynamic_key:
+                        # 派发占用了机械臂，其余候选的排序键已过时
+                        candidates.sort(key=key)
+        return dispatched
+    
+    def is_done(self) -> bool:
+        """所有晶圆是否已返回LoadPort"""
+        return self.finished_count >= len(self.wafers)
+    
+    def is_deadlocked(self) -> bool:
+        """是否已有在制晶圆互相等待而陷入死锁"""
+        return bool(self.deadlocked)
+    
+    def step(self) -> bool:
+        """环境步进：派发当前时刻的搬运并推进到下一事件，返回是否所有晶圆完成"""
+        self.dispatch()
+        if not self.is_done():
+            self.advance_to_next_event()
         
+        # 检查是否所有晶圆完成
+        return self.is_done()
+    
+    def snapshot(self) -> Dict:
+        """导出紧凑的仿真状态快照
+        
+        晶圆、腔室、机械臂的动态状态直接复制FabState各列，事件载荷均为整数索引，
+        因此快照可以在同一任务的任意环境实例之间恢复。历史记录不属于快照。
+        """
         return {
-            'MoveList': self.move_list,
-            'TotalTime': self.current_time,
-            'CompletedWafers': len([w for w in self.wafers if w.is_completed()]),
+            'current_time': self.current_time,
+            'move_counter': self.move_counter,
+            'wip': self.wip,
+            'finished_count': self.finished_count,
+            'move_log': self.move_log.snapshot(),
+            'constraint_violations': list(self.constraint_violations),
+            'events': self.event_queue.snapshot(),
+            'ready': frozenset(self._ready),
+            'committed': dict(self._committed),
+            'deadlocked': self.deadlocked,
+            'loadport_remaining': {loadport: len(queue) for loadport, queue in self._loadport_queues.items()},
+            'state': self.state.snapshot(),
+        }
+    
+    def restore(self, snap: Dict):
+        """从快照恢复仿真状态，晶圆、腔室、机械臂对象保持不变"""
+        self.state_version += 1
+        self.current_time = snap['current_time']
+        self.move_counter = snap['move_counter']
+        self.wip = snap['wip']
+        self.finished_count = snap['finished_count']
+        self.move_log.restore(snap['move_log'])
+        self.constraint_violations = list(snap['constraint_violations'])
+        self.event_queue.restore(snap['events'])
+        self._ready = set(snap['ready'])
+        self._committed = dict(snap['committed'])
+        self.deadlocked = snap.get('deadlocked', frozenset())
+        self._loadport_queues = {loadport: deque(order[len(order) - snap['loadport_remaining'][loadport]:])
+                                 for loadport, order in self._loadport_order.items()}
+        
+        rebuild_index = not np.array_equal(self.state.columns['wafer_step'], snap['state'][0]['wafer_step'])
+        self.state.restore(snap['state'])
+        if rebuild_index:
+            self._overtaking_index.rebuild(self.wafers)
+        self._free_mask.rebuild(self._chamber_list)
+    
+    def fork(self) -> 'FabEnvironment':
+        """复制出一个状态相同、相互独立的环境，用于前瞻搜索分支"""
+        clone = self.sub_environment(self._wafer_configs, self.max_wip, self._cycle_free_wip)
+        clone.restore(self.snapshot())
+        return clone
+    
+    def sub_environment(self, wafer_configs: List[Dict], max_wip: Optional[int] = None,
+                        cycle_free_wip: Optional[int] = None, swap: Optional[bool] = None,
+                        cleaning: Optional[str] = None) -> 'FabEnvironment':
+        """以相同的设置为给定晶圆新建处于初始状态的环境，如只含各批次前几片晶圆的小规模子问题
+        
+        swap、cleaning为None时沿用本环境的设置。
+        """
+        if cleaning is not None and cleaning not in CLEANING_POLICIES:
+            raise ValueError(f"未知的清洁策略: {cleaning}")
+        clone = FabEnvironment.__new__(FabEnvironment)
+        clone.task_name = self.task_name
+        clone.history = self.history
+        clone.swap = self.swap if swap is None else swap
+        clone.cleaning = self.cleaning if cleaning is None else cleaning
+        clone.policy = self.policy
+        clone.topology = self.topology
+        clone._build(wafer_configs, max_wip, cycle_free_wip)
+        return clone
+    
+    def run_simulation(self, writer: Optional[ResultWriter] = None) -> Dict:
+        """运行完整仿真
+        
+        指定writer时，仿真过程中把已确定的移动记录分块写出，返回的结果不含MoveList。
+        """
+        while not self.is_done():
+            self.step()
+            if self.deadlocked:
+                # 死锁后不再有晶圆能推进，立即终止
+                break
+            if not self.event_queue and not self.is_done():
+                # 无事件可推进且无法派发，仿真停滞
+                self.dispatch()
+                if not self.event_queue:
+                    break
+            if writer is not None:
+                writer.maybe_flush(self.move_log, self.current_time)
+        
+        summary = self._result_summary()
+        if writer is not None:
+            return summary
+        return {'MoveList': self.move_log.to_dicts(sort=True), **summary}
+    
+    def _result_summary(self) -> Dict:
+        """结果中MoveList以外的汇总字段，死锁终止时附带死锁晶圆"""
+        summary = {
+            'TotalTime': self.move_log.total_time(),
+            'CompletedWafers': self.finished_count,
             'TotalWafers': len(self.wafers),
             'ConstraintViolations': self.constraint_violations
         }
+        if self.deadlocked:
+            summary['Deadlock'] = [self.wafers[i].wafer_id for i in sorted(self.deadlocked)]
+        return summary
     
-    def save_results(self, filename: str):
-        """保存结果到JSON文件"""
-        result = self.run_simulation()
+    def save_results(self, filename: str, result_format: str = 'json', rerun: bool = True):
+        """保存结果文件
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        result_format为json或ndjson，仿真过程中流式写出移动记录，汇总信息写在末尾，含完工时间下界与差距。
+        rerun为False且环境中已有移动记录时，不再继续仿真，直接写出已有结果。
+        """
+        with ResultWriter(filename, result_format) as writer:
+            if rerun or not len(self.move_log):
+                result = self.run_simulation(writer)
+            else:
+                result = self._result_summary()
+            result.update(bound_report(self, result['TotalTime']))
+            writer.close(self.move_log, result)
         
         print(f"结果已保存到 {filename}")
         print(f"总完工时间: {result['TotalTime']:.2f}秒")
-        print(f"完成晶圆数: {result['CompletedWafers']}/{result['TotalWafers']}")
\ No newline at end of file
+        print(f"完成晶圆数: {result['CompletedWafers']}/{result['TotalWafers']}")
+        print(f"完工时间下界: {result['LowerBound']:.2f}秒 (瓶颈{result['Bottleneck']}), 差距: {result['OptimalityGap']:.2%}")
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+制造环境列式状态存储
+晶圆、腔室、机械臂的动态状态按列存放在NumPy数组中，对象属性只是对应行的视图
+"""
+
+import numpy as np
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.process_config import PROCESS_TYPE_IDS
+
+# 状态字符串的整数编码
+WAFER_STATUS_CODES = {'waiting': 0, 'processing': 1, 'moving': 2, 'completed': 3}
+CHAMBER_STATUS_CODES = {'idle': 0, 'processing': 1, 'cleaning': 2, 'door_opening': 3,
+                        'door_closing': 4, 'pumping': 5, 'venting': 6}
+ARM_STATUS_CODES = {'idle': 0, 'moving': 1, 'picking': 2, 'placing': 3}
+PROCESS_TYPE_CODES = PROCESS_TYPE_IDS
+
+# 各类对象的列及类型
+WAFER_COLUMNS = {
+    'wafer_step': np.int16, 'wafer_status': np.int8, 'wafer_location': np.int16,
+    'wafer_lot': np.int16, 'wafer_num': np.int16, 'wafer_type': np.int16,
+    'wafer_start_time': np.float64, 'wafer_ready_time': np.float64, 'wafer_completion_time': np.float64,
+}
+CHAMBER_COLUMNS = {
+    'chamber_id': np.int16, 'chamber_status': np.int8, 'chamber_wafer': np.int32,
+    'chamber_occupied': np.bool_, 'chamber_needs_cleaning': np.bool_, 'chamber_door_open': np.bool_,
+    'chamber_vacuum': np.bool_, 'chamber_wafer_count': np.int32, 'chamber_last_type': np.int16,
+    'chamber_last_activity_time': np.float64, 'chamber_process_start_time': np.float64,
+    'chamber_process_end_time': np.float64,
+}
+ARM_COLUMNS = {
+    'arm_status': np.int8, 'arm_wafer': np.int32, 'arm_second_wafer': np.int32, 'arm_position': np.int16,
+    'arm_action_start_time': np.float64, 'arm_action_end_time': np.float64,
+}
+
+
+class StateColumn:
+    """对象属性到FabState列的描述符，读写所属对象所在行"""
+    
+    def __init__(self, column: str):
+        self.column = column
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj._state.columns[self.column].item(obj._row)
+    
+    def __set__(self, obj, value):
+        obj._state.columns[self.column][obj._row] = value
+
+
+class OptionalTimeColumn(StateColumn):
+    """可为空的时刻列，空值存为NaN"""
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = obj._state.columns[self.column].item(obj._row)
+        return None if value != value else value
+    
+    def __set__(self, obj, value):
+        obj._state.columns[self.column][obj._row] = np.nan if value is None else value
+
+
+class CodeColumn(StateColumn):
+    """字符串取值的编码列，空值存为-1"""
+    
+    def __init__(self, column: str, codes: Dict[str, int]):
+        super().__init__(column)
+        self.codes = codes
+        self.names = {code: name for name, code in codes.items()}
+        self.names[-1] = None
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return self.names[obj._state.columns[self.column].item(obj._row)]
+    
+    def __set__(self, obj, value):
+        obj._state.columns[self.column][obj._row] = -1 if value is None else self.codes[value]
+
+
+class LocationColumn(StateColumn):
+    """位置名称列，编码表由所属FabState维护"""
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        state = obj._state
+        return state.location_names[state.columns[self.column].item(obj._row)]
+    
+    def __set__(self, obj, value):
+        state = obj._state
+        state.columns[self.column][obj._row] = state.location_code(value)
+
+
+class WaferColumn(StateColumn):
+    """晶圆引用列，存晶圆行号，空为-1"""
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        code = obj._state.columns[self.column].item(obj._row)
+        return None if code < 0 else obj._state.wafers[code]
+    
+    def __set__(self, obj, value):
+        state = obj._state
+        state.columns[self.column][obj._row] = state.wafer_code(value)
+
+
+@lru_cache(maxsize=None)
+def state_attributes(cls) -> Tuple[str, ...]:
+    """类上由FabState列支撑的属性名"""
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name, attribute in vars(klass).items():
+            if isinstance(attribute, StateColumn) and name not in names:
+                names.append(name)
+    return tuple(names)
+
+
+class FabState:
+    """列式状态存储
+    
+    每片晶圆、每个腔室、每个机械臂对应各自列中的一行。对象可以直接创建在共享存储的指定行，
+    也可以先使用单行的独立存储，再通过adopt/from_objects迁入。之后整厂查询可直接在列上向量化计算，
+    快照与恢复也只需复制各列。
+    """
+    
+    def __init__(self, num_wafers: int = 0, num_chambers: int = 0, num_arms: int = 0):
+        # 只为行数非零的对象类别分配列，单个对象的独立存储因此很轻
+        self.columns: Dict[str, np.ndarray] = {}
+        for columns, size in ((WAFER_COLUMNS, num_wafers), (CHAMBER_COLUMNS, num_chambers),
+                              (ARM_COLUMNS, num_arms)):
+            if size:
+                for name, dtype in columns.items():
+                    self.columns[name] = np.zeros(size, dtype=dtype)
+        self.wafers: List = []  # 晶圆编码 -> 晶圆对象
+        self.location_names: List[Optional[str]] = []
+        self.location_codes: Dict[Optional[str], int] = {}
+    
+    @classmethod
+    def from_objects(cls, wafers: Iterable, chambers: Iterable, arms: Iterable) -> 'FabState':
+        """把已有对象的状态迁入新的共享存储，并将对象重新绑定到对应行"""
+        state = cls()
+        # 晶圆先迁入，腔室与机械臂中的晶圆引用才能编码为行号
+        state.wafers = state.adopt(WAFER_COLUMNS, wafers)
+        state.adopt(CHAMBER_COLUMNS, chambers)
+        state.adopt(ARM_COLUMNS, arms)
+        return state
+    
+    @classmethod
+    def batch(cls, num_replicas: int, num_wafers: int, num_chambers: int,
+              num_arms: int) -> Tuple[Dict[str, np.ndarray], List['FabState']]:
+        """为N个副本分配共享的二维列，第i个副本的各列是第i行的视图"""
+        batch_columns = {}
+        for columns, size in ((WAFER_COLUMNS, num_wafers), (CHAMBER_COLUMNS, num_chambers),
+                              (ARM_COLUMNS, num_arms)):
+            for name, dtype in columns.items():
+                batch_columns[name] = np.zeros((num_replicas, size), dtype=dtype)
+        states = []
+        for replica in range(num_replicas):
+            state = cls()
+            state.columns = {name: column[replica] for name, column in batch_columns.items()}
+            states.append(state)
+        return batch_columns, states
+    
+    def adopt(self, columns: Dict[str, type], objects: Iterable) -> List:
+        """为一类对象分配列，把对象当前状态迁入并重新绑定到对应行
+        
+        已有行数相同的列（如共享二维列的视图）原地写入，不重新分配。
+        """
+        objects = list(objects)
+        for name, dtype in columns.items():
+            column = self.columns.get(name)
+            if column is None or len(column) != len(objects):
+                self.columns[name] = np.zeros(len(objects), dtype=dtype)
+        for row, obj in enumerate(objects):
+            attributes = state_attributes(type(obj))
+            values = [getattr(obj, name) for name in attributes]
+            obj._state, obj._row = self, row
+            for name, value in zip(attributes, values):
+                setattr(obj, name, value)
+        return objects
+    
+    def location_code(self, location: Optional[str]) -> int:
+        """位置名称编码，新名称追加到编码表"""
+        code = self.location_codes.get(location)
+        if code is None:
+            code = self.location_codes[location] = len(self.location_names)
+            self.location_names.append(location)
+        return code
+    
+    def wafer_code(self, wafer) -> int:
+        """晶圆对象编码为行号，空为-1；不属于本存储的晶圆追加到引用表"""
+        if wafer is None:
+            return -1
+        if wafer._state is self:
+            return wafer._row
+        for code in range(len(self.wafers) - 1, -1, -1):
+            if self.wafers[code] is wafer:
+                return code
+        self.wafers.append(wafer)
+        return len(self.wafers) - 1
+    
+    def snapshot(self) -> Tuple[Dict[str, np.ndarray], Tuple[Optional[str], ...]]:
+        """复制全部列及位置编码表"""
+        return {name: column.copy() for name, column in self.columns.items()}, tuple(self.location_names)
+    
+    def restore(self, state: Tuple[Dict[str, np.ndarray], Tuple[Optional[str], ...]]):
+        """按列恢复状态，列数组原地写入，已绑定对象无需重新关联"""
+        columns, location_names = state
+        for name, column in columns.items():
+            self.columns[name][...] = column
+        # 不同环境实例登记位置名称的顺序可能不同，以快照中的编码表为准
+        self.location_names = list(location_names)
+        self.location_codes = {name: code for code, name in enumerate(location_names)}
\ No newline at end of file
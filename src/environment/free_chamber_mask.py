@@ -0,0 +1,43 @@
+"""
+空闲腔室位掩码
+以14位整数记录当前可接收晶圆的腔室，腔室k对应第k-1位
+"""
+
+from typing import Iterable, List
+
+
+class FreeChamberMask:
+    """空闲腔室位掩码
+    
+    腔室在占用、工艺、清洁、开关门、抽充气等状态变化时通知本对象更新对应位，
+    可用腔室查询即为 mask & 工艺步选项掩码。
+    """
+    
+    def __init__(self, chambers: Iterable = ()):
+        self.mask = 0
+        self.rebuild(chambers)
+    
+    def rebuild(self, chambers: Iterable):
+        """根据腔室当前状态重建掩码"""
+        self.mask = 0
+        for chamber in chambers:
+            chamber.free_mask = self
+            self.update(chamber)
+    
+    def update(self, chamber):
+        """按腔室当前状态设置或清除对应位"""
+        bit = 1 << (chamber.chamber_id - 1)
+        if not chamber.is_occupied and chamber.status == 'idle':
+            self.mask |= bit
+        else:
+            self.mask &= ~bit
+    
+    @staticmethod
+    def chamber_ids(mask: int) -> List[int]:
+        """将位掩码展开为升序的腔室编号"""
+        chamber_ids = []
+        while mask:
+            lowest = mask & -mask
+            chamber_ids.append(lowest.bit_length())
+            mask ^= lowest
+        return chamber_ids
\ No newline at end of file
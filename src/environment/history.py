@@ -0,0 +1,28 @@
+"""
+历史记录策略
+off不记录，ring:N只保留最近N条，full全部保留
+"""
+
+from collections import deque
+from typing import Union
+
+DEFAULT_HISTORY_POLICY = 'full'
+
+
+def parse_history_policy(policy: str) -> Union[int, None]:
+    """解析历史记录策略，返回保留条数：off为0，full为None"""
+    if policy == 'off':
+        return 0
+    if policy == 'full':
+        return None
+    if policy.startswith('ring:'):
+        size = policy[len('ring:'):]
+        if size.isdigit() and int(size) > 0:
+            return int(size)
+    raise ValueError(f"未知的历史记录策略: {policy}，可选 off、ring:N、full")
+
+
+def create_history(policy: str) -> Union[list, deque]:
+    """按策略创建历史记录容器，off时返回空列表且调用方不再追加"""
+    maxlen = parse_history_policy(policy)
+    return deque(maxlen=maxlen) if maxlen else []
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+列式移动记录
+以可增长的NumPy结构化数组保存MoveList，仅在导出时转换为JSON字典格式
+"""
+
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 每条移动记录的字段，模块与晶圆存为编号
+MOVE_DTYPE = np.dtype([
+    ('StartTime', np.float64),
+    ('EndTime', np.float64),
+    ('MoveID', np.int32),
+    ('MoveType', np.int8),
+    ('ModuleID', np.int16),
+    ('WaferID', np.int32),
+    ('SlotID', np.int8),
+])
+
+
+class MoveLog:
+    """可增长的结构化数组移动记录
+    
+    快照只保存(缓冲区, 长度)，不复制记录。缓冲区被快照引用后，
+    若在已有记录范围内重新写入（恢复到较早快照后继续仿真），先复制出新的缓冲区，
+    因此任意多个快照可以安全共存。
+    """
+    
+    def __init__(self, module_names: Iterable[str], wafer_ids: Iterable[str], capacity: int = 1024):
+        self.module_names = list(module_names)
+        self.module_codes = {name: code for code, name in enumerate(self.module_names)}
+        self.wafer_ids = list(wafer_ids)
+        self._records = np.zeros(capacity, dtype=MOVE_DTYPE)
+        self._size = 0
+        self._protected = 0  # 缓冲区中被快照引用、不可覆盖的记录数
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _reallocate(self, capacity: int):
+        """复制到新的缓冲区"""
+        records = np.zeros(capacity, dtype=MOVE_DTYPE)
+        records[:self._size] = self._records[:self._size]
+        self._records = records
+        self._protected = 0
+    
+    def append(self, start_time: float, end_time: float, move_id: int, move_type: int,
+               module_code: int, wafer_code: int, slot_id: int = 1):
+        """追加一条记录"""
+        size = self._size
+        if size == len(self._records):
+            self._reallocate(2 * len(self._records))
+        elif size < self._protected:
+            self._reallocate(len(self._records))
+        self._records[size] = (start_time, end_time, move_id, move_type, module_code, wafer_code, slot_id)
+        self._size = size + 1
+    
+    def extend(self, records: np.ndarray):
+        """追加一批MOVE_DTYPE记录"""
+        size = self._size + len(records)
+        if size > len(self._records):
+            self._reallocate(max(size, 2 * len(self._records)))
+        elif self._size < self._protected:
+            self._reallocate(len(self._records))
+        self._records[self._size:size] = records
+        self._size = size
+    
+    @property
+    def records(self) -> np.ndarray:
+        """当前记录的只读视图"""
+        view = self._records[:self._size]
+        view.flags.writeable = False
+        return view
+    
+    def sorted_records(self) -> np.ndarray:
+        """按(StartTime, MoveID)排序的记录"""
+        records = self._records[:self._size]
+        return records[np.lexsort((records['MoveID'], records['StartTime']))]
+    
+    def total_time(self) -> float:
+        """最晚结束时刻"""
+        if self._size == 0:
+            return 0.0
+        return float(self._records['EndTime'][:self._size].max())
+    
+    def to_dicts(self, sort: bool = False, records: Optional[np.ndarray] = None) -> List[Dict]:
+        """导出为MoveList的JSON字典格式"""
+        if records is None:
+            records = self.sorted_records() if sort else self._records[:self._size]
+        module_names, wafer_ids = self.module_names, self.wafer_ids
+        return [{
+            'StartTime': start_time,
+            'EndTime': end_time,
+            'MoveID': move_id,
+            'MoveType': move_type,
+            'ModuleName': module_names[module_code],
+            'MatID': wafer_ids[wafer_code],
+            'SlotID': slot_id
+        } for start_time, end_time, move_id, move_type, module_code, wafer_code, slot_id in records.tolist()]
+    
+    def clear(self):
+        """清空记录，缓冲区若被快照引用则在下次写入时复制"""
+        self._size = 0
+    
+    def snapshot(self) -> Tuple[np.ndarray, int]:
+        """导出记录状态，不复制记录"""
+        self._protected = max(self._protected, self._size)
+        return self._records, self._size
+    
+    def restore(self, state: Tuple[np.ndarray, int]):
+        """恢复记录状态，缓冲区可能被其它快照引用，整体视为受保护"""
+        self._records, self._size = state
+        self._protected = len(self._records)
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+批量观测构建
+每个决策时刻在FabState各列上一次向量化计算全部晶圆、腔室、机械臂的观测，写入预分配的缓冲区
+"""
+
+import numpy as np
+from typing import Dict
+
+from .fab_state import WAFER_STATUS_CODES, CHAMBER_STATUS_CODES
+from config.process_config import (ROUTE_TABLE, ROUTE_LENGTH_TABLE, OPTION_MASK_TABLE, OPTION_COUNT_TABLE,
+                                   MAX_ROUTE_STEPS)
+
+OBS_DIM = 20
+WAFER_OBS_DIM = 20
+CHAMBER_OBS_DIM = 15
+ARM_OBS_DIM = 18
+
+# 晶圆观测中的位置编码
+LOCATION_CODES = {
+    'LoadPort1': 1, 'LoadPort2': 2, 'LoadPort3': 3,
+    'LLA': 11, 'LLB': 12, 'LLC': 13, 'LLD': 14,
+    'PM1': 21, 'PM2': 22, 'PM3': 23, 'PM4': 24, 'PM5': 25,
+    'PM6': 26, 'PM7': 27, 'PM8': 28, 'PM9': 29, 'PM10': 30,
+    'TM1': 31, 'TM2_R1': 32, 'TM2_R2': 33, 'TM3_R1': 34, 'TM3_R2': 35
+}
+
+# 腔室状态编码（抽充气不单独编码）及有剩余时间的状态
+CHAMBER_STATUS_ENCODING = np.zeros(len(CHAMBER_STATUS_CODES), dtype=np.float32)
+for _status, _value in {'idle': 1, 'processing': 2, 'cleaning': 3, 'door_opening': 4, 'door_closing': 5}.items():
+    CHAMBER_STATUS_ENCODING[CHAMBER_STATUS_CODES[_status]] = _value
+CHAMBER_TIMED_STATUS = np.zeros(len(CHAMBER_STATUS_CODES), dtype=bool)
+CHAMBER_TIMED_STATUS[[CHAMBER_STATUS_CODES[status]
+                      for status in ('processing', 'cleaning', 'door_opening', 'door_closing')]] = True
+
+# 16位腔室掩码的置位数查表（np.bitwise_count需NumPy 2.0）
+POPCOUNT = np.array([bin(mask).count('1') for mask in range(1 << 16)], dtype=np.uint8)
+
+
+def fill_wafer_observations(out: np.ndarray, columns: Dict[str, np.ndarray], location_codes: np.ndarray,
+                            free_masks, current_times):
+    """按晶圆列计算晶圆观测，列可带任意前导维（如多副本的二维列）
+    
+    各维依次为：批次、编号、工艺步、路径长度、当前与下一目标腔室、状态、位置、进度、柔性选项数、
+    当前可用腔室数、归一化时间、等待晶圆数，其余为0。
+    free_masks与current_times为每个前导索引一个的空闲腔室位掩码与当前时刻。
+    """
+    type_ids, steps, status = columns['wafer_type'], columns['wafer_step'], columns['wafer_status']
+    route_lengths = ROUTE_LENGTH_TABLE[type_ids]
+    in_route = steps < route_lengths
+    clipped_steps = np.minimum(steps, MAX_ROUTE_STEPS - 1)
+    next_steps = np.minimum(steps + 1, MAX_ROUTE_STEPS - 1)
+    option_masks = np.where(in_route, OPTION_MASK_TABLE[type_ids, clipped_steps], 0).astype(np.uint16)
+    free_masks = np.asarray(free_masks, dtype=np.uint16)[..., None]
+    current_times = np.asarray(current_times, dtype=np.float64)[..., None]
+    waiting = (status == WAFER_STATUS_CODES['waiting']) & in_route
+    
+    out[...] = 0.0
+    out[..., 0] = columns['wafer_lot']
+    out[..., 1] = columns['wafer_num']
+    out[..., 2] = steps
+    out[..., 3] = route_lengths
+    out[..., 4] = np.where(in_route, ROUTE_TABLE[type_ids, clipped_steps], 0)
+    out[..., 5] = np.where(steps + 1 < route_lengths, ROUTE_TABLE[type_ids, next_steps], 0)
+    out[..., 6] = status + 1
+    out[..., 7] = location_codes
+    out[..., 8] = np.where(route_lengths > 0, steps / np.maximum(route_lengths, 1), 1.0)
+    out[..., 9] = np.where(in_route, OPTION_COUNT_TABLE[type_ids, clipped_steps], 0)
+    out[..., 10] = POPCOUNT[option_masks & free_masks]
+    out[..., 11] = current_times % 1000 / 1000.0
+    out[..., 12] = np.count_nonzero(waiting, axis=-1)[..., None]
+
+
+class ObservationBuilder:
+    """单环境的批量观测缓冲区
+    
+    缓冲区为(晶圆数+腔室数+机械臂数, OBS_DIM)，行依次为晶圆、腔室、机械臂，
+    各类对象的行号与其在FabState中的行号一致。环境状态版本或时刻变化后首次访问时整批重建，
+    智能体只读取自己的一行。
+    """
+    
+    def __init__(self, env):
+        self.env = env
+        num_wafers, num_chambers = len(env.wafers), len(env.chambers)
+        self.buffer = np.zeros((num_wafers + num_chambers + len(env.robot_arms), OBS_DIM), dtype=np.float32)
+        self.wafers = self.buffer[:num_wafers]
+        self.chambers = self.buffer[num_wafers:num_wafers + num_chambers]
+        self.arms = self.buffer[num_wafers + num_chambers:]
+        self._key = None
+        self._location_names = None
+        self._location_lookup = np.zeros(0, dtype=np.float32)
+    
+    def refresh(self, force: bool = False) -> 'ObservationBuilder':
+        """状态有变化时重建全部观测"""
+        key = (self.env.current_time, self.env.state_version)
+        if force or key != self._key:
+            self.build()
+            self._key = key
+        return self
+    
+    def _location_codes(self) -> np.ndarray:
+        """位置编码表，位置名称表变化时重建"""
+        names = self.env.state.location_names
+        if names is not self._location_names or len(names) != len(self._location_lookup):
+            self._location_names = names
+            self._location_lookup = np.array([LOCATION_CODES.get(name, 0) for name in names], dtype=np.float32)
+        return self._location_lookup
+    
+    def build(self):
+        """一次向量化计算全部观测"""
+        env = self.env
+        columns = env.state.columns
+        current_time = env.current_time
+        fill_wafer_observations(self.wafers, columns, self._location_codes()[columns['wafer_location']],
+                                env._free_mask.mask, current_time)
+        
+        # 腔室：编号、占用、门、需清洁、已处理片数、状态、空闲时长、剩余时间
+        chambers = self.chambers
+        status = columns['chamber_status']
+        chambers[:, 0] = columns['chamber_id']
+        chambers[:, 1] = columns['chamber_occupied']
+        chambers[:, 2] = columns['chamber_door_open']
+        chambers[:, 3] = columns['chamber_needs_cleaning']
+        chambers[:, 4] = columns['chamber_wafer_count']
+        chambers[:, 5] = CHAMBER_STATUS_ENCODING[status]
+        chambers[:, 6] = current_time - columns['chamber_last_activity_time']
+        chambers[:, 7] = np.where(CHAMBER_TIMED_STATUS[status],
+                                  np.maximum(0, columns['chamber_process_end_time'] - current_time), 0.0)
+        
+        # 机械臂：位置、是否持片、状态、剩余时间、所持晶圆批次/编号/工艺步，以及整厂等待晶圆数、空闲腔室数、时间
+        arms = self.arms
+        arm_status = columns['arm_status']
+        held = columns['arm_wafer']
+        holding = (held >= 0) & (held < len(self.wafers))
+        held_rows = np.where(holding, held, 0)
+        arms[:, 0] = columns['arm_position']
+        arms[:, 1] = holding
+        arms[:, 2] = arm_status + 1
+        arms[:, 3] = np.where(arm_status != 0, np.maximum(0, columns['arm_action_end_time'] - current_time), 0.0)
+        arms[:, 4] = np.where(holding, columns['wafer_lot'][held_rows], 0)
+        arms[:, 5] = np.where(holding, columns['wafer_num'][held_rows], 0)
+        arms[:, 6] = np.where(holding, columns['wafer_step'][held_rows], 0)
+        arms[:, 12] = self.wafers[0, 12] if len(self.wafers) else 0
+        arms[:, 13] = bin(env._free_mask.mask).count('1')
+        arms[:, 14] = current_time % 1000
+    
+    def wafer(self, wafer) -> np.ndarray:
+        """晶圆观测（副本）"""
+        return self.wafers[wafer._row].copy()
+    
+    def chamber(self, chamber) -> np.ndarray:
+        """腔室观测（副本）"""
+        return self.chambers[chamber._row, :CHAMBER_OBS_DIM].copy()
+    
+    def arm(self, robot_arm) -> np.ndarray:
+        """机械臂观测（副本）"""
+        return self.arms[robot_arm._row, :ARM_OBS_DIM].copy()
\ No newline at end of file
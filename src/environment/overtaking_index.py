@@ -0,0 +1,63 @@
+"""
+超片约束索引
+按(批次, 工艺, 工艺步, 目标腔室)维护尚未进入该步的晶圆编号
+"""
+
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class OvertakingIndex:
+    """超片约束索引
+    
+    晶圆派发进入某一步的腔室时推进工艺步，因此仍停留在某一步的晶圆就是该步的待进入晶圆。
+    每个键下保存有序的待进入编号，最小编号即当前唯一允许进入的晶圆。
+    """
+    
+    def __init__(self, wafers: Iterable = ()):
+        self._pending: Dict[Tuple, List[int]] = {}
+        self.rebuild(wafers)
+    
+    @staticmethod
+    def _key(wafer, step: int) -> Optional[Tuple]:
+        """索引键，工艺已全部完成时为None"""
+        if step < len(wafer.process_route):
+            return (wafer.lot_id, wafer.process_type, step, wafer.process_route[step])
+        return None
+    
+    def rebuild(self, wafers: Iterable):
+        """根据晶圆当前工艺步重建索引"""
+        self._pending.clear()
+        for wafer in wafers:
+            wafer.overtaking_index = self
+            self.add(wafer, wafer.current_step)
+    
+    def add(self, wafer, step: int):
+        """登记晶圆在指定工艺步待进入"""
+        key = self._key(wafer, step)
+        if key is not None:
+            insort(self._pending.setdefault(key, []), wafer.wafer_num)
+    
+    def remove(self, wafer, step: int):
+        """移除晶圆在指定工艺步的登记"""
+        key = self._key(wafer, step)
+        pending = self._pending.get(key)
+        if pending:
+            position = bisect_left(pending, wafer.wafer_num)
+            if position < len(pending) and pending[position] == wafer.wafer_num:
+                del pending[position]
+    
+    def advance(self, wafer, old_step: int):
+        """晶圆由old_step推进到当前工艺步"""
+        self.remove(wafer, old_step)
+        self.add(wafer, wafer.current_step)
+    
+    def lowest_pending(self, wafer) -> Optional[int]:
+        """同键下待进入晶圆的最小编号"""
+        pending = self._pending.get(self._key(wafer, wafer.current_step))
+        return pending[0] if pending else None
+    
+    def is_first_pending(self, wafer) -> bool:
+        """晶圆是否为同批次同工艺同步中编号最小的待进入晶圆"""
+        lowest = self.lowest_pending(wafer)
+        return lowest is None or lowest >= wafer.wafer_num
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+调度重放与指标提取
+一次读入MoveList，以向量化的区间运算计算晶圆周期、在制品曲线、模块利用率、机械臂移动占比与排队时间
+"""
+
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+from .move_log import MOVE_DTYPE, MoveLog
+from config.equipment_config import MOVE_TYPES
+
+PICK, PLACE, TRANS, PROCESS = (MOVE_TYPES[name] for name in ('PICK', 'PLACE', 'TRANS', 'PROCESS'))
+
+
+def interval_union(groups: np.ndarray, starts: np.ndarray, ends: np.ndarray, num_groups: int) -> np.ndarray:
+    """各组区间并集的总长度
+    
+    各组按组号平移到互不重叠的时间段后排序，区间超出此前累计最远结束时刻的部分即为并集新增的长度。
+    """
+    if not len(starts):
+        return np.zeros(num_groups)
+    span = float(ends.max() - starts.min()) + 1.0
+    shifted_starts = starts + groups * span
+    shifted_ends = ends + groups * span
+    order = np.argsort(shifted_starts, kind='stable')
+    shifted_starts, shifted_ends = shifted_starts[order], shifted_ends[order]
+    reach = np.concatenate([[-np.inf], np.maximum.accumulate(shifted_ends)[:-1]])
+    added = np.maximum(shifted_ends - np.maximum(shifted_starts, reach), 0.0)
+    return np.bincount(groups[order], weights=added, minlength=num_groups)
+
+
+class ScheduleReplay:
+    """MoveList的一次性重放
+    
+    records为MOVE_DTYPE结构化数组，模块与晶圆为module_names、wafer_ids中的编号。
+    资源即模块，双臂机械手的两个手指与引擎一致按两条独立机械臂统计，汇总中只列出有移动记录的腔室与机械臂。
+    晶圆周期从首次取片开始到最后一次放片结束；排队时间为取片开始距该晶圆上一条取放或工艺移动结束的间隔，
+    紧接工艺之后的排队计入该工艺腔室。
+    """
+    
+    def __init__(self, records: np.ndarray, module_names: Sequence[str], wafer_ids: Sequence[str]):
+        self.records = records
+        self.wafer_ids = list(wafer_ids)
+        starts, ends = records['StartTime'].astype(np.float64), records['EndTime'].astype(np.float64)
+        move_types, modules = records['MoveType'], records['ModuleID'].astype(np.int64)
+        wafers = records['WaferID'].astype(np.int64)
+        self.makespan = float(ends.max()) if len(records) else 0.0
+        
+        # 每个模块（腔室或机械臂手指）是一个资源
+        self.resources = [str(name) for name in module_names]
+        resources = modules
+        num_resources = len(self.resources)
+        self.used_resources = np.flatnonzero(np.bincount(resources, minlength=num_resources)).tolist()
+        self.busy_time = interval_union(resources, starts, ends, num_resources)
+        travel = move_types == TRANS
+        self.travel_time = interval_union(resources[travel], starts[travel], ends[travel], num_resources)
+        
+        # 晶圆周期
+        num_wafers = len(self.wafer_ids)
+        picks, places = move_types == PICK, move_types == PLACE
+        first_pick = np.full(num_wafers, np.inf)
+        np.minimum.at(first_pick, wafers[picks], starts[picks])
+        last_place = np.full(num_wafers, -np.inf)
+        np.maximum.at(last_place, wafers[places], ends[places])
+        self.cycle_mask = np.isfinite(first_pick) & np.isfinite(last_place)
+        self.cycle_start, self.cycle_end = first_pick, last_place
+        self.cycle_times = np.where(self.cycle_mask, last_place - first_pick, np.nan)
+        
+        # 在制品曲线：同一时刻先离开后进入
+        times = np.concatenate([first_pick[self.cycle_mask], last_place[self.cycle_mask]])
+        deltas = np.concatenate([np.ones(self.cycle_mask.sum(), dtype=np.int64),
+                                 -np.ones(self.cycle_mask.sum(), dtype=np.int64)])
+        order = np.lexsort((deltas, times))
+        self.wip_times = times[order]
+        self.wip_levels = np.cumsum(deltas[order])
+        
+        # 排队时间
+        wafer_moves = np.flatnonzero(picks | places | (move_types == PROCESS))
+        order = wafer_moves[np.lexsort((records['MoveID'][wafer_moves], starts[wafer_moves], wafers[wafer_moves]))]
+        previous, current = order[:-1], order[1:]
+        queued = (wafers[previous] == wafers[current]) & (move_types[current] == PICK)
+        previous, current = previous[queued], current[queued]
+        self.queue_wafers = wafers[current]
+        self.queue_times = np.maximum(starts[current] - ends[previous], 0.0)
+        after_process = move_types[previous] == PROCESS
+        self.chamber_queue_time = np.bincount(resources[previous][after_process],
+                                              weights=self.queue_times[after_process], minlength=num_resources)
+        self.chamber_queue_count = np.bincount(resources[previous][after_process], minlength=num_resources)
+    
+    @classmethod
+    def from_move_log(cls, move_log: MoveLog) -> 'ScheduleReplay':
+        """直接读取环境的列式移动记录"""
+        return cls(move_log.records, move_log.module_names, move_log.wafer_ids)
+    
+    @classmethod
+    def from_move_list(cls, move_list: List[Dict]) -> 'ScheduleReplay':
+        """读取JSON字典格式的MoveList"""
+        count = len(move_list)
+        module_names, modules = np.unique([move['ModuleName'] for move in move_list], return_inverse=True)
+        wafer_ids, wafers = np.unique([move['MatID'] for move in move_list], return_inverse=True)
+        records = np.zeros(count, dtype=MOVE_DTYPE)
+        for field in ('StartTime', 'EndTime', 'MoveID', 'MoveType', 'SlotID'):
+            records[field] = np.fromiter((move[field] for move in move_list), dtype=records.dtype[field], count=count)
+        records['ModuleID'] = modules.reshape(-1)
+        records['WaferID'] = wafers.reshape(-1)
+        return cls(records, [str(name) for name in module_names], [str(wafer) for wafer in wafer_ids])
+    
+    def wip_at(self, times) -> np.ndarray:
+        """指定时刻的在制品数"""
+        positions = np.searchsorted(self.wip_times, np.asarray(times, dtype=np.float64), side='right')
+        return np.where(positions > 0, self.wip_levels[np.maximum(positions - 1, 0)], 0)
+    
+    def wip_profile(self) -> Tuple[np.ndarray, np.ndarray]:
+        """在制品阶梯曲线(变化时刻, 变化后的在制品数)"""
+        return self.wip_times, self.wip_levels
+    
+    def summary(self) -> Dict:
+        """汇总指标"""
+        cycle_times = self.cycle_times[self.cycle_mask]
+        makespan = self.makespan if self.makespan > 0 else 1.0
+        arms = [code for code in self.used_resources if self.resources[code].startswith('TM')]
+        chambers = [code for code in self.used_resources if not self.resources[code].startswith('TM')]
+        return {
+            'Makespan': self.makespan,
+            'Moves': len(self.records),
+            'Wafers': int(self.cycle_mask.sum()),
+            'CycleTime': {
+                'Mean': float(cycle_times.mean()) if len(cycle_times) else 0.0,
+                'Min': float(cycle_times.min()) if len(cycle_times) else 0.0,
+                'Max': float(cycle_times.max()) if len(cycle_times) else 0.0,
+            },
+            'WIP': {
+                # Little定律：平均在制品数 = 周期总和 / 完工时间
+                'Mean': float(cycle_times.sum() / makespan),
+                'Max': int(self.wip_levels.max()) if len(self.wip_levels) else 0,
+            },
+            'Utilization': {self.resources[code]: float(self.busy_time[code] / makespan)
+                            for code in self.used_resources},
+            'ArmTravelShare': {self.resources[code]: float(self.travel_time[code] / max(self.busy_time[code], 1e-9))
+                               for code in arms},
+            'QueueTime': {
+                'Mean': float(self.queue_times.mean()) if len(self.queue_times) else 0.0,
+                'Max': float(self.queue_times.max()) if len(self.queue_times) else 0.0,
+                'Total': float(self.queue_times.sum()),
+            },
+            'ChamberQueueTime': {self.resources[code]: float(self.chamber_queue_time[code]
+                                                            / max(self.chamber_queue_count[code], 1))
+                                 for code in chambers},
+        }
+
+
+def compare_schedules(schedules: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """对多个MoveList分别重放，返回各自的汇总指标"""
+    return {label: ScheduleReplay.from_move_list(move_list).summary() for label, move_list in schedules.items()}
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+流式结果写出
+仿真过程中分块把已确定的移动记录写入文件，汇总信息作为结尾写出
+"""
+
+import json
+import numpy as np
+from typing import Dict, Optional
+
+from .move_log import MoveLog
+
+RESULT_FORMATS = ('json', 'ndjson')
+
+
+class ResultWriter:
+    """流式结果写出器
+    
+    json格式写出与原结果文件相同结构的对象，MoveList每行一条，汇总字段跟在MoveList之后；
+    ndjson格式每行一条移动记录，最后一行为{"Summary": {...}}。
+    新搬运总是从当前时刻之后开始，因此开始时刻早于当前时刻的记录已经确定，
+    可以按(StartTime, MoveID)顺序先行写出。
+    """
+    
+    def __init__(self, filename: str, result_format: str = 'json', chunk_size: int = 4096):
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"未知的结果格式: {result_format}")
+        self.filename = filename
+        self.result_format = result_format
+        self.chunk_size = chunk_size
+        self.moves_written = 0
+        self._written_until = -np.inf  # 开始时刻早于此值的记录均已写出
+        self._scan_from = 0  # 此行之前的记录均已写出
+        self._checked_rows = 0
+        self._file = open(filename, 'w', encoding='utf-8')
+        if result_format == 'json':
+            self._file.write('{\n"MoveList": [')
+    
+    def __enter__(self) -> 'ResultWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._file.closed:
+            self._file.close()
+    
+    def maybe_flush(self, move_log: MoveLog, current_time: float):
+        """新增记录达到一个分块时，写出开始时刻早于当前时刻的记录"""
+        if len(move_log) - self._checked_rows >= self.chunk_size:
+            self.write_until(move_log, current_time)
+    
+    def write_until(self, move_log: MoveLog, until_time: Optional[float] = None):
+        """写出开始时刻早于until_time的全部未写记录，until_time为None时写出全部"""
+        records = move_log.records[self._scan_from:]
+        start_times = records['StartTime']
+        pending = start_times >= self._written_until
+        if until_time is not None:
+            pending &= start_times < until_time
+        chunk = records[pending]
+        chunk = chunk[np.lexsort((chunk['MoveID'], chunk['StartTime']))]
+        self._write_moves(move_log.to_dicts(records=chunk))
+        
+        if until_time is None:
+            self._scan_from += len(records)
+            self._written_until = np.inf
+        else:
+            later = np.flatnonzero(start_times >= until_time)
+            self._scan_from += int(later[0]) if len(later) else len(records)
+            self._written_until = until_time
+        self._checked_rows = len(move_log)
+    
+    def _write_moves(self, moves):
+        """按所选格式写出一批移动记录"""
+        if not moves:
+            return
+        lines = [json.dumps(move, ensure_ascii=False) for move in moves]
+        if self.result_format == 'json':
+            self._file.write(('\n' if self.moves_written == 0 else ',\n') + ',\n'.join(lines))
+        else:
+            self._file.write('\n'.join(lines) + '\n')
+        self.moves_written += len(moves)
+    
+    def close(self, move_log: MoveLog, summary: Dict):
+        """写出剩余记录与汇总信息并关闭文件"""
+        self.write_until(move_log)
+        if self.result_format == 'json':
+            trailer = json.dumps(summary, indent=2, ensure_ascii=False)
+            self._file.write('\n],\n' + trailer[trailer.index('{') + 1:].lstrip('\n'))
+        else:
+            self._file.write(json.dumps({'Summary': summary}, ensure_ascii=False) + '\n')
+        self._file.close()
+
+
+def load_results(filename: str) -> Dict:
+    """读取json或ndjson格式的结果文件，返回与run_simulation相同结构的字典"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        if not filename.endswith('.ndjson'):
+            return json.load(f)
+        result = {'MoveList': []}
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if 'Summary' in record:
+                    result.update(record['Summary'])
+                else:
+                    result['MoveList'].append(record)
+        return result
\ No newline at end of file
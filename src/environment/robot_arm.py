@@ -5,12 +5,27 @@
 
 import numpy as np
 from typing import Optional, List, Dict, Tuple
-from config.equipment_config import TM1_PARAMS, TM23_PARAMS, TM2_LAYOUT, TM3_LAYOUT
+from config.equipment_config import TM23_PARAMS
+from config.topology import DEFAULT_TOPOLOGY, Topology
+from .history import DEFAULT_HISTORY_POLICY, create_history
+from .fab_state import FabState, StateColumn, CodeColumn, WaferColumn, ARM_STATUS_CODES
 
 class RobotArm:
-    """机械臂智能体基类"""
+    """机械臂智能体基类
+    
+    动态状态存放在FabState的机械臂列中，以下属性为所在行的视图
+    """
+    
+    current_position = StateColumn('arm_position')
+    status = CodeColumn('arm_status', ARM_STATUS_CODES)
+    holding_wafer = WaferColumn('arm_wafer')
+    action_start_time = StateColumn('arm_action_start_time')
+    action_end_time = StateColumn('arm_action_end_time')
     
     def __init__(self, arm_id: str, arm_type: str):
+        # 独立的单行存储，环境构建后迁入共享存储
+        self._state, self._row = FabState(num_arms=1), 0
+        
         self.arm_id = arm_id
         self.arm_type = arm_type  # TM1, TM2, TM3
         
@@ -23,22 +38,27 @@ class RobotArm:
         self.action_start_time = 0.0
         self.action_end_time = 0.0
         
-        # 历史记录
-        self.move_history = []
+        # 布局与历史记录
+        self.set_topology(DEFAULT_TOPOLOGY)
+        self.set_history_policy(DEFAULT_HISTORY_POLICY)
         
+    def set_topology(self, topology: Topology):
+        """设置设备拓扑，可达模块与移动时间均由拓扑查表"""
+        self.topology = topology
+        self.accessible_chambers = list(topology.positions[self.arm_type])
+    
+    def set_history_policy(self, policy: str):
+        """设置历史记录策略：off、ring:N或full"""
+        self.move_history = create_history(policy)
+        self.record_history = policy != 'off'
+    
     def can_perform_action(self) -> bool:
         """检查是否可以执行动作"""
         return self.status == 'idle'
     
     def calculate_move_time(self, from_pos: int, to_pos: int) -> float:
-        """计算移动时间"""
-        if self.arm_type == 'TM1':
-            return TM1_PARAMS['move_time']
-        else:
-            # TM2/TM3 八边形布局
-            positions = 8
-            distance = min(abs(to_pos - from_pos), positions - abs(to_pos - from_pos))
-            return distance * TM23_PARAMS['move_time_adjacent']
+        """计算移动时间：查拓扑编译出的移动时间表"""
+        return self.topology.move_time(self.arm_type, from_pos, to_pos)
     
     def start_move(self, target_position: int, current_time: float):
         """开始移动"""
@@ -48,38 +68,45 @@ class RobotArm:
         self.action_end_time = current_time + move_time
         
         # 记录移动历史
-        self.move_history.append({
-            'from_pos': self.current_position,
-            'to_pos': target_position,
-            'start_time': current_time,
-            'end_time': self.action_end_time,
-            'action_type': 'move'
-        })
+        if self.record_history:
+            self.move_history.append({
+                'from_pos': self.current_position,
+                'to_pos': target_position,
+                'start_time': current_time,
+                'end_time': self.action_end_time,
+                'action_type': 'move'
+            })
     
     def finish_move(self, target_position: int, current_time: float):
         """完成移动"""
         self.current_position = target_position
         self.status = 'idle'
     
+    def get_pick_time(self) -> float:
+        """获取单片取片时间"""
+        return self.topology.pick_times[self.arm_type]
+    
+    def get_place_time(self) -> float:
+        """获取单片放片时间"""
+        return self.topology.place_times[self.arm_type]
+    
     def start_pick(self, wafer, current_time: float):
         """开始取晶圆"""
-        if self.arm_type == 'TM1':
-            pick_time = TM1_PARAMS['pick_time']
-        else:
-            pick_time = TM23_PARAMS['pick_time_single']
+        pick_time = self.get_pick_time()
         
         self.status = 'picking'
         self.action_start_time = current_time
         self.action_end_time = current_time + pick_time
         
         # 记录历史
-        self.move_history.append({
-            'wafer_id': wafer.wafer_id,
-            'start_time': current_time,
-            'end_time': self.action_end_time,
-            'action_type': 'pick',
-            'position': self.current_position
-        })
+        if self.record_history:
+            self.move_history.append({
+                'wafer_id': wafer.wafer_id,
+                'start_time': current_time,
+                'end_time': self.action_end_time,
+                'action_type': 'pick',
+                'position': self.current_position
+            })
     
     def finish_pick(self, wafer, current_time: float):
         """完成取晶圆"""
@@ -90,17 +117,14 @@ class RobotArm:
     
     def start_place(self, current_time: float):
         """开始放晶圆"""
-        if self.arm_type == 'TM1':
-            place_time = TM1_PARAMS['place_time']
-        else:
-            place_time = TM23_PARAMS['place_time_single']
+        place_time = self.get_place_time()
         
         self.status = 'placing'
         self.action_start_time = current_time
         self.action_end_time = current_time + place_time
         
         # 记录历史
-        if self.holding_wafer:
+        if self.record_history and self.holding_wafer:
             self.move_history.append({
                 'wafer_id': self.holding_wafer.wafer_id,
                 'start_time': current_time,
@@ -110,9 +134,10 @@ class RobotArm:
             })
     
     def finish_place(self, target_chamber, current_time: float):
-        """完成放晶圆"""
+        """完成放晶圆，目标可以是腔室对象或LoadPort名称"""
         if self.holding_wafer:
-            self.holding_wafer.current_location = target_chamber.chamber_name
+            self.holding_wafer.current_location = getattr(
+                target_chamber, 'chamber_name', target_chamber)
             self.holding_wafer.status = 'waiting'
             self.holding_wafer = None
         self.status = 'idle'
@@ -160,32 +185,63 @@ class TM1Arm(RobotArm):
     
     def __init__(self):
         super().__init__('TM1', 'TM1')
-        self.accessible_chambers = ['LoadPort1', 'LoadPort2', 'LoadPort3', 'LLA']
 
 
-class TM2Arm(RobotArm):
+class DualRobotArm(RobotArm):
+    """TM2/TM3双臂机械手的共同基类：换片操作"""
+    
+    def get_swap_time(self) -> float:
+        """换片时间：空臂取出成品晶圆后另一臂放入所持晶圆，中间无需旋转"""
+        return self.get_pick_time() + self.get_place_time()
+    
+    def finish_swap(self, picked_wafer, target_chamber, current_time: float):
+        """完成换片：所持晶圆留在腔室内，取出的成品晶圆改由机械臂持有"""
+        placed_wafer = self.holding_wafer
+        if self.record_history and placed_wafer:
+            self.move_history.append({
+                'wafer_ids': [picked_wafer.wafer_id, placed_wafer.wafer_id],
+                'start_time': current_time - self.get_swap_time(),
+                'end_time': current_time,
+                'action_type': 'swap',
+                'position': self.layout[target_chamber.chamber_name]
+            })
+        
+        if placed_wafer:
+            placed_wafer.current_location = target_chamber.chamber_name
+            placed_wafer.status = 'waiting'
+        self.holding_wafer = picked_wafer
+        self.second_wafer = None
+        self.status = 'idle'
+        
+        picked_wafer.current_location = self.arm_id
+        picked_wafer.status = 'moving'
+
+
+class TM2Arm(DualRobotArm):
     """TM2双臂机械手"""
     
+    second_wafer = WaferColumn('arm_second_wafer')
+    
     def __init__(self, arm_index: int):
         super().__init__(f'TM2_R{arm_index}', 'TM2')
         self.arm_index = arm_index
-        self.layout = TM2_LAYOUT
-        self.accessible_chambers = list(TM2_LAYOUT.keys())
         
         # 双臂特殊功能
         self.can_hold_two_wafers = True
         self.second_wafer = None
     
+    @property
+    def layout(self) -> Dict[str, int]:
+        """腔室到八边形位置的映射"""
+        return self.topology.positions[self.arm_type]
+    
     def get_chamber_position(self, chamber_name: str) -> Optional[int]:
         """获取腔室在八边形中的位置"""
         return self.layout.get(chamber_name)
     
     def get_chamber_at_position(self, position: int) -> Optional[str]:
         """获取指定位置的腔室名称"""
-        for chamber, pos in self.layout.items():
-            if pos == position:
-                return chamber
-        return None
+        return self.topology.module_at(self.arm_type, position)
     
     def start_double_pick(self, wafer1, wafer2, current_time: float):
         """开始双晶圆取操作"""
@@ -195,13 +251,14 @@ class TM2Arm(RobotArm):
         self.action_end_time = current_time + pick_time
         
         # 记录历史
-        self.move_history.append({
-            'wafer_ids': [wafer1.wafer_id, wafer2.wafer_id],
-            'start_time': current_time,
-            'end_time': self.action_end_time,
-            'action_type': 'double_pick',
-            'position': self.current_position
-        })
+        if self.record_history:
+            self.move_history.append({
+                'wafer_ids': [wafer1.wafer_id, wafer2.wafer_id],
+                'start_time': current_time,
+                'end_time': self.action_end_time,
+                'action_type': 'double_pick',
+                'position': self.current_position
+            })
     
     def finish_double_pick(self, wafer1, wafer2, current_time: float):
         """完成双晶圆取操作"""
@@ -222,19 +279,15 @@ class TM2Arm(RobotArm):
         self.action_end_time = current_time + place_time
         
         # 记录历史
-        wafer_ids = []
-        if self.holding_wafer:
-            wafer_ids.append(self.holding_wafer.wafer_id)
-        if self.second_wafer:
-            wafer_ids.append(self.second_wafer.wafer_id)
-        
-        self.move_history.append({
-            'wafer_ids': wafer_ids,
-            'start_time': current_time,
-            'end_time': self.action_end_time,
-            'action_type': 'double_place',
-            'position': self.current_position
-        })
+        if self.record_history:
+            wafer_ids = [wafer.wafer_id for wafer in (self.holding_wafer, self.second_wafer) if wafer]
+            self.move_history.append({
+                'wafer_ids': wafer_ids,
+                'start_time': current_time,
+                'end_time': self.action_end_time,
+                'action_type': 'double_place',
+                'position': self.current_position
+            })
     
     def finish_double_place(self, target_chamber1, target_chamber2, current_time: float):
         """完成双晶圆放操作"""
@@ -249,31 +302,32 @@ class TM2Arm(RobotArm):
             self.second_wafer = None
         
         self.status = 'idle'
-
-
-class TM3Arm(RobotArm):
+    
+class TM3Arm(DualRobotArm):
     """TM3双臂机械手"""
     
+    second_wafer = WaferColumn('arm_second_wafer')
+    
     def __init__(self, arm_index: int):
         super().__init__(f'TM3_R{arm_index}', 'TM3')
         self.arm_index = arm_index
-        self.layout = TM3_LAYOUT
-        self.accessible_chambers = list(TM3_LAYOUT.keys())
         
         # 双臂特殊功能
         self.can_hold_two_wafers = True
         self.second_wafer = None
     
+    @property
+    def layout(self) -> Dict[str, int]:
+        """腔室到八边形位置的映射"""
+        return self.topology.positions[self.arm_type]
+    
     def get_chamber_position(self, chamber_name: str) -> Optional[int]:
         """获取腔室在八边形中的位置"""
         return self.layout.get(chamber_name)
     
     def get_chamber_at_position(self, position: int) -> Optional[str]:
         """获取指定位置的腔室名称"""
-        for chamber, pos in self.layout.items():
-            if pos == position:
-                return chamber
-        return None
+        return self.topology.module_at(self.arm_type, position)
     
     # 双臂操作方法与TM2Arm相同
     def start_double_pick(self, wafer1, wafer2, current_time: float):
@@ -0,0 +1,146 @@
+"""
+调度鲁棒性评估
+把MoveList还原为前后约束网络，按时长分布一次采样大量场景，以NumPy数组整批重放
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from config.equipment_config import MOVE_TYPES
+
+DISTRIBUTIONS = ('lognormal', 'normal', 'uniform')
+DEFAULT_VARIABILITY = {'PROCESS': 0.05}  # 移动类型 -> 时长的变异系数
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+# 开关门、抽充气、清洁只属于腔室，不构成晶圆的先后关系
+CHAMBER_ONLY_TYPES = [MOVE_TYPES[name] for name in ('PREPARE', 'COMPLETE', 'PUMP', 'VENT', 'CLEAN')]
+
+
+def sample_factors(distribution: str, cv: float, shape, rng: np.random.Generator) -> np.ndarray:
+    """均值为1、变异系数为cv的非负时长倍率"""
+    if distribution == 'lognormal':
+        sigma = np.sqrt(np.log1p(cv * cv))
+        return rng.lognormal(-sigma * sigma / 2, sigma, shape)
+    if distribution == 'normal':
+        return np.maximum(rng.normal(1.0, cv, shape), 0.0)
+    if distribution == 'uniform':
+        half_width = cv * np.sqrt(3.0)
+        return np.maximum(rng.uniform(1.0 - half_width, 1.0 + half_width, shape), 0.0)
+    raise ValueError(f"未知的时长分布: {distribution}")
+
+
+class PrecedenceNetwork:
+    """MoveList的前后约束网络
+    
+    移动按计划开始时刻排序，每条移动至多有两个紧前移动：同一资源（腔室或机械臂）上的前一条移动，
+    以及同一晶圆的前一条搬运或工艺移动。约束为 开始 >= 紧前结束 + lag，lag取计划中两者的间隔与0
+    的较小值，保留计划中的重叠（如机械臂旋转时腔室开门）。重放时保持各资源上的移动顺序，
+    每条移动不早于计划开始（右移），时长不变时重放结果与计划完全一致。
+    """
+    
+    def __init__(self, move_list: List[Dict]):
+        count = len(move_list)
+        start = np.fromiter((move['StartTime'] for move in move_list), dtype=np.float64, count=count)
+        end = np.fromiter((move['EndTime'] for move in move_list), dtype=np.float64, count=count)
+        move_id = np.fromiter((move['MoveID'] for move in move_list), dtype=np.int64, count=count)
+        order = np.lexsort((move_id, start))
+        
+        self.num_moves = count
+        self.start = start[order]
+        self.end = end[order]
+        self.duration = self.end - self.start
+        self.move_type = np.fromiter((move_list[i]['MoveType'] for i in order), dtype=np.int8, count=count)
+        module_names = [move_list[i]['ModuleName'] for i in order]
+        # 资源按完整ModuleName区分，双臂机械手的两个手指是两条相互独立的链
+        self.resources, resource_codes = np.unique(module_names, return_inverse=True)
+        self.resource_codes = resource_codes.reshape(-1)
+        _, wafer_codes = np.unique([move_list[i]['MatID'] for i in order], return_inverse=True)
+        
+        # 第0列为资源链上的紧前移动，第1列为晶圆链上的紧前移动，没有时指向哨兵行count
+        wafer_moves = ~np.isin(self.move_type, CHAMBER_ONLY_TYPES)
+        self.predecessors = np.stack([
+            self._chain_predecessors(self.resource_codes, np.ones(count, dtype=bool)),
+            self._chain_predecessors(wafer_codes.reshape(-1), wafer_moves),
+        ], axis=1)
+        has_predecessor = self.predecessors < count
+        gaps = self.start[:, None] - self.end[np.minimum(self.predecessors, max(count - 1, 0))]
+        self.lags = np.where(has_predecessor, np.minimum(gaps, 0.0), 0.0)
+    
+    def _chain_predecessors(self, keys: np.ndarray, members: np.ndarray) -> np.ndarray:
+        """同键的成员移动按排序后的先后连成链，返回各移动在链上的前一条"""
+        predecessors = np.full(self.num_moves, self.num_moves, dtype=np.int64)
+        indices = np.flatnonzero(members)
+        chain = indices[np.argsort(keys[indices], kind='stable')]
+        same = keys[chain[1:]] == keys[chain[:-1]]
+        predecessors[chain[1:][same]] = chain[:-1][same]
+        return predecessors
+    
+    def sample_durations(self, num_scenarios: int, variability: Dict[str, float],
+                         distribution: str, rng: np.random.Generator) -> np.ndarray:
+        """按移动类型的变异系数采样各场景的移动时长，返回(移动数, 场景数)"""
+        durations = np.repeat(self.duration[:, None], num_scenarios, axis=1)
+        for name, cv in variability.items():
+            if name not in MOVE_TYPES:
+                raise ValueError(f"未知的移动类型: {name}")
+            rows = np.flatnonzero(self.move_type == MOVE_TYPES[name])
+            if cv > 0 and len(rows):
+                durations[rows] *= sample_factors(distribution, cv, (len(rows), num_scenarios), rng)
+        return durations
+    
+    def replay(self, durations: np.ndarray) -> np.ndarray:
+        """按给定时长(移动数, 场景数)整批重放各场景，返回各移动的结束时刻"""
+        count, num_scenarios = durations.shape
+        ends = np.empty((count + 1, num_scenarios))
+        ends[count] = -np.inf
+        start = self.start.tolist()
+        for j, (a, b), (lag_a, lag_b) in zip(range(count), self.predecessors.tolist(), self.lags.tolist()):
+            row = ends[j]
+            np.maximum(ends[a] + lag_a, ends[b] + lag_b, out=row)
+            np.maximum(row, start[j], out=row)
+            row += durations[j]
+        return ends[:count]
+
+
+def evaluate_robustness(move_list: List[Dict], num_scenarios: int = 1000,
+                        variability: Optional[Dict[str, float]] = None, distribution: str = 'lognormal',
+                        percentiles: Sequence[float] = DEFAULT_PERCENTILES, seed: Optional[int] = None,
+                        max_cells: int = 1 << 23) -> Dict:
+    """蒙特卡洛评估调度在时长波动下的表现
+    
+    variability为移动类型名到时长变异系数的映射（默认只有工艺时间波动），distribution为lognormal、
+    normal或uniform。场景按批重放，每批的移动数×场景数不超过max_cells。
+    返回完工时间的均值、标准差与各分位数，以及各腔室移动相对计划结束时刻的平均延误（场景均值与P95）。
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"未知的时长分布: {distribution}")
+    variability = DEFAULT_VARIABILITY if variability is None else variability
+    network = PrecedenceNetwork(move_list)
+    rng = np.random.default_rng(seed)
+    
+    chambers = [code for code, name in enumerate(network.resources) if not name.startswith('TM')]
+    moves_per_resource = np.bincount(network.resource_codes, minlength=len(network.resources))
+    by_resource = np.argsort(network.resource_codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(moves_per_resource)[:-1]])
+    batch_size = max(1, min(num_scenarios, max_cells // max(network.num_moves, 1)))
+    makespans, lateness = [], []
+    for batch_start in range(0, num_scenarios, batch_size):
+        size = min(batch_size, num_scenarios - batch_start)
+        ends = network.replay(network.sample_durations(size, variability, distribution, rng))
+        makespans.append(ends.max(axis=0) if network.num_moves else np.zeros(size))
+        # 各资源上移动的平均延误，(资源数, 场景数)
+        delay = np.add.reduceat((ends - network.end[:, None])[by_resource], offsets, axis=0)
+        lateness.append(delay / moves_per_resource[:, None])
+    makespans = np.concatenate(makespans)
+    lateness = np.concatenate(lateness, axis=1)
+    
+    return {
+        'PlannedMakespan': float(network.end.max()) if network.num_moves else 0.0,
+        'Scenarios': num_scenarios,
+        'Distribution': distribution,
+        'Variability': dict(variability),
+        'MakespanMean': float(makespans.mean()),
+        'MakespanStd': float(makespans.std()),
+        'MakespanPercentiles': {f'P{p:g}': float(np.percentile(makespans, p)) for p in percentiles},
+        'ChamberLateness': {str(network.resources[code]): {'Mean': float(lateness[code].mean()),
+                                                          'P95': float(np.percentile(lateness[code], 95))}
+                            for code in chambers},
+    }
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""
+调度校验
+不经仿真直接检查MoveList是否满足引擎的规则：模块上的移动不重叠、按工艺路径走完、腔室同时只容一片、
+工艺时长、超片约束与PM清洁，用于检查不由引擎逐个决策生成的调度（循环展开、MILP解）
+"""
+
+from bisect import bisect_left
+from typing import Dict, List
+
+from config.equipment_config import MOVE_TYPES, CLEAN_PARAMS
+from config.process_config import PROCESS_TIME_TABLE
+
+PICK, PLACE, TRANS, PREPARE, COMPLETE, PROCESS, CLEAN = (
+    MOVE_TYPES[name] for name in ('PICK', 'PLACE', 'TRANS', 'PREPARE', 'COMPLETE', 'PROCESS', 'CLEAN'))
+TOLERANCE = 1e-6
+
+
+def schedule_violations(env, move_list: List[Dict]) -> List[Dict]:
+    """检查MoveList，返回与引擎constraint_violations相同格式的违规列表，空列表表示全部满足
+    
+    晶圆的第k次放片与第k次开关门完成对应路径第k步的腔室，第k+1次取片把它取走；
+    腔室从放片开始到取片结束被该晶圆占用。开门（PREPARE）可与前一动作重叠，不参与重叠检查。
+    引擎在派发时检查超片与空闲清洁，派发时刻取为取片前同一晶圆空手移动的开始；取片时机械臂已持有
+    另一片（换片）则沿用那一片的派发时刻。
+    """
+    violations = []
+    moves = sorted(move_list, key=lambda move: (move['StartTime'], move['MoveID']))
+    
+    # 同一模块（腔室或机械臂手指）上的移动不重叠
+    reach = {}
+    for move in moves:
+        if move['MoveType'] == PREPARE:
+            continue
+        name = move['ModuleName']
+        if move['StartTime'] < reach.get(name, float('-inf')) - TOLERANCE:
+            violations.append({'type': 'overlap', 'wafer_id': move['MatID'], 'chamber': name,
+                               'time': move['StartTime']})
+        reach[name] = max(reach.get(name, float('-inf')), move['EndTime'])
+    
+    by_wafer = {}
+    for move in moves:
+        by_wafer.setdefault(move['MatID'], []).append(move)
+    held = {}
+    for wafer_moves in by_wafer.values():
+        picks = [move for move in wafer_moves if move['MoveType'] == PICK]
+        places = [move for move in wafer_moves if move['MoveType'] == PLACE]
+        for pick, place in zip(picks, places):
+            held.setdefault(pick['ModuleName'], []).append((pick['StartTime'], place['EndTime'], pick))
+    for intervals in held.values():
+        intervals.sort(key=lambda interval: interval[0])
+    held_starts = {arm: [start for start, _, _ in intervals] for arm, intervals in held.items()}
+    travels = {(move['ModuleName'], move['MatID'], move['EndTime']): move['StartTime']
+               for move in moves if move['MoveType'] == TRANS}
+    
+    def dispatched(pick):
+        arm, start = pick['ModuleName'], pick['StartTime']
+        # 双手指机械臂同时至多持有两片，只需看此前最近的两次取片
+        index = bisect_left(held_starts.get(arm, []), start - TOLERANCE)
+        for _, held_end, other in held.get(arm, [])[max(0, index - 2):index]:
+            if start < held_end - TOLERANCE:
+                return dispatched(other)
+        return travels.get((arm, pick['MatID'], start), start)
+    
+    residences, entries, dispatches = {}, {}, {}
+    for wafer in env.wafers:
+        wafer_moves = by_wafer.get(wafer.wafer_id, [])
+        picks = [move for move in wafer_moves if move['MoveType'] == PICK]
+        places = [move for move in wafer_moves if move['MoveType'] == PLACE]
+        visits = [move['ModuleName'] for move in wafer_moves
+                  if move['MoveType'] == COMPLETE and move['ModuleName'] in env.chambers]
+        options = env._step_option_names[wafer.process_type_id]
+        if (len(visits) != len(options) or len(picks) != len(options) + 1 or len(places) != len(options) + 1
+                or any(name not in names for name, names in zip(visits, options))):
+            violations.append({'type': 'route', 'wafer_id': wafer.wafer_id, 'chamber': None,
+                               'time': wafer_moves[-1]['EndTime'] if wafer_moves else 0.0})
+            continue
+        
+        processes = [(move['ModuleName'], move['EndTime'] - move['StartTime']) for move in wafer_moves
+                     if move['MoveType'] == PROCESS]
+        expected = [(name, PROCESS_TIME_TABLE.item(wafer.process_type_id, step))
+                    for step, name in enumerate(visits) if PROCESS_TIME_TABLE.item(wafer.process_type_id, step) > 0]
+        if len(processes) != len(expected) or any(
+                name != expected_name or abs(duration - expected_duration) > TOLERANCE
+                for (name, duration), (expected_name, expected_duration) in zip(processes, expected)):
+            violations.append({'type': 'process', 'wafer_id': wafer.wafer_id, 'chamber': None,
+                               'time': picks[-1]['StartTime']})
+        
+        for step, name in enumerate(visits):
+            residences.setdefault(name, []).append((places[step]['StartTime'], picks[step + 1]['EndTime'],
+                                                    wafer.wafer_id))
+            if name.startswith('PM'):
+                dispatch_time = dispatched(picks[step])
+                dispatches.setdefault(name, []).append((dispatch_time, places[step]['StartTime'], wafer.wafer_id))
+                key = wafer.lot_id, wafer.process_type_id, step, tuple(options[step])
+                entries.setdefault(key, []).append((wafer.wafer_num, dispatch_time, wafer.wafer_id, name))
+    
+    # 腔室同时只容一片
+    for name, intervals in residences.items():
+        intervals.sort()
+        for (_, end, _), (start, _, wafer_id) in zip(intervals, intervals[1:]):
+            if start < end - TOLERANCE:
+                violations.append({'type': 'occupied', 'wafer_id': wafer_id, 'chamber': name, 'time': start})
+    
+    # 超片约束：同批次同工艺同步，编号小的晶圆先取片送入PM
+    for group in entries.values():
+        group.sort()
+        latest = float('-inf')
+        for _, dispatch_time, wafer_id, name in group:
+            if dispatch_time < latest - TOLERANCE:
+                violations.append({'type': 'overtaking', 'wafer_id': wafer_id, 'chamber': name,
+                                   'time': dispatch_time})
+            latest = max(latest, dispatch_time)
+    
+    # PM清洁：处理满片数或切换工艺前须清洁；向空PM派发时距上次活动（开关门结束、工艺开始与结束、清洁结束、
+    # 取走）已空闲过久须先空闲清洁，即派发后、放片前结束的一次清洁；PM内仍有晶圆的换片不检查空闲
+    if env.cleaning != 'off':
+        idle_threshold = CLEAN_PARAMS['idle_threshold']
+        activity, cleans = {}, {}
+        for move in moves:
+            if move['ModuleName'].startswith('PM') and move['MoveType'] in (COMPLETE, PROCESS, CLEAN):
+                activity.setdefault(move['ModuleName'], []).append(move['EndTime'])
+                if move['MoveType'] == PROCESS:
+                    activity[move['ModuleName']].append(move['StartTime'])
+                if move['MoveType'] == CLEAN:
+                    cleans.setdefault(move['ModuleName'], []).append(move['EndTime'])
+        for name, intervals in residences.items():
+            activity.setdefault(name, []).extend(end for _, end, _ in intervals)
+        for name, group in dispatches.items():
+            ends = activity.get(name, [])
+            for dispatch_time, place_time, wafer_id in group:
+                if any(start < dispatch_time - TOLERANCE and dispatch_time < end - TOLERANCE
+                       for start, end, _ in residences[name]):
+                    continue
+                last = max((end for end in ends if end <= dispatch_time + TOLERANCE), default=0.0)
+                if dispatch_time - last < idle_threshold - TOLERANCE or any(
+                        dispatch_time < end and end <= place_time + TOLERANCE for end in cleans.get(name, [])):
+                    continue
+                violations.append({'type': 'clean', 'wafer_id': wafer_id, 'chamber': name, 'time': dispatch_time})
+        
+        types = {wafer.wafer_id: wafer.process_type_id for wafer in env.wafers}
+        count, last_type = {}, {}
+        for move in moves:
+            name = move['ModuleName']
+            if not name.startswith('PM'):
+                continue
+            if move['MoveType'] == CLEAN:
+                count[name], last_type[name] = 0, None
+            elif move['MoveType'] == PROCESS:
+                type_id = types.get(move['MatID'])
+                if (count.get(name, 0) >= CLEAN_PARAMS['wafer_count_threshold']
+                        or last_type.get(name) not in (None, type_id)):
+                    violations.append({'type': 'clean', 'wafer_id': move['MatID'], 'chamber': name,
+                                       'time': move['StartTime']})
+                count[name], last_type[name] = count.get(name, 0) + 1, type_id
+    return violations
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+多副本向量化环境
+同一任务的N个相互独立的副本共享二维NumPy状态列，观测、奖励、完成标志与动作掩码按副本堆叠、整批计算；
+事件推进仍由各副本的FabEnvironment逐个执行，不是批量推进。ParallelVecFabEnv把副本分片到多个工作进程，
+在多核机器上并行推进
+"""
+
+import multiprocessing
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .fab_environment import FabEnvironment
+from .fab_state import FabState
+from .deadlock import DEADLOCK_PENALTY
+from .observation import WAFER_OBS_DIM, LOCATION_CODES, fill_wafer_observations
+from config.process_config import ROUTE_LENGTH_TABLE, OPTION_MASK_TABLE, STEP_OPTION_LISTS
+
+WAFER_ACTION_DIM = 5  # 等待、选择柔性腔室1-4
+
+
+class VecFabEnv:
+    """多副本向量化环境
+    
+    每个副本是一个FabEnvironment，其FabState各列是共享二维数组中对应行的视图，
+    整批观测直接在二维列上一次计算；派发与事件推进按副本依次调用FabEnvironment，
+    单进程下的吞吐量与逐个运行FabEnvironment相当，多核加速由ParallelVecFabEnv提供。智能体为各片晶圆，动作为(N, 晶圆数)的整数数组：
+    0表示等待，k表示选择当前工艺步第k个柔性腔室。一步对应一个决策时刻，执行全部可立即派发的选择后
+    跳到下一个决策时刻（与训练器的跳时模式相同）。奖励为该步推进的仿真时长的相反数，
+    一回合累计奖励即为负的完工时间，因死锁终止的副本另扣DEADLOCK_PENALTY。返回的观测与掩码数组在下一步被原地覆盖。
+    """
+    
+    def __init__(self, task_name: str, num_envs: int, max_wip: Optional[int] = None,
+                 history: str = 'off'):
+        template = FabEnvironment(task_name, max_wip, history=history)
+        self.num_envs = num_envs
+        self.num_agents = len(template.wafers)
+        self.columns, states = FabState.batch(num_envs, self.num_agents, len(template.chambers),
+                                              len(template.robot_arms))
+        self.envs = [FabEnvironment(task_name, max_wip, history=history, state=state) for state in states]
+        self._initial_snapshot = template.snapshot()
+        
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self._observations = np.zeros((num_envs, self.num_agents, WAFER_OBS_DIM), dtype=np.float32)
+        self._masks = np.zeros((num_envs, self.num_agents, WAFER_ACTION_DIM), dtype=bool)
+        self._masks[..., 0] = True
+        self._times = np.zeros(num_envs, dtype=np.float64)
+    
+    def reset(self, indices: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """把指定副本（默认全部）恢复到初始状态并推进到首个决策时刻，返回(观测, 动作掩码)"""
+        if indices is None:
+            indices = range(self.num_envs)
+        for i in indices:
+            env = self.envs[i]
+            env.restore(self._initial_snapshot)
+            self.dones[i] = False
+            self._advance_to_decision(i)
+        return self._update_observations(), self._masks
+    
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """所有副本执行一个决策时刻，返回(观测, 奖励, 完成标志, 动作掩码)
+        
+        掩码外或超出[0, WAFER_ACTION_DIM)的动作按等待处理；已完成的副本忽略动作，奖励为0，直到reset。
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        actions = np.where((actions >= 0) & (actions < WAFER_ACTION_DIM), actions, 0)
+        chosen = np.take_along_axis(self._masks, actions[..., None], axis=-1)[..., 0] & (actions > 0)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        
+        for i, env in enumerate(self.envs):
+            if self.dones[i]:
+                continue
+            start_time = env.current_time
+            dispatched = 0
+            for row in np.flatnonzero(chosen[i]).tolist():
+                wafer = env.wafers[row]
+                option = STEP_OPTION_LISTS[wafer.process_type_id][wafer.current_step][actions[i, row] - 1]
+                # 同一时刻先派发的搬运可能占用机械臂或腔室，dispatch_wafer会重新检查
+                dispatched += env.dispatch_wafer(wafer, env._chambers_by_id[option])
+            if not dispatched:
+                # 本决策时刻全部选择等待，推迟到下一个事件
+                env.advance_to_next_event()
+            self._advance_to_decision(i)
+            rewards[i] = start_time - env.current_time
+            if env.deadlocked:
+                rewards[i] -= DEADLOCK_PENALTY
+        
+        self.dones |= np.array([env.is_done() or env.is_deadlocked() for env in self.envs])
+        return self._update_observations(), rewards, self.dones.copy(), self._masks
+    
+    def _advance_to_decision(self, i: int):
+        """推进副本i到下一个决策时刻并同时填好其动作掩码
+        
+        与FabEnvironment.advance_to_next_decision相同，但判断是否有决策时算出的可送入腔室直接写入掩码，
+        不再重复检查。无事件可推进且无决策可做（停滞）或已死锁的副本标记为完成。
+        """
+        env = self.envs[i]
+        self._masks[i, :, 1:] = False
+        env.dispatch_exits()
+        while not env.is_done():
+            if env.deadlocked:
+                self.dones[i] = True
+                return
+            if self._update_mask(i):
+                return
+            if not env.advance_to_next_event():
+                self.dones[i] = True
+                return
+            env.dispatch_exits()
+    
+    def _update_mask(self, i: int) -> bool:
+        """重算副本i的动作掩码，返回是否存在非等待动作"""
+        env = self.envs[i]
+        masks = self._masks[i]
+        # 先用空闲腔室位掩码整体筛掉当前工艺步无空闲腔室的候选晶圆
+        steps, type_ids = env._wafer_step_column, env._wafer_type_column
+        free_mask = env._free_mask.mask
+        has_decision = False
+        for wafer in env._dispatch_candidates():
+            row = wafer._row
+            step = steps.item(row)
+            if step >= ROUTE_LENGTH_TABLE.item(type_ids.item(row)):
+                continue
+            if not free_mask & OPTION_MASK_TABLE.item(type_ids.item(row), step):
+                continue
+            dispatchable = env.get_dispatchable_chambers(wafer)
+            if not dispatchable:
+                continue
+            has_decision = True
+            ids = {chamber.chamber_id for chamber in dispatchable}
+            for k, option in enumerate(STEP_OPTION_LISTS[type_ids.item(row)][step], 1):
+                masks[row, k] = option in ids
+        return has_decision
+    
+    def _update_observations(self) -> np.ndarray:
+        """在共享二维列上一次计算所有副本所有晶圆的观测，各维含义与ObservationBuilder的晶圆观测一致"""
+        location_codes = np.empty((self.num_envs, self.num_agents), dtype=np.float32)
+        free_masks = np.empty(self.num_envs, dtype=np.uint16)
+        for i, env in enumerate(self.envs):
+            lookup = np.array([LOCATION_CODES.get(name, 0) for name in env.state.location_names], dtype=np.float32)
+            location_codes[i] = lookup[self.columns['wafer_location'][i]]
+            free_masks[i] = env._free_mask.mask
+            self._times[i] = env.current_time
+        fill_wafer_observations(self._observations, self.columns, location_codes, free_masks, self._times)
+        return self._observations
+    
+    def makespans(self) -> np.ndarray:
+        """各副本当前的完工时间（最晚移动结束时刻）"""
+        return np.array([env.move_log.total_time() for env in self.envs])
+    
+    def summaries(self) -> List[Dict]:
+        """各副本的回合统计：完工时间、完成晶圆数、是否死锁"""
+        return [{'completion_time': env.move_log.total_time(), 'completed_wafers': env.finished_count,
+                 'deadlocked': env.is_deadlocked()} for env in self.envs]
+    
+    def solution(self, i: int) -> List[Dict]:
+        """副本i已排定的移动序列"""
+        return self.envs[i].move_log.to_dicts(sort=True)
+    
+    def close(self):
+        """单进程版本无需释放资源，与ParallelVecFabEnv接口一致"""
+
+
+def _worker(conn, task_name: str, num_envs: int, max_wip: Optional[int], history: str):
+    """工作进程：持有一个VecFabEnv分片，按管道命令执行并回传结果"""
+    vec_env = VecFabEnv(task_name, num_envs, max_wip, history)
+    conn.send(vec_env.num_agents)
+    while True:
+        command, data = conn.recv()
+        if command == 'step':
+            conn.send(vec_env.step(data))
+        elif command == 'reset':
+            conn.send(vec_env.reset(data))
+        elif command == 'makespans':
+            conn.send(vec_env.makespans())
+        elif command == 'summaries':
+            conn.send(vec_env.summaries())
+        elif command == 'solution':
+            conn.send(vec_env.solution(data))
+        elif command == 'close':
+            conn.close()
+            return
+
+
+class ParallelVecFabEnv:
+    """多进程向量化环境
+    
+    接口与VecFabEnv相同。N个副本按连续区间分到num_workers个工作进程，每个进程内是一个VecFabEnv分片；
+    step把各分片的动作同时发出后再依次收集，各进程的仿真并行推进。
+    副本对象留在工作进程中，不提供envs与columns，改用makespans、summaries、solution读取结果，用完需close。
+    """
+    
+    def __init__(self, task_name: str, num_envs: int, num_workers: int, max_wip: Optional[int] = None,
+                 history: str = 'off'):
+        num_workers = max(1, min(num_workers, num_envs))
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self._slices = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.num_envs = num_envs
+        
+        context = multiprocessing.get_context()
+        self._conns, self._processes = [], []
+        for shard in self._slices:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(child_conn, task_name, shard.stop - shard.start, max_wip, history))
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        self.num_agents = [conn.recv() for conn in self._conns][0]
+        
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self._observations = np.zeros((num_envs, self.num_agents, WAFER_OBS_DIM), dtype=np.float32)
+        self._masks = np.zeros((num_envs, self.num_agents, WAFER_ACTION_DIM), dtype=bool)
+    
+    def _locate(self, i: int) -> Tuple[int, int]:
+        """副本i所在的工作进程及其在分片内的序号"""
+        for worker, shard in enumerate(self._slices):
+            if i < shard.stop:
+                return worker, i - shard.start
+        raise IndexError(f"副本序号越界: {i}")
+    
+    def reset(self, indices: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """把指定副本（默认全部）恢复到初始状态并推进到首个决策时刻，返回(观测, 动作掩码)"""
+        if indices is None:
+            indices = range(self.num_envs)
+        local_indices = {}
+        for i in indices:
+            worker, local = self._locate(int(i))
+            local_indices.setdefault(worker, []).append(local)
+        for worker, local in local_indices.items():
+            self._conns[worker].send(('reset', local))
+        for worker in local_indices:
+            shard = self._slices[worker]
+            self._observations[shard], self._masks[shard] = self._conns[worker].recv()
+            self.dones[shard] = False
+        return self._observations, self._masks
+    
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """所有副本执行一个决策时刻，返回(观测, 奖励, 完成标志, 动作掩码)，规则与VecFabEnv.step相同"""
+        actions = np.asarray(actions, dtype=np.int64)
+        for conn, shard in zip(self._conns, self._slices):
+            conn.send(('step', actions[shard]))
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        for conn, shard in zip(self._conns, self._slices):
+            self._observations[shard], rewards[shard], self.dones[shard], self._masks[shard] = conn.recv()
+        return self._observations, rewards, self.dones.copy(), self._masks
+    
+    def _gather(self, command: str) -> list:
+        """向全部工作进程发出无参数命令，按分片顺序收集结果"""
+        for conn in self._conns:
+            conn.send((command, None))
+        return [conn.recv() for conn in self._conns]
+    
+    def makespans(self) -> np.ndarray:
+        """各副本当前的完工时间（最晚移动结束时刻）"""
+        return np.concatenate(self._gather('makespans'))
+    
+    def summaries(self) -> List[Dict]:
+        """各副本的回合统计：完工时间、完成晶圆数、是否死锁"""
+        return [summary for shard in self._gather('summaries') for summary in shard]
+    
+    def solution(self, i: int) -> List[Dict]:
+        """副本i已排定的移动序列"""
+        worker, local = self._locate(i)
+        self._conns[worker].send(('solution', local))
+        return self._conns[worker].recv()
+    
+    def close(self):
+        """通知工作进程退出并回收"""
+        for conn, process in zip(self._conns, self._processes):
+            if process.is_alive():
+                conn.send(('close', None))
+            process.join()
+            conn.close()
+        self._conns, self._processes = [], []
+
+
+def make_vec_env(task_name: str, num_envs: int, num_workers: int = 1, max_wip: Optional[int] = None,
+                 history: str = 'off'):
+    """num_workers不超过1时返回单进程的VecFabEnv，否则返回ParallelVecFabEnv"""
+    if num_workers <= 1:
+        return VecFabEnv(task_name, num_envs, max_wip, history)
+    return ParallelVecFabEnv(task_name, num_envs, num_workers, max_wip, history)
\ No newline at end of file
@@ -5,12 +5,34 @@
 
 import numpy as np
 from typing import List, Dict, Optional
-from config.process_config import PROCESS_ROUTES, get_process_time, get_flexible_options
+from config.process_config import (PROCESS_ROUTES, PROCESS_TYPE_IDS, STEP_OPTION_LISTS, STEP_PROCESS_TIMES,
+                                   get_process_time)
+from config.equipment_config import EQUIPMENT_MAPPING
+from .history import DEFAULT_HISTORY_POLICY, create_history
+from .fab_state import (FabState, StateColumn, OptionalTimeColumn, CodeColumn, LocationColumn,
+                         WAFER_STATUS_CODES)
 
 class Wafer:
-    """晶圆智能体类"""
+    """晶圆智能体类
     
-    def __init__(self, wafer_id: str, process_type: str, lot_id: int, wafer_num: int):
+    动态状态存放在FabState的晶圆列中，以下属性为所在行的视图
+    """
+    
+    lot_id = StateColumn('wafer_lot')
+    wafer_num = StateColumn('wafer_num')
+    process_type_id = StateColumn('wafer_type')
+    current_step = StateColumn('wafer_step')
+    status = CodeColumn('wafer_status', WAFER_STATUS_CODES)
+    current_location = LocationColumn('wafer_location')
+    start_time = StateColumn('wafer_start_time')
+    ready_time = StateColumn('wafer_ready_time')
+    completion_time = OptionalTimeColumn('wafer_completion_time')
+    
+    def __init__(self, wafer_id: str, process_type: str, lot_id: int, wafer_num: int,
+                 state: Optional[FabState] = None, row: int = 0):
+        # 未指定共享存储时使用独立的单行存储
+        self._state, self._row = (state, row) if state is not None else (FabState(num_wafers=1), 0)
+        
         self.wafer_id = wafer_id
         self.process_type = process_type
         self.lot_id = lot_id
@@ -18,19 +40,33 @@ class Wafer:
         
         # 工艺路径
         self.process_route = PROCESS_ROUTES.get(process_type, [])
+        self.process_type_id = PROCESS_TYPE_IDS.get(process_type, -1)
         self.current_step = 0
-        self.completed_steps = []
         
         # 状态信息
         self.current_location = None  # 当前位置
         self.status = 'waiting'  # waiting, processing, moving, completed
         self.start_time = 0.0
+        self.ready_time = 0.0  # 当前位置上可被取走的时刻
         self.completion_time = None
         
         # 历史记录
-        self.move_history = []
-        self.processing_history = []
+        self.set_history_policy(DEFAULT_HISTORY_POLICY)
         
+        # 超片约束索引，由环境注册
+        self.overtaking_index = None
+    
+    def set_history_policy(self, policy: str):
+        """设置历史记录策略：off、ring:N或full"""
+        self.move_history = create_history(policy)
+        self.processing_history = create_history(policy)
+        self.record_history = policy != 'off'
+    
+    @property
+    def completed_steps(self) -> List[int]:
+        """已完成的工艺步骤"""
+        return self.process_route[:self.current_step]
+    
     def get_current_target_chamber(self) -> Optional[int]:
         """获取当前目标腔室"""
         if self.current_step < len(self.process_route):
@@ -45,20 +81,26 @@ class Wafer:
     
     def get_flexible_chamber_options(self) -> List[int]:
         """获取当前步骤的柔性腔室选项"""
-        current_chamber = self.get_current_target_chamber()
-        if current_chamber is not None:
-            return get_flexible_options(self.process_type, current_chamber)
+        if self.current_step < len(self.process_route):
+            return STEP_OPTION_LISTS[self.process_type_id][self.current_step]
         return []
     
     def get_processing_time(self, chamber_id: int) -> float:
         """获取在指定腔室的处理时间"""
         return get_process_time(self.process_type, chamber_id)
     
+    def get_step_processing_time(self) -> float:
+        """获取当前步骤在路径名义腔室的处理时间"""
+        if self.current_step < len(self.process_route):
+            return STEP_PROCESS_TIMES[self.process_type_id][self.current_step]
+        return 0.0
+    
     def advance_step(self):
         """推进到下一个工艺步骤"""
         if self.current_step < len(self.process_route):
-            self.completed_steps.append(self.process_route[self.current_step])
             self.current_step += 1
+            if self.overtaking_index is not None:
+                self.overtaking_index.advance(self, self.current_step - 1)
     
     def is_completed(self) -> bool:
         """检查是否完成所有工艺步骤"""
@@ -95,9 +137,9 @@ class Wafer:
         }
         state[6] = status_encoding.get(self.status, 0)
         
-        # 当前位置
+        # 当前位置（设备编号，LoadPort及机械臂上为0）
         if self.current_location is not None:
-            state[7] = self.current_location
+            state[7] = EQUIPMENT_MAPPING.get(self.current_location, 0)
         
         # 完成进度
         state[8] = self.current_step / len(self.process_route) if self.process_route else 1.0
@@ -4,16 +4,57 @@
 """
 
 import argparse
+import json
 import os
 from datetime import datetime
-from environment.fab_environment import FabEnvironment
+from environment.fab_environment import FabEnvironment, CLEANING_POLICIES, DEFAULT_CLEANING_POLICY
+from config.task_config import task_name, task_label
+from config.topology import load_topology
+from environment.robustness import evaluate_robustness, DISTRIBUTIONS
+from environment.dispatch_rules import DISPATCH_RULES, DEFAULT_DISPATCH_RULE
+from solvers.beam_search import BeamScheduler
+from solvers.cyclic import CyclicScheduler
+from solvers.milp import MILPScheduler
 
 def main():
     parser = argparse.ArgumentParser(description='半导体晶圆调度仿真')
-    parser.add_argument('--task', type=str, choices=['a', 'b', 'c', 'd'], 
-                       required=True, help='要执行的任务 (a, b, c, d)')
+    parser.add_argument('--task', type=task_name, required=True,
+                       help='要执行的任务 (a, b, c, d，或 gen:lots=400,size=25,mix=A:2/B:1,seed=0 生成任务)')
     parser.add_argument('--output_dir', type=str, default='output',
                        help='输出目录')
+    parser.add_argument('--format', type=str, choices=['json', 'ndjson'], default='json',
+                       help='结果文件格式，仿真过程中流式写出 (默认json)')
+    parser.add_argument('--history', type=str, default='full',
+                       help='对象历史记录策略: off、ring:N、full (默认full)')
+    parser.add_argument('--topology', type=str, default=None,
+                       help='设备布局YAML文件，省略时使用内置布局')
+    parser.add_argument('--swap', type=str, choices=['on', 'off'], default='on',
+                       help='TM2/TM3双臂机械手在PM处换片 (默认on；off为单片取放，与引入换片之前的结果一致)')
+    parser.add_argument('--cleaning', type=str, choices=list(CLEANING_POLICIES), default=DEFAULT_CLEANING_POLICY,
+                       help='PM清洁策略: off、naive、opportunistic (默认opportunistic；off即不计清洁，'
+                            '与引入清洁之前的结果一致)')
+    parser.add_argument('--policy', type=str, choices=list(DISPATCH_RULES), default=DEFAULT_DISPATCH_RULE,
+                       help='内置调度的派发规则: ' + '、'.join(DISPATCH_RULES) + f' (默认{DEFAULT_DISPATCH_RULE})')
+    parser.add_argument('--solver', type=str, choices=['greedy', 'beam', 'cyclic', 'milp'], default='greedy',
+                       help='调度求解方式: greedy为按派发规则仿真，beam为束搜索，cyclic为同构批次的循环调度'
+                            '（仅限不重入PM的路径，如任务b），milp为前若干片晶圆的精确调度 (默认greedy)')
+    parser.add_argument('--beam_width', type=int, default=4,
+                       help='束搜索每层保留的部分调度数 (默认4)')
+    parser.add_argument('--time_budget', type=float, default=60.0,
+                       help='束搜索与MILP的时间预算（秒），束搜索用尽后贪心补完 (默认60)')
+    parser.add_argument('--milp_wafers', type=int, default=5,
+                       help='MILP子问题的晶圆数，各LoadPort轮流取先出片的晶圆；子问题不清洁、不换片，'
+                            '任务a的重入路径常需超过60秒才能证明最优 (默认5)')
+    parser.add_argument('--warm_start', action='store_true',
+                       help='MILP求解后以子问题的调度开头贪心完成整个任务，另存结果文件')
+    parser.add_argument('--workers', type=int, default=0,
+                       help='束搜索并行展开的进程数，0为不并行 (默认0)')
+    parser.add_argument('--robustness', type=int, default=0,
+                       help='蒙特卡洛评估所得调度的场景数，0为不评估 (默认0)')
+    parser.add_argument('--process_cv', type=float, default=0.05,
+                       help='鲁棒性评估中工艺时间的变异系数 (默认0.05)')
+    parser.add_argument('--distribution', type=str, choices=list(DISTRIBUTIONS), default='lognormal',
+                       help='鲁棒性评估的工艺时间分布 (默认lognormal)')
     
     args = parser.parse_args()
     
@@ -22,12 +63,14 @@ def main():
     
     # 创建环境
     print(f"开始执行任务 {args.task.upper()}")
-    env = FabEnvironment(args.task)
+    env = FabEnvironment(args.task, history=args.history, topology=load_topology(args.topology),
+                         swap=args.swap == 'on', cleaning=args.cleaning, policy=args.policy)
     
     print(f"初始化完成:")
     print(f"- 晶圆数量: {len(env.wafers)}")
     print(f"- 腔室数量: {len(env.chambers)}")
     print(f"- 机械臂数量: {len(env.robot_arms)}")
+    print(f"- 派发规则: {args.policy}")
     
     # 运行仿真
     print("开始仿真...")
@@ -35,16 +78,49 @@ def main():
     
     # 生成输出文件名
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join(args.output_dir, f"task_{args.task}_{timestamp}.json")
+    output_file = os.path.join(args.output_dir, f"task_{task_label(args.task)}_{timestamp}.{args.format}")
     
     # 保存结果
-    env.save_results(output_file)
+    move_log = env.move_log
+    if args.solver == 'cyclic':
+        scheduler = CyclicScheduler(env)
+        scheduler.save_results(output_file, result_format=args.format)
+        print(f"循环周期: {scheduler.period:.2f}秒/{scheduler.cycle_wafers}片")
+        move_log = scheduler.move_log
+    elif args.solver == 'milp':
+        scheduler = MILPScheduler(env, wafers=args.milp_wafers, time_limit=args.time_budget)
+        scheduler.save_results(output_file, result_format=args.format)
+        move_log = scheduler.move_log
+        if args.warm_start:
+            scheduler.warm_start()
+            warm_file = os.path.splitext(output_file)[0] + f'_warm_start.{args.format}'
+            env.save_results(warm_file, result_format=args.format, rerun=False)
+            move_log = env.move_log
+    elif args.solver == 'beam':
+        scheduler = BeamScheduler(env, beam_width=args.beam_width, time_budget=args.time_budget,
+                                  workers=args.workers)
+        scheduler.solve()
+        print(f"束搜索完成: {scheduler.levels}层, 展开{scheduler.expanded}个节点")
+        env.save_results(output_file, result_format=args.format, rerun=False)
+    else:
+        env.save_results(output_file, result_format=args.format)
     
     end_time = datetime.now()
     simulation_time = (end_time - start_time).total_seconds()
     
     print(f"仿真完成，耗时: {simulation_time:.2f}秒")
     print(f"结果文件: {output_file}")
+    
+    if args.robustness > 0:
+        # 在工艺时间波动下重放所得调度
+        report = evaluate_robustness(move_log.to_dicts(sort=True), args.robustness,
+                                     variability={'PROCESS': args.process_cv}, distribution=args.distribution)
+        report_file = os.path.splitext(output_file)[0] + '_robustness.json'
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        percentiles = ', '.join(f"{name}={value:.2f}" for name, value in report['MakespanPercentiles'].items())
+        print(f"鲁棒性评估 ({args.robustness}个场景): 计划完工时间 {report['PlannedMakespan']:.2f}秒, {percentiles}")
+        print(f"鲁棒性报告: {report_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+束搜索调度
+在环境快照上逐个派发决策展开部分调度，按完工时间下界保留前K个，重复状态只保留一份
+"""
+
+import heapq
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from environment.fab_environment import FabEnvironment
+from environment.dispatch_rules import REMAINING_WORK_TABLE
+from environment.bounds import makespan_lower_bound
+from environment.event_queue import EVENT_PICK_DONE, EVENT_PLACE_DONE, EVENT_PROCESS_DONE
+from config.process_config import PROCESS_TIME_TABLE, OPTION_MASK_TABLE, ROUTE_LENGTH_TABLE, MAX_ROUTE_STEPS
+from solvers.greedy import complete_greedily
+
+# 柔性腔室组为各步可选腔室的位掩码（腔室k对应第k-1位），只能在组内完成的工艺步包括可选腔室是其子集的步
+STAGE_MASKS = np.unique(OPTION_MASK_TABLE[OPTION_MASK_TABLE > 0]).astype(np.int64)
+STAGE_MEMBERS = (STAGE_MASKS[:, None] >> np.arange(16)) & 1  # (组数, 腔室位)
+STAGE_CAPACITY = STAGE_MEMBERS.sum(axis=1).astype(np.float64)
+_in_stage = (OPTION_MASK_TABLE[..., None].astype(np.int64) & ~STAGE_MASKS) == 0
+_stage_work = np.where(_in_stage & (OPTION_MASK_TABLE[..., None] > 0), PROCESS_TIME_TABLE[..., None], 0.0)
+# 按(工艺类型编号, 工艺步)起各组的剩余工艺时间，末尾多一步对应已完成全部工艺
+REMAINING_STAGE_WORK = np.zeros((PROCESS_TIME_TABLE.shape[0], MAX_ROUTE_STEPS + 1, len(STAGE_MASKS)))
+REMAINING_STAGE_WORK[:, :MAX_ROUTE_STEPS] = np.cumsum(_stage_work[:, ::-1], axis=1)[:, ::-1]
+
+WAFER_EVENTS = (EVENT_PICK_DONE, EVENT_PLACE_DONE, EVENT_PROCESS_DONE)
+
+
+def lower_bound(env: FabEnvironment) -> float:
+    """当前状态下完工时间的廉价下界
+    
+    已派发的搬运和工艺都已排入事件队列，晶圆最后一个事件的时刻即其最早可继续推进的时刻。
+    取以下两者的较大值：每片晶圆的该时刻加上未派发的工艺时间与最少取放次数；
+    每个柔性腔室组内各腔室尚需的占用时间与只能在组内完成的剩余工艺时间之和平均分到组内各腔室。
+    
+    bounds.makespan_lower_bound按整个任务从时刻0计算，不随部分调度变化，无法区分束中的节点，
+    且每次都要重建路径表；剪枝与排序需要对每个子节点计算下界，因此这里保留按当前状态查表的廉价下界，
+    整体下界只在BeamScheduler.solve中用于判断已知解是否已最优。
+    """
+    now = env.current_time
+    columns = env.state.columns
+    types, steps = columns['wafer_type'], columns['wafer_step']
+    available = np.full(len(steps), now)
+    for time, _, event_type, payload in env.event_queue.snapshot()[0]:
+        if event_type in WAFER_EVENTS and time > available[payload[0]]:
+            available[payload[0]] = time
+    
+    committed = np.zeros(len(steps), dtype=bool)
+    committed[list(env._committed)] = True
+    handling = min(env.topology.pick_times[tm] + env.topology.place_times[tm] for tm in env.topology.pick_times)
+    remaining_moves = np.where(committed | (steps == 0), ROUTE_LENGTH_TABLE[types] - steps + 1, 0)
+    wafer_bound = (available + REMAINING_WORK_TABLE[types, steps] + remaining_moves * handling).max(initial=now)
+    
+    busy = np.zeros(STAGE_MEMBERS.shape[1])
+    for index, name in env._committed.items():
+        busy[env.chambers[name].chamber_id - 1] = available[index] - now
+    load = REMAINING_STAGE_WORK[types, steps].sum(axis=0) + STAGE_MEMBERS @ busy
+    return float(max(wafer_bound, now + (load / STAGE_CAPACITY).max(initial=0.0)))
+
+
+def state_key(env: FabEnvironment) -> Tuple:
+    """重复状态的键：时刻、各对象的动态状态列与待处理事件都相同的两个部分调度，后续可行的调度完全相同"""
+    columns = env.state.columns
+    dynamic = b''.join(columns[name].tobytes() for name in (
+        'wafer_step', 'wafer_status', 'wafer_location', 'chamber_status', 'chamber_wafer', 'chamber_vacuum',
+        'chamber_wafer_count', 'chamber_last_type', 'chamber_process_end_time', 'arm_position', 'arm_wafer',
+        'arm_second_wafer', 'arm_action_end_time'))
+    events = tuple(sorted((entry[0], entry[2], entry[3]) for entry in env.event_queue.snapshot()[0]))
+    return env.current_time, dynamic, events, frozenset(env._committed.items())
+
+
+def decisions(env: FabEnvironment) -> List[Tuple]:
+    """当前决策时刻的全部动作：送入某个可送入腔室、与PM内晶圆换片，或等待到下一事件"""
+    actions = []
+    for wafer in env.get_decision_wafers():
+        index = env._wafer_index[wafer.wafer_id]
+        actions.extend(('move', index, chamber.chamber_name) for chamber in env.get_dispatchable_chambers(wafer))
+    if env.swap:
+        for index in sorted(env._ready):
+            wafer = env.wafers[index]
+            if not wafer.is_completed() and not env.get_dispatchable_chambers(wafer):
+                actions.extend(('swap', index, option[0].chamber_name) for option in env.get_swap_options(wafer))
+    if env.event_queue:
+        actions.append(('wait',))
+    return actions
+
+
+def apply_decision(env: FabEnvironment, action: Tuple) -> bool:
+    """执行动作并推进到下一个决策时刻，返回是否仍可继续（未死锁、未停滞）"""
+    if action[0] == 'move':
+        env.dispatch_wafer(env.wafers[action[1]], env.chambers[action[2]])
+    elif action[0] == 'swap':
+        env.dispatch_swap(env.wafers[action[1]], env.chambers[action[2]])
+    else:
+        env.advance_to_next_event()
+    env.advance_to_next_decision()
+    if env.is_deadlocked():
+        return False
+    return env.is_done() or bool(env.event_queue) or bool(env.get_decision_wafers())
+
+
+class _Node:
+    """束中的部分调度，score用于排序，bound为完工时间下界，用于剪枝"""
+    
+    __slots__ = ('snapshot', 'score', 'bound')
+    
+    def __init__(self, snapshot: Dict, score: Tuple, bound: float):
+        self.snapshot = snapshot
+        self.score = score
+        self.bound = bound
+
+
+class _Expander:
+    """在一个工作环境上展开部分调度
+    
+    子节点按先贪心前瞻lookahead个决策步后的下界排序，前瞻中恰好完成全部晶圆时同时得到一个完整调度。
+    """
+    
+    def __init__(self, env: FabEnvironment, lookahead: int):
+        self.env = env
+        self.lookahead = lookahead
+    
+    def __call__(self, snapshot: Dict) -> Tuple[List[Tuple[Tuple, _Node]], Optional[Tuple[float, Dict]]]:
+        """返回[(状态键, 子节点)]及展开中得到的最好完整调度(完工时间, 快照)"""
+        env = self.env
+        env.restore(snapshot)
+        children, complete = [], None
+        for action in decisions(env):
+            env.restore(snapshot)
+            if not apply_decision(env, action):
+                continue
+            if env.is_done():
+                makespan = env.move_log.total_time()
+                if complete is None or makespan < complete[0]:
+                    complete = makespan, env.snapshot()
+                continue
+            key, child, bound = state_key(env), env.snapshot(), lower_bound(env)
+            for _ in range(self.lookahead):
+                if env.is_done() or env.is_deadlocked():
+                    break
+                env.step()
+            if env.is_done():
+                makespan = env.move_log.total_time()
+                if complete is None or makespan < complete[0]:
+                    complete = makespan, env.snapshot()
+            score = (float('inf') if env.is_deadlocked() else lower_bound(env), -env.move_counter)
+            children.append((key, _Node(child, score, bound)))
+        return children, complete
+
+
+_worker_expander = None
+
+
+def _init_worker(env: FabEnvironment, lookahead: int):
+    global _worker_expander
+    _worker_expander = _Expander(env, lookahead)
+
+
+def _expand(snapshot: Dict):
+    return _worker_expander(snapshot)
+
+
+class BeamScheduler:
+    """束搜索调度器
+    
+    从环境当前状态出发，每层为束中每个部分调度展开一个决策（送入某腔室、换片或等待到下一事件），
+    状态相同的子节点只保留一个，按贪心前瞻后的完工时间下界保留beam_width个；
+    下界不小于已知最好完工时间的节点剪去。环境自身派发规则的贪心调度作为初始解，因此结果不差于贪心。
+    已知最好完工时间达到整个任务的完工时间下界（bounds.makespan_lower_bound）时已是最优，提前停止。
+    每展开一个节点检查用时，超过time_budget秒后停止展开，束中剩余节点按派发规则贪心补完。
+    workers大于0时用进程池并行展开各节点，每个进程持有一个环境副本。
+    """
+    
+    def __init__(self, env: FabEnvironment, beam_width: int = 4, time_budget: float = 60.0,
+                 lookahead: int = 10, workers: int = 0):
+        self.env = env
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.lookahead = lookahead
+        self.workers = workers
+        self.levels = 0
+        self.expanded = 0
+    
+    def solve(self) -> Dict:
+        """搜索并把最好的调度留在环境中，返回与run_simulation相同结构的结果"""
+        start = time.perf_counter()
+        env = self.env
+        env.advance_to_next_decision()
+        root = env.snapshot()
+        best_time = complete_greedily(env)
+        best_snapshot = env.snapshot()
+        env.restore(root)
+        task_bound = makespan_lower_bound(env)['LowerBound']
+        beam = [] if env.is_done() else [_Node(root, (lower_bound(env), 0), lower_bound(env))]
+        
+        expander = _Expander(env, self.lookahead)
+        pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(env.fork(), self.lookahead)) \
+            if self.workers > 0 else None
+        try:
+            while beam and best_time > task_bound and time.perf_counter() - start < self.time_budget:
+                snapshots = [node.snapshot for node in beam]
+                results = pool.map(_expand, snapshots) if pool is not None else map(expander, snapshots)
+                children, unexpanded = {}, []
+                for index, (expanded, complete) in enumerate(results):
+                    self.expanded += 1
+                    if complete is not None and complete[0] < best_time:
+                        best_time, best_snapshot = complete
+                    for key, child in expanded:
+                        if child.bound < best_time and (key not in children or child.score < children[key].score):
+                            children[key] = child
+                    # 一层很宽时逐个节点检查用时，用尽时本层未展开的节点与已得到的子节点一起贪心补完
+                    if time.perf_counter() - start >= self.time_budget:
+                        unexpanded = beam[index + 1:]
+                        break
+                beam = heapq.nsmallest(self.beam_width, (child for child in children.values()
+                                                         if child.bound < best_time), key=lambda node: node.score)
+                beam += [node for node in unexpanded if node.bound < best_time]
+                self.levels += 1
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        
+        # 用时耗尽时贪心补完束中剩余节点
+        for node in beam:
+            env.restore(node.snapshot)
+            makespan = complete_greedily(env)
+            if makespan < best_time:
+                best_time, best_snapshot = makespan, env.snapshot()
+        env.restore(best_snapshot)
+        return {'MoveList': env.move_log.to_dicts(sort=True), **env._result_summary()}
\ No newline at end of file
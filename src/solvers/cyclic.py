@@ -0,0 +1,532 @@
+"""
+同构批次的循环稳态调度
+全部晶圆走同一不重入PM的工艺路径时，按固定间隔逐片放入各步停留固定的单片搬运链，柔性孪生腔室轮流使用，
+求出互不冲突的最小间隔后展开为完整MoveList，不逐个决策仿真
+"""
+
+import math
+import numpy as np
+from bisect import bisect_right
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from environment.fab_environment import FabEnvironment
+from environment.move_log import MOVE_DTYPE, MoveLog
+from environment.result_writer import ResultWriter
+from environment.bounds import bound_report
+from environment.validation import schedule_violations
+from config.equipment_config import MOVE_TYPES, DOOR_PARAMS, CLEAN_PARAMS
+from config.process_config import PROCESS_TIME_TABLE
+
+PICK, PLACE, TRANS, PREPARE, COMPLETE, PUMP, VENT, PROCESS, CLEAN = (
+    MOVE_TYPES[name] for name in ('PICK', 'PLACE', 'TRANS', 'PREPARE', 'COMPLETE', 'PUMP', 'VENT', 'PROCESS', 'CLEAN'))
+
+
+class _Chain:
+    """一片晶圆按给定腔室选择走完路径的搬运链，时刻相对于第一次取片开始
+    
+    delays为各段取片前晶圆在源腔室中多停留的时间，全为0时即各步无等待的刚性链。
+    moves为(开始, 结束, 移动类型, 模块编号)，机械臂动作的模块编号为-1-段号，放入时再换成选定的手臂；
+    tasks为各段搬运(TM, 开始, 结束, 起点位置, 终点位置)；uses为各段目标腔室的占用
+    (腔室名, 开门开始, 放片开始, 取走结束, 放片侧真空, 取片侧真空, 工艺步)，返回LoadPort的一段没有占用。
+    """
+    
+    def __init__(self, scheduler: 'CyclicScheduler', loadport: str, choice: Tuple[str, ...],
+                 delays: Tuple[float, ...]):
+        topology, codes = scheduler.topology, scheduler.module_codes
+        modules = [loadport, *choice, loadport]
+        hop_tms = [scheduler.hop_tm(source, target) for source, target in zip(modules, modules[1:])]
+        moves, self.tasks, self.uses = [], [], []
+        self.loadport, self.choice, self.delays = loadport, choice, delays
+        t = 0.0
+        for hop, (source, target, tm) in enumerate(zip(modules, modules[1:], hop_tms)):
+            source_position, target_position = topology.positions[tm][source], topology.positions[tm][target]
+            t += delays[hop]
+            start = t
+            t += topology.pick_times[tm]
+            moves.append((start, t, PICK, -1 - hop))
+            move_time = topology.move_time(tm, source_position, target_position)
+            if move_time > 0:
+                moves.append((t, t + move_time, TRANS, -1 - hop))
+                t += move_time
+            place_start = t
+            t += topology.place_times[tm]
+            moves.append((place_start, t, PLACE, -1 - hop))
+            self.tasks.append((tm, start, t, source_position, target_position))
+            if hop == len(choice):
+                break
+            
+            # 开关门、工艺，LoadLock再切换到下一段取片一侧的气氛
+            code = codes[target]
+            moves.append((place_start - DOOR_PARAMS['open_time'], place_start, PREPARE, code))
+            moves.append((t, t + DOOR_PARAMS['close_time'], COMPLETE, code))
+            t += DOOR_PARAMS['close_time']
+            process_time = PROCESS_TIME_TABLE.item(scheduler.type_id, hop)
+            if process_time > 0:
+                moves.append((t, t + process_time, PROCESS, code))
+                t += process_time
+            place_vacuum, pick_vacuum = hop_tms[hop] != 'TM1', hop_tms[hop + 1] != 'TM1'
+            conditioning = scheduler.conditioning(target, place_vacuum, pick_vacuum)
+            if conditioning is not None:
+                moves.append((t, t + conditioning[1], conditioning[0], code))
+                t += conditioning[1]
+            pick_end = t + delays[hop + 1] + topology.pick_times[hop_tms[hop + 1]]
+            self.uses.append((target, place_start - DOOR_PARAMS['open_time'], place_start, pick_end,
+                              place_vacuum, pick_vacuum, hop))
+        self.moves = np.array(moves, dtype=np.float64)
+        self.span = t
+
+
+class CyclicScheduler:
+    """同构批次的循环稳态调度器
+    
+    第j片晶圆在各步的柔性孪生腔室中轮流选第j个，k片（各步可选腔室数的最小公倍数）构成一个循环。
+    先在不清洁的条件下从资源负荷下界起逐个尝试片间间隔，为各循环位置求出各段停留与手臂固定的搬运链，
+    使各片按该间隔放入时机械臂（含空臂转动）、腔室、LoadLock抽充气与超片约束都不冲突，
+    取可行的最小间隔为循环周期；再按周期逐片放入整个任务，放不下（起始的填充段、PM清洁）时
+    改试整体推迟或中途停留的各腔室组合，取完成最早的，之后各片依次排空即为收尾段。
+    清洁按环境的清洁设置：PM处理满片数后先片数清洁，空闲过久的PM在接片前空闲清洁。
+    展开的MoveList按引擎规则校验（environment.validation），违规记入ConstraintViolations。
+    
+    只适用于每片晶圆进入各PM至多一次的路径（如B），这时单片循环的周期可达资源负荷下界。
+    同一片多次进入同一PM的路径（如A的PM7→PM8→LLC→LLD→LLB回路走三遍）各次进入争用同一组腔室与TM2，
+    单片循环的最小周期约378秒/片，远高于派发规则仿真中四片一组绕回路的约276秒/片，因此直接拒绝。
+    """
+    
+    def __init__(self, env: FabEnvironment, resolution: float = 0.5):
+        process_types = {wafer.process_type for wafer in env.wafers}
+        if len(process_types) != 1:
+            raise ValueError(f"循环调度只适用于同一工艺的任务: {sorted(process_types)}")
+        self.type_id = env.wafers[0].process_type_id
+        self.options = env._step_option_names[self.type_id]
+        visited = [name for names in self.options for name in names if name.startswith('PM')]
+        reentered = sorted({name for name in visited if visited.count(name) > 1})
+        if reentered:
+            raise ValueError(f"循环调度不适用于同一片多次进入同一PM的路径: {reentered}")
+        self.env = env
+        self.resolution = resolution
+        self.topology = env.topology
+        self.cycle_wafers = math.lcm(*(len(names) for names in self.options))
+        self.module_codes = env.move_log.module_codes
+        self.cleaning = env.cleaning != 'off'
+        self.arm_ids = {tm: [arm_id for arm_id, arm in env.robot_arms.items() if arm.arm_type == tm]
+                        for tm in self.topology.positions}
+        self._chains: Dict[Tuple, _Chain] = {}
+        self.period: Optional[float] = None
+        self.templates: List[Tuple[_Chain, Optional[List[str]]]] = []
+        self.move_log: Optional[MoveLog] = None
+        self.violations: List[Dict] = []
+    
+    def hop_tm(self, source: str, target: str) -> str:
+        """两个模块之间直达搬运的TM"""
+        topology = self.topology
+        code = topology.direct_tm.item(topology.module_index[source], topology.module_index[target])
+        if code < 0:
+            raise ValueError(f"{source}与{target}之间没有直达的机械臂")
+        return topology.transfer_modules[code]
+    
+    def conditioning(self, name: str, from_vacuum: bool, to_vacuum: bool) -> Optional[Tuple[int, float]]:
+        """LoadLock由一侧气氛切换到另一侧需要的(抽充气移动类型, 时长)，无需切换时为None"""
+        chamber = self.env.chambers[name]
+        if from_vacuum == to_vacuum or not getattr(chamber, 'can_pump_vent', False):
+            return None
+        return (PUMP, chamber.pump_time) if to_vacuum else (VENT, chamber.vent_time)
+    
+    def chain(self, loadport: str, choice: Tuple[str, ...], delays: Optional[Tuple[float, ...]] = None) -> _Chain:
+        """按(LoadPort, 腔室选择)缓存的刚性搬运链，给出各段停留时间时另建一条"""
+        if delays is not None:
+            return _Chain(self, loadport, choice, delays)
+        key = loadport, choice
+        if key not in self._chains:
+            self._chains[key] = _Chain(self, loadport, choice, (0.0,) * (len(choice) + 1))
+        return self._chains[key]
+    
+    def choice(self, j: int) -> Tuple[str, ...]:
+        """第j片晶圆在循环中轮到的腔室选择"""
+        return tuple(names[j % len(names)] for names in self.options)
+    
+    def period_lower_bound(self) -> float:
+        """片间间隔的下界：各TM每片的手臂作业时间除以手臂数，各腔室组每片的占用时间除以组内腔室数"""
+        chain = self.chain(self.env.get_loadport_name(self.env.wafers[0]), self.choice(0))
+        bound = 0.0
+        for tm, arms in self.arm_ids.items():
+            work = sum(end - start for task_tm, start, end, _, _ in chain.tasks if task_tm == tm)
+            bound = max(bound, work / max(len(arms), 1))
+        for names in {tuple(names) for names in self.options}:
+            occupied = sum(use[3] - use[1] for use, options in zip(chain.uses, self.options)
+                           if set(options) <= set(names))
+            bound = max(bound, occupied / len(names))
+        return bound
+    
+    # ---- 资源日历 ----
+    
+    def _reset(self, cleaning: bool):
+        """清空资源日历：各手臂的作业按开始时刻排序，各腔室的占用按开门时刻排序并附带占用后的状态"""
+        env = self.env
+        self._cleaning_on = cleaning
+        self._arm_tasks = {arm_id: [] for arms in self.arm_ids.values() for arm_id in arms}
+        self._arm_starts = {arm_id: [] for arm_id in self._arm_tasks}
+        self._initial_positions = {arm_id: arm.current_position for arm_id, arm in env.robot_arms.items()}
+        self._uses = {name: [] for name in env.chambers}
+        self._use_entries = {name: [] for name in env.chambers}
+        self._step_entries = [-math.inf] * len(self.options)
+        self._placements = []
+    
+    def _arm_shift(self, arm_id: str, tm: str, start: float, end: float,
+                   source: int, target: int) -> Tuple[float, int]:
+        """作业放入手臂日历所需的推迟时间与插入位置，空臂转动须在相邻作业之间完成"""
+        tasks, move_times = self._arm_tasks[arm_id], self.topology.move_times[tm]
+        index = bisect_right(self._arm_starts[arm_id], start)
+        if index > 0:
+            _, previous_end, _, previous_target, _ = tasks[index - 1]
+        else:
+            previous_end, previous_target = 0.0, self._initial_positions[arm_id]
+        shift = previous_end + move_times.item(previous_target, source) - start
+        if shift > 1e-9:
+            return shift, index
+        if index < len(tasks):
+            next_start, next_end, next_source, next_target, _ = tasks[index]
+            if end + move_times.item(target, next_source) > next_start + 1e-9:
+                return next_end + move_times.item(next_target, source) - start, index
+        return 0.0, index
+    
+    def _use_state(self, name: str, index: int) -> Tuple:
+        """腔室在第index次占用之前的状态(上次取走时刻, 气氛是否真空, 距上次清洁的片数)"""
+        if index > 0:
+            return self._uses[name][index - 1][-1]
+        return 0.0, bool(getattr(self.env.chambers[name], 'is_vacuum', True)), 0
+    
+    def _admit(self, name: str, state: Tuple, use: Tuple) -> Tuple[float, Tuple, List]:
+        """按腔室状态检查一次占用
+        
+        返回(开门最早可行时刻与当前开门时刻之差, 占用后的状态, 占用前的抽充气与清洁)。
+        PM处理满片数后先片数清洁，空闲足够长时提前做。
+        """
+        free, vacuum, count = state
+        entry, place_start, pick_end, place_vacuum, pick_vacuum = use[1:6]
+        extra = []
+        earliest = free
+        conditioning = self.conditioning(name, vacuum, place_vacuum)
+        if conditioning is not None:
+            extra.append((free, free + conditioning[1], conditioning[0]))
+            earliest = max(earliest, free + conditioning[1] - (place_start - entry))
+        if self._cleaning_on and name.startswith('PM'):
+            threshold, clean_time = CLEAN_PARAMS['wafer_count_threshold'], CLEAN_PARAMS['wafer_count_clean_time']
+            if count >= threshold or (count > 0 and entry >= free + clean_time):
+                extra.append((free, free + clean_time, CLEAN))
+                free += clean_time
+                count = 0
+                earliest = free
+            idle_start = free + CLEAN_PARAMS['idle_threshold']
+            if entry >= idle_start:
+                # 引擎在派发时才发现空闲过久，清洁尽量靠后、紧接开门，避免清洁后再次空闲过久
+                clean_start = max(idle_start, entry - CLEAN_PARAMS['idle_clean_time'])
+                if entry < idle_start + CLEAN_PARAMS['idle_clean_time']:
+                    earliest = idle_start + CLEAN_PARAMS['idle_clean_time']
+                extra.append((clean_start, clean_start + CLEAN_PARAMS['idle_clean_time'], CLEAN))
+        if getattr(self.env.chambers[name], 'can_pump_vent', False):
+            vacuum = pick_vacuum
+        return earliest - entry, (pick_end, vacuum, count + 1), extra
+    
+    def _use_shift(self, name: str, use: Tuple) -> Tuple[float, int, List[Tuple]]:
+        """占用放入腔室日历所需的推迟时间、插入位置及插入后自该位置起各次占用的新状态"""
+        uses, entry = self._uses[name], use[1]
+        index = bisect_right(self._use_entries[name], entry)
+        shift, state, _ = self._admit(name, self._use_state(name, index), use)
+        if shift > 1e-9:
+            return shift, index, []
+        states = [state]
+        for later in uses[index:]:
+            later_shift, state, _ = self._admit(name, state, later)
+            if later_shift > 1e-9:
+                # 插在后面的占用之前放不下，改排到其后
+                return later[3] - entry, index, []
+            states.append(state)
+        return 0.0, index, states
+    
+    def _place(self, chain: _Chain, start: float, hops: Optional[Sequence[int]] = None,
+               arms: Optional[Sequence[str]] = None, commit: bool = True) -> Tuple[float, int, Optional[List[str]]]:
+        """尝试把搬运链（或其中hops各段）放在start，arms给出时各段用指定的手臂，否则选最早可行的
+        
+        冲突时返回(所需推迟时间, 冲突的段号, None)，否则返回(0, -1, 各段选定的手臂)，commit为真时登记到日历。
+        只放部分段时不检查超片约束。
+        """
+        bound_arms, arms = arms, []
+        # 同一片晶圆的各段互不冲突，按时间先后逐段试放搬运与目标腔室的占用，冲突时撤销
+        inserted_tasks, inserted_uses = [], []
+        shift, hop = 0.0, -1
+        for hop in range(len(chain.tasks)) if hops is None else hops:
+            tm, task_start, task_end, source, target = chain.tasks[hop]
+            best = None
+            for arm_id in self.arm_ids[tm] if bound_arms is None else (bound_arms[hop],):
+                arm_shift, index = self._arm_shift(arm_id, tm, start + task_start, start + task_end, source, target)
+                if best is None or arm_shift < best[0]:
+                    best = arm_shift, arm_id, index
+            if best[0] > 1e-9:
+                shift = best[0]
+                break
+            _, arm_id, index = best
+            self._arm_tasks[arm_id].insert(index, (start + task_start, start + task_end, source, target,
+                                                  len(self._placements)))
+            self._arm_starts[arm_id].insert(index, start + task_start)
+            inserted_tasks.append((arm_id, index))
+            arms.append(arm_id)
+            if hop == len(chain.uses):
+                continue
+            
+            name, entry, place_start, pick_end, place_vacuum, pick_vacuum, step = chain.uses[hop]
+            if hops is None and name.startswith('PM') and start + entry < self._step_entries[step] - 1e-9:
+                shift = self._step_entries[step] - start - entry  # 超片约束：按编号先后进入
+                break
+            use = (name, start + entry, start + place_start, start + pick_end, place_vacuum, pick_vacuum,
+                   len(self._placements))
+            shift, index, states = self._use_shift(name, use)
+            if shift > 1e-9:
+                break
+            shift = 0.0
+            uses = self._uses[name]
+            old = uses[index:]
+            uses[index:] = [use + (states[0],)] + [later[:7] + (state,) for later, state in zip(old, states[1:])]
+            self._use_entries[name].insert(index, start + entry)
+            inserted_uses.append((name, index, old))
+        
+        if shift or not commit:
+            for name, index, old in reversed(inserted_uses):
+                self._uses[name][index:] = old
+                del self._use_entries[name][index]
+            for arm_id, index in reversed(inserted_tasks):
+                del self._arm_tasks[arm_id][index]
+                del self._arm_starts[arm_id][index]
+            if not shift:
+                return 0.0, -1, arms
+            return max(shift, self.resolution * 1e-3), hop, None
+        if hops is None:
+            for name, entry, *_, step in chain.uses:
+                self._step_entries[step] = start + entry
+        return 0.0, -1, arms
+    
+    def _place_earliest(self, chain: _Chain, start: float, limit: float, max_dwell: float = 0.0,
+                        commit: bool = True) -> Tuple[float, Optional[_Chain], Optional[List]]:
+        """从start起找最早可行的位置，返回(开始时刻, 搬运链, 手臂)，放不下时链与手臂为None
+        
+        冲突发生在第一段时整条链后移，开始时刻不超过limit；max_dwell大于0时，后面各段的冲突改为
+        让晶圆在该段的源腔室中多停留（与逐个决策仿真中晶圆在腔室内等待机械臂或目标腔室相同），
+        各段停留之和不超过max_dwell。
+        """
+        delays = list(chain.delays)
+        while start <= limit:
+            shift, hop, arms = self._place(chain, start, commit=commit)
+            if arms is not None:
+                return start, chain, arms
+            if hop > 0 and sum(delays) + shift <= max_dwell:
+                delays[hop] += shift
+                chain = self.chain(chain.loadport, chain.choice, tuple(delays))
+            else:
+                start += shift
+        return start, None, None
+    
+    # ---- 周期与展开 ----
+    
+    def find_period(self) -> float:
+        """不清洁时各片按固定间隔放入互不冲突的最小间隔，同时得到各循环位置的搬运链"""
+        loadport = self.env.get_loadport_name(self.env.wafers[0])
+        span = max(self.chain(loadport, self.choice(j)).span for j in range(self.cycle_wafers))
+        longest_move = max(float(times.max()) for times in self.topology.move_times.values())
+        resolution = self.resolution
+        period = math.ceil(self.period_lower_bound() / resolution - 1e-9) * resolution
+        while period < span + longest_move:
+            templates = self._templates_for(loadport, period, longest_move)
+            if templates is not None:
+                break
+            period += resolution
+        else:
+            templates = [(self.chain(loadport, self.choice(j)), None) for j in range(self.cycle_wafers)]
+        self.period, self.templates = period, templates
+        return period
+    
+    def _templates_for(self, loadport: str, period: float,
+                       longest_move: float) -> Optional[List[Tuple[_Chain, List[str]]]]:
+        """按固定间隔period求各循环位置的(搬运链, 各段手臂)，找不到互不冲突的停留时返回None
+        
+        与模调度相同，逐段放入：各片的前h段放好后，把第h段按间隔放入所有片，各循环位置的这一段
+        固定用同一手臂，试遍手臂组合都与某片冲突时，取所需推迟最少的，让该片所在循环位置第h段前的
+        停留加长后重放这一段，因此同一片后面的再次进入会让开其它片先前的进入。
+        各循环位置的总停留不超过一个周期，超片约束最后按各片PM进入时刻的先后检查。
+        """
+        cycle = self.cycle_wafers
+        chains = [self.chain(loadport, self.choice(j)) for j in range(cycle)]
+        arms = [[] for _ in range(cycle)]
+        span = max(chain.span for chain in chains) + period
+        # 首片放在所有手臂都能从初始位置赶到的时刻，覆盖与一片晶圆同时在制的全部晶圆
+        offset = span + longest_move
+        probes = cycle * (math.ceil(span / period) + 2)
+        starts = [offset + j * period for j in range(probes)]
+        self._reset(cleaning=False)
+        hop = 0
+        while hop < len(chains[0].tasks):
+            failures = []
+            for binding in product(*(self.arm_ids[chain.tasks[hop][0]] for chain in chains)):
+                for j in range(probes):
+                    position = j % cycle
+                    shift, _, placed = self._place(chains[position], starts[j], (hop,),
+                                                   [*arms[position], binding[position]])
+                    if placed is None:
+                        failures.append((shift, position))
+                        break
+                else:
+                    break
+                self._rebuild(chains, arms, starts, hop)
+            else:
+                shift, position = min(failures)
+                chain = chains[position]
+                delays = list(chain.delays)
+                if hop == 0 or sum(delays) + shift > period:
+                    return None
+                delays[hop] += shift
+                chains[position] = self.chain(loadport, chain.choice, tuple(delays))
+                if not self._rebuild(chains, arms, starts, hop):
+                    return None  # 停留加长后源腔室的占用与其它片冲突
+                continue
+            for position in range(cycle):
+                arms[position].append(binding[position])
+            hop += 1
+        
+        for step, use in enumerate(chains[0].uses):
+            if use[0].startswith('PM'):
+                entries = [starts[j] + chains[j % cycle].uses[step][1] for j in range(probes)]
+                if any(later < earlier - 1e-9 for earlier, later in zip(entries, entries[1:])):
+                    return None
+        return list(zip(chains, arms))
+    
+    def _rebuild(self, chains: List[_Chain], arms: List[List[str]], starts: List[float], hops: int) -> bool:
+        """清空日历后按固定间隔重放各片的前hops段，返回是否仍互不冲突"""
+        self._reset(cleaning=False)
+        return all(self._place(chains[j % len(chains)], start, (hop,), arms[j % len(chains)])[2] is not None
+                   for hop in range(hops) for j, start in enumerate(starts))
+    
+    def solve(self) -> Dict:
+        """展开整个任务的调度，返回与run_simulation相同结构的结果及循环周期"""
+        move_log = self.build()
+        return {'MoveList': move_log.to_dicts(sort=True), **self._summary(move_log)}
+    
+    def _summary(self, move_log: MoveLog) -> Dict:
+        """结果中MoveList以外的汇总字段"""
+        return {
+            'TotalTime': move_log.total_time(),
+            'CompletedWafers': len(self._placements),
+            'TotalWafers': len(self.env.wafers),
+            'ConstraintViolations': self.violations,
+            'CyclePeriod': self.period,
+            'CycleWafers': self.cycle_wafers,
+        }
+    
+    def save_results(self, filename: str, result_format: str = 'json') -> Dict:
+        """展开调度并保存结果文件，返回汇总信息"""
+        move_log = self.build()
+        summary = self._summary(move_log)
+        summary.update(bound_report(self.env, summary['TotalTime']))
+        with ResultWriter(filename, result_format) as writer:
+            writer.close(move_log, summary)
+        
+        print(f"结果已保存到 {filename}")
+        print(f"总完工时间: {summary['TotalTime']:.2f}秒")
+        print(f"完成晶圆数: {summary['CompletedWafers']}/{summary['TotalWafers']}")
+        print(f"完工时间下界: {summary['LowerBound']:.2f}秒 (瓶颈{summary['Bottleneck']}), 差距: {summary['OptimalityGap']:.2%}")
+        return summary
+    
+    def build(self) -> MoveLog:
+        """展开循环调度并校验，生成的列式移动记录同时保存在move_log中"""
+        move_log = self.unroll()
+        self.violations = schedule_violations(self.env, move_log.to_dicts())
+        self.move_log = move_log
+        return move_log
+    
+    def unroll(self) -> MoveLog:
+        """按循环周期逐片放入全部晶圆，生成列式移动记录"""
+        if self.period is None:
+            self.find_period()
+        env = self.env
+        self._reset(cleaning=self.cleaning)
+        order = sorted(range(len(env.wafers)), key=lambda i: (env.wafers[i].lot_id, env.wafers[i].wafer_num))
+        alternatives = list(product(*self.options))
+        # 所有资源都空闲后再经过一次片数清洁与空闲清洁，任何搬运链都能放入
+        horizon = 2 * max(chain.span for chain in self._chains.values()) + CLEAN_PARAMS['wafer_count_clean_time'] \
+            + CLEAN_PARAMS['idle_threshold'] + CLEAN_PARAMS['idle_clean_time']
+        choices = [template.choice for template, _ in self.templates]
+        previous, position = -self.period, 0
+        for index in order:
+            loadport = env.get_loadport_name(env.wafers[index])
+            target = max(previous + self.period, 0.0)
+            chain, template_arms = self.templates[position]
+            if loadport != chain.loadport:
+                chain = self.chain(loadport, chain.choice, chain.delays)
+            start, arms = target, self._place(chain, target, arms=template_arms)[2]
+            if arms is None:
+                # 稳态的搬运链放不进周期时（起始的填充段、PM清洁），试放该链整体推迟及各腔室组合的
+                # 刚性链整体推迟或中途停留，取完成最早的
+                candidates = []
+                trials = [(chain, 0.0)] + [(self.chain(loadport, choice), max_dwell)
+                                           for choice, max_dwell in product(alternatives, (0.0, horizon))]
+                for chain, max_dwell in trials:
+                    earliest, chain, arms = self._place_earliest(chain, target, target + horizon, max_dwell,
+                                                                 commit=False)
+                    if arms is not None:
+                        candidates.append((earliest + chain.span, earliest, len(candidates), chain, arms))
+                if not candidates:
+                    raise RuntimeError(f"晶圆{env.wafers[index].wafer_id}在{horizon}秒内找不到可放入的时刻")
+                _, start, _, chain, arms = min(candidates)
+                self._place(chain, start, arms=arms)
+            self._placements.append((index, start, chain, arms))
+            # 改用了其它腔室组合时，从与之相同的循环位置接着轮换
+            if chain.choice in choices:
+                position = choices.index(chain.choice)
+            previous, position = start, (position + 1) % self.cycle_wafers
+        return self._emit()
+    
+    def _emit(self) -> MoveLog:
+        """由放入结果生成移动记录：各片搬运链、空臂转动、LoadLock预先抽充气与PM清洁"""
+        env = self.env
+        codes = self.module_codes
+        blocks = []
+        for index, start, chain, arms in self._placements:
+            moves = chain.moves
+            modules = moves[:, 3].astype(np.int64)
+            arm_hops = modules < 0
+            modules[arm_hops] = [codes[arms[-1 - code]] for code in modules[arm_hops]]
+            block = np.zeros(len(moves), dtype=MOVE_DTYPE)
+            block['StartTime'] = moves[:, 0] + start
+            block['EndTime'] = moves[:, 1] + start
+            block['MoveType'] = moves[:, 2]
+            block['ModuleID'] = modules
+            block['WaferID'] = index
+            blocks.append(block)
+        
+        extra = []
+        wafer_of = [placement[0] for placement in self._placements]
+        for arm_id, tasks in self._arm_tasks.items():
+            tm = env.robot_arms[arm_id].arm_type
+            end, position = 0.0, self._initial_positions[arm_id]
+            for task_start, task_end, source, target, placement in tasks:
+                move_time = self.topology.move_time(tm, position, source)
+                if move_time > 0:
+                    extra.append((task_start - move_time, task_start, TRANS, codes[arm_id], wafer_of[placement]))
+                end, position = task_end, target
+        for name, uses in self._uses.items():
+            state = self._use_state(name, 0)
+            for use in uses:
+                _, state, actions = self._admit(name, state, use)
+                extra.extend((begin, finish, move_type, codes[name], wafer_of[use[6]])
+                             for begin, finish, move_type in actions)
+        if extra:
+            block = np.zeros(len(extra), dtype=MOVE_DTYPE)
+            for field, values in zip(('StartTime', 'EndTime', 'MoveType', 'ModuleID', 'WaferID'), zip(*extra)):
+                block[field] = values
+            blocks.append(block)
+        
+        records = np.concatenate(blocks)
+        records = records[np.lexsort((records['MoveType'], records['StartTime']))]
+        records['MoveID'] = np.arange(len(records))
+        records['SlotID'] = 1
+        move_log = MoveLog(env.move_log.module_names, env.move_log.wafer_ids, capacity=max(len(records), 1))
+        move_log.extend(records)
+        return move_log
\ No newline at end of file
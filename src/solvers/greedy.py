@@ -0,0 +1,17 @@
+"""
+贪心补完
+按环境自身的派发规则把任意状态仿真到底，供束搜索、MILP等求解器补完部分调度或给出基准解
+"""
+
+from environment.fab_environment import FabEnvironment
+
+
+def complete_greedily(env: FabEnvironment) -> float:
+    """按环境的派发规则把当前状态仿真到底，返回完工时间，未能完成时为inf"""
+    while not env.is_done() and not env.is_deadlocked():
+        env.step()
+        if not env.event_queue and not env.is_done():
+            env.dispatch()
+            if not env.event_queue:
+                break
+    return env.move_log.total_time() if env.is_done() else float('inf')
\ No newline at end of file
@@ -0,0 +1,656 @@
+"""
+小规模精确调度
+对任务的前若干片晶圆建立析取式混合整数规划，用scipy.optimize.milp求最优调度，
+作为启发式调度的基准最优解，也可作为完整任务调度的开头部分
+"""
+
+import math
+import time
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import coo_array
+from typing import Dict, List, Optional, Tuple
+
+from environment.fab_environment import FabEnvironment
+from environment.bounds import RouteTable, bound_report
+from environment.move_log import MOVE_DTYPE, MoveLog
+from environment.result_writer import ResultWriter
+from environment.validation import schedule_violations
+from config.equipment_config import MOVE_TYPES, DOOR_PARAMS
+from config.process_config import PROCESS_TIME_TABLE
+from solvers.greedy import complete_greedily
+
+PICK, PLACE, TRANS, PREPARE, COMPLETE, PUMP, VENT, PROCESS = (
+    MOVE_TYPES[name] for name in ('PICK', 'PLACE', 'TRANS', 'PREPARE', 'COMPLETE', 'PUMP', 'VENT', 'PROCESS'))
+
+CONSTANT = -1  # 线性表达式中常数项的键
+
+
+def prefix_wafers(env: FabEnvironment, count: int) -> List[Dict]:
+    """任务的前count片晶圆配置：各LoadPort按出片顺序轮流取一片，即各批次先出片的晶圆"""
+    queues = {}
+    for config in sorted(env._wafer_configs, key=lambda config: (config['lot_id'], config['wafer_num'])):
+        loadport = f"LoadPort{(config['lot_id'] - 1) % 3 + 1}"
+        queues.setdefault(loadport, []).append(config)
+    selected = []
+    for depth in range(max((len(queue) for queue in queues.values()), default=0)):
+        for loadport in sorted(queues):
+            if depth < len(queues[loadport]) and len(selected) < count:
+                selected.append(queues[loadport][depth])
+    return selected
+
+
+class _Model:
+    """按行累积的线性模型，表达式为{变量编号: 系数}，常数项的键为CONSTANT"""
+    
+    def __init__(self):
+        self.lower, self.upper, self.integrality = [], [], []
+        self.rows, self.row_lower, self.row_upper = [], [], []
+    
+    def variable(self, lower: float = 0.0, upper: float = math.inf, integer: bool = False) -> int:
+        self.lower.append(lower)
+        self.upper.append(upper)
+        self.integrality.append(1 if integer else 0)
+        return len(self.lower) - 1
+    
+    def binary(self, fixed: Optional[int] = None) -> int:
+        return self.variable(0 if fixed is None else fixed, 1 if fixed is None else fixed, integer=True)
+    
+    def lowest(self, expr: Dict[int, float]) -> float:
+        """表达式在变量上下界内的最小值"""
+        return expr.get(CONSTANT, 0.0) + sum(coef * (self.lower[var] if coef > 0 else self.upper[var])
+                                             for var, coef in expr.items() if var != CONSTANT)
+    
+    def at_least(self, expr: Dict[int, float], bound: float = 0.0, upper: float = math.inf):
+        """expr >= bound（以及 <= upper）"""
+        coefs = {var: coef for var, coef in expr.items() if var != CONSTANT and coef != 0}
+        constant = expr.get(CONSTANT, 0.0)
+        self.rows.append(coefs)
+        self.row_lower.append(bound - constant)
+        self.row_upper.append(upper - constant)
+    
+    def solve(self, objective: Dict[int, float], time_limit: float, mip_rel_gap: float):
+        rows = [i for i, coefs in enumerate(self.rows) for _ in coefs]
+        cols = [var for coefs in self.rows for var in coefs]
+        data = [coef for coefs in self.rows for coef in coefs.values()]
+        matrix = coo_array((data, (rows, cols)), shape=(len(self.rows), len(self.lower))).tocsr()
+        c = np.zeros(len(self.lower))
+        for var, coef in objective.items():
+            c[var] = coef
+        return milp(c, integrality=np.array(self.integrality), bounds=Bounds(self.lower, self.upper),
+                    constraints=LinearConstraint(matrix, self.row_lower, self.row_upper),
+                    options={'time_limit': time_limit, 'mip_rel_gap': mip_rel_gap})
+
+
+def _combine(*terms: Tuple[float, Dict[int, float]]) -> Dict[int, float]:
+    """表达式的线性组合"""
+    result = {}
+    for scale, expr in terms:
+        for var, coef in expr.items():
+            result[var] = result.get(var, 0.0) + scale * coef
+    return result
+
+
+class MILPScheduler:
+    """小规模子问题的精确调度器
+    
+    取任务的前wafers片晶圆（各LoadPort轮流出片），按与循环调度相同的单片搬运链建模：
+    每段搬运由一个手臂连续完成取片、转动、放片，腔室占用从放片前开门到下一段取片结束，
+    晶圆在腔室内完成关门、工艺与LoadLock抽充气后可以停留任意时间。决策变量为各步的腔室选择、
+    各段的手臂与开始时刻，同一腔室或同一手臂上的两次占用用次序变量与大M析取，空臂转动与
+    LoadLock两次占用之间的抽充气计入间隔；同批次同工艺的晶圆按编号先后进入PM的各步（超片约束），
+    同一LoadPort按编号先后出片。目标为最小化完工时间。各段开始时刻限制在路径上前后最短时间留出的窗口内
+    （窗口右端为子问题贪心调度的完工时间加一条最长路径的余量），每条析取约束的大M取该约束在窗口内的最大违反量。
+    
+    子问题固定为不清洁（cleaning='off'）、不换片（swap=False）的设置，汇总中的Cleaning与Swap标明这一点，
+    ProvenOptimal即在这一设置下证明最优，不是原设置下的最优或下界。求得的腔室选择、手臂与各段开始时刻
+    直接生成调度（补上空臂转动与LoadLock预先抽充气），按引擎规则校验（environment.validation）通过时
+    完工时间即模型最优值；有违规、求解器未给出可行解或贪心调度完工更早时改用同一设置下子问题的贪心调度。
+    
+    规模：单CPU上默认5片时任务b、c、d在60秒内证明最优（b约50秒，c、d约10秒）；任务a的路径重入同组PM，
+    3片起即常在60秒内只能给出可行解（MILPStatus为TimeLimit，MILPBound为下界），需要更长的time_limit或接受间隙。
+    """
+    
+    def __init__(self, env: FabEnvironment, wafers: int = 5, time_limit: float = 60.0,
+                 mip_rel_gap: float = 1e-5):
+        self.env = env
+        self.wafer_configs = prefix_wafers(env, wafers)
+        self.sub_env = env.sub_environment(self.wafer_configs, swap=False, cleaning='off')
+        self.time_limit = time_limit
+        self.mip_rel_gap = mip_rel_gap
+        self.plan: Optional[List[Tuple[float, str, int, str]]] = None
+        self.status: Optional[str] = None
+        self.objective: Optional[float] = None
+        self.dual_bound: Optional[float] = None
+        self.greedy_time: Optional[float] = None
+        self.solve_time = 0.0
+        self.move_log: Optional[MoveLog] = None
+        self.violations: List[Dict] = []
+        self.greedy_env: Optional[FabEnvironment] = None  # 改用贪心调度时的子问题仿真环境
+    
+    # ---- 模型 ----
+    
+    def _build(self, horizon: float):
+        """建立子问题的模型
+        
+        返回(模型, 完工时间变量, 各片的(晶圆, 路径表, 各位置可选模块, 腔室选择变量, 各段组合变量, 各段TM, 各段开始时刻),
+        各段搬运的(晶圆, 段号, 手臂选择变量, TM), 各TM的手臂)。
+        """
+        env = self.sub_env
+        topology = env.topology
+        model = _Model()
+        open_time = DOOR_PARAMS['open_time']
+        
+        wafers = []
+        for wafer in env.wafers:
+            table = RouteTable(env, wafer.process_type_id, env.get_loadport_name(wafer))
+            loadport = env.get_loadport_name(wafer)
+            modules = [[loadport], *env._step_option_names[wafer.process_type_id], [loadport]]
+            choice = [{name: model.binary() if len(names) > 1 else None for name in names} for names in modules]
+            for names in choice:
+                if len(names) > 1:
+                    model.at_least({var: 1.0 for var in names.values()}, 1.0, 1.0)
+            pairs, tms = [], []
+            for hop, hop_pairs in enumerate(table.hops):
+                hop_tms = {table.hop_tm[pair] for pair in hop_pairs}
+                if len(hop_tms) != 1:
+                    raise ValueError(f"第{hop}段搬运的可选腔室分属不同TM或没有直达的机械臂: {sorted(hop_tms)}")
+                tms.append(hop_tms.pop())
+                if len(hop_pairs) == 1:
+                    pairs.append({hop_pairs[0]: None})
+                    continue
+                # 组合变量由两端的腔室选择唯一确定，取连续变量即可
+                variables = {pair: model.variable(0.0, 1.0) for pair in hop_pairs}
+                pairs.append(variables)
+                for side, names in ((0, choice[hop]), (1, choice[hop + 1])):
+                    for name, var in names.items():
+                        expr = {variables[pair]: 1.0 for pair in hop_pairs if pair[side] == name}
+                        expr[CONSTANT] = -1.0 if var is None else 0.0
+                        if var is not None:
+                            expr[var] = -1.0
+                        model.at_least(expr, 0.0, 0.0)
+            # 开始时刻窗口：出发后最早的开始时刻，到完工前留出其后最短的剩余路径
+            starts = [model.variable(min(table.forward[hop][pair] - table.hop_time[pair] for pair in hop_pairs),
+                                     horizon - min(table.backward[hop].values()))
+                      for hop, hop_pairs in enumerate(table.hops)]
+            wafers.append((wafer, table, modules, choice, pairs, tms, starts))
+        
+        def chosen(pairs_of_hop: Dict, values: Dict) -> Dict[int, float]:
+            """按腔室组合取值的表达式"""
+            expr = {}
+            for pair, var in pairs_of_hop.items():
+                if var is None:
+                    expr[CONSTANT] = expr.get(CONSTANT, 0.0) + values[pair]
+                else:
+                    expr[var] = values[pair]
+            return expr
+        
+        def slack(conditions: List[Tuple[Optional[int], bool]], big_m: float) -> Tuple[Dict[int, float], float]:
+            """析取约束的松弛量M*Σ|变量-取值|，条件(变量, 取值)全部成立时为0，返回(表达式, 常数)"""
+            expr, constant = {}, 0.0
+            for var, value in conditions:
+                if var is None:
+                    continue
+                if value:
+                    expr[var] = expr.get(var, 0.0) - big_m
+                    constant += big_m
+                else:
+                    expr[var] = expr.get(var, 0.0) + big_m
+            return expr, constant
+        
+        def disjunct(later: Dict, earlier: Dict, gap: float, conditions: List[Tuple[Optional[int], bool]]):
+            """条件全部成立时 later >= earlier + gap，大M取窗口内的最大违反量，在窗口内恒成立时不加约束"""
+            difference = _combine((1.0, later), (-1.0, earlier))
+            big_m = gap - model.lowest(difference)
+            if big_m <= 0:
+                return
+            expr, constant = slack(conditions, big_m)
+            model.at_least(_combine((1.0, difference), (1.0, expr)), gap - constant)
+        
+        # 各段的开始、放片开始与结束，各步的开门与取走结束
+        def start(w: int, hop: int) -> Dict[int, float]:
+            return {wafers[w][6][hop]: 1.0}
+        
+        def place_start(w: int, hop: int) -> Dict[int, float]:
+            _, table, _, _, pairs, tms, starts = wafers[w]
+            tm = tms[hop]
+            moves = {pair: topology.pick_times[tm] + topology.move_time(tm, topology.positions[tm][pair[0]],
+                                                                         topology.positions[tm][pair[1]])
+                     for pair in pairs[hop]}
+            return _combine((1.0, start(w, hop)), (1.0, chosen(pairs[hop], moves)))
+        
+        def end(w: int, hop: int) -> Dict[int, float]:
+            _, table, _, _, pairs, _, _ = wafers[w]
+            return _combine((1.0, start(w, hop)), (1.0, chosen(pairs[hop], table.hop_time)))
+        
+        def entry(w: int, step: int) -> Dict[int, float]:
+            return _combine((1.0, place_start(w, step)), (1.0, {CONSTANT: -open_time}))
+        
+        def pick_end(w: int, step: int) -> Dict[int, float]:
+            tm = wafers[w][5][step + 1]
+            return _combine((1.0, start(w, step + 1)), (1.0, {CONSTANT: topology.pick_times[tm]}))
+        
+        def conditioning(name: str, from_vacuum: bool, to_vacuum: bool) -> float:
+            chamber = env.chambers[name]
+            if from_vacuum == to_vacuum or not getattr(chamber, 'can_pump_vent', False):
+                return 0.0
+            return chamber.pump_time if to_vacuum else chamber.vent_time
+        
+        def gap_after(name: str, from_vacuum: bool, to_vacuum: bool) -> float:
+            """上次取走结束到开门的最小间隔：抽充气可与开门同时进行，但须在放片前完成"""
+            return max(0.0, conditioning(name, from_vacuum, to_vacuum) - open_time)
+        
+        # 单片路径：搬运结束后在腔室内关门、工艺、抽充气，之后才能开始下一段
+        makespan = model.variable(max(item[1].length for item in wafers), horizon)
+        for w, (wafer, table, modules, choice, pairs, tms, starts) in enumerate(wafers):
+            for step in range(len(starts) - 1):
+                stays = {}
+                for name in modules[step + 1]:
+                    source = next(a for a, b in table.hops[step] if b == name)
+                    target = next(c for b, c in table.hops[step + 1] if b == name)
+                    stays[name] = table.stay(step, source, name, target)
+                stay = {CONSTANT: stays[name]} if choice[step + 1][name] is None else {}
+                for name, var in choice[step + 1].items():
+                    if var is not None:
+                        stay[var] = stays[name]
+                model.at_least(_combine((1.0, start(w, step + 1)), (-1.0, end(w, step)), (-1.0, stay)))
+            model.at_least(_combine((1.0, {makespan: 1.0}), (-1.0, end(w, len(starts) - 1))))
+        
+        # 同一LoadPort按编号先后出片，同批次同工艺按编号先后进入PM的各步
+        order = sorted(range(len(wafers)), key=lambda w: (wafers[w][0].lot_id, wafers[w][0].wafer_num))
+        previous = {}
+        for w in order:
+            wafer, _, modules, *_ = wafers[w]
+            loadport = modules[0][0]
+            if loadport in previous:
+                model.at_least(_combine((1.0, start(w, 0)), (-1.0, start(previous[loadport], 0))))
+            previous[loadport] = w
+            key = wafer.lot_id, wafer.process_type
+            if key in previous:
+                for step, names in enumerate(modules[1:-1]):
+                    if all(name.startswith('PM') for name in names):
+                        model.at_least(_combine((1.0, start(w, step)), (-1.0, start(previous[key], step))))
+            previous[key] = w
+        
+        # 腔室：同一腔室的两次占用不重叠，LoadLock在两次占用之间切换气氛
+        uses = [(w, step, name) for w, item in enumerate(wafers) for step, names in enumerate(item[2][1:-1])
+                for name in names]
+        for w, step, name in uses:
+            tms = wafers[w][5]
+            initial = bool(getattr(env.chambers[name], 'is_vacuum', True))
+            gap = gap_after(name, initial, tms[step] != 'TM1')
+            if gap > 0:
+                disjunct(entry(w, step), {}, gap, [(wafers[w][3][step + 1][name], True)])
+        for i, (w, step, name) in enumerate(uses):
+            for v, other_step, other_name in uses[i + 1:]:
+                if v == w or other_name != name:
+                    continue
+                same_step = step == other_step and wafers[w][0].lot_id == wafers[v][0].lot_id \
+                    and wafers[w][0].process_type == wafers[v][0].process_type and name.startswith('PM')
+                # 超片约束已确定同一步同一PM的先后
+                first = model.binary(1 if same_step else None)
+                conditions = [(wafers[w][3][step + 1][name], True), (wafers[v][3][other_step + 1][name], True)]
+                for (a, a_step), (b, b_step), value in (((w, step), (v, other_step), True),
+                                                        ((v, other_step), (w, step), False)):
+                    # 腔室取空后才能派发下一片，LoadLock的抽充气须在放片前完成
+                    disjunct(start(b, b_step), pick_end(a, a_step), 0.0, conditions + [(first, value)])
+                    gap = gap_after(name, wafers[a][5][a_step + 1] != 'TM1', wafers[b][5][b_step] != 'TM1')
+                    if gap > 0:
+                        disjunct(entry(b, b_step), pick_end(a, a_step), gap, conditions + [(first, value)])
+        
+        # 机械臂：每段搬运选一个手臂，同一手臂的两段搬运之间完成空臂转动
+        arm_ids = {tm: [arm_id for arm_id, arm in env.robot_arms.items() if arm.arm_type == tm]
+                   for tm in topology.positions}
+        initial_positions = {arm_id: arm.current_position for arm_id, arm in env.robot_arms.items()}
+        tasks = []
+        for w, (wafer, table, modules, choice, pairs, tms, starts) in enumerate(wafers):
+            for hop, tm in enumerate(tms):
+                arms = arm_ids[tm]
+                symmetric = len({initial_positions[arm_id] for arm_id in arms}) == 1
+                if len(arms) == 1:
+                    assigned = [None]
+                elif symmetric and not any(task[3] == tm for task in tasks):
+                    assigned = [model.binary(1)] + [model.binary(0) for _ in arms[1:]]  # 手臂对称，首段固定第一个
+                else:
+                    assigned = [model.binary() for _ in arms]
+                    model.at_least({var: 1.0 for var in assigned}, 1.0, 1.0)
+                tasks.append((w, hop, assigned, tm))
+                for arm_id, var in zip(arms, assigned):
+                    for name, choice_var in choice[hop].items():
+                        travel = topology.move_time(tm, initial_positions[arm_id], topology.positions[tm][name])
+                        if travel > 0:
+                            disjunct(start(w, hop), {}, travel, [(var, True), (choice_var, True)])
+        
+        def travels(w: int, hop: int, v: int, other_hop: int, tm: str) -> List[Tuple[float, List]]:
+            """前一段的终点到后一段的起点的空臂转动时间及其成立条件，各组合相同时不带条件"""
+            positions = topology.positions[tm]
+            combos = [(topology.move_time(tm, positions[b], positions[a]),
+                       [(wafers[w][3][hop + 1][b], True), (wafers[v][3][other_hop][a], True)])
+                      for b in wafers[w][2][hop + 1] for a in wafers[v][2][other_hop]]
+            if len({travel for travel, _ in combos}) == 1:
+                return [(combos[0][0], [])]
+            return combos
+        
+        for i, (w, hop, assigned, tm) in enumerate(tasks):
+            for v, other_hop, other_assigned, other_tm in tasks[i + 1:]:
+                if other_tm != tm or (v == w and other_hop == hop + 1):
+                    continue
+                first = model.binary(1 if v == w else None)
+                for var, other_var in zip(assigned, other_assigned):
+                    same_arm = [(var, True), (other_var, True)]
+                    for travel, conditions in travels(w, hop, v, other_hop, tm):
+                        disjunct(start(v, other_hop), end(w, hop), travel, conditions + same_arm + [(first, True)])
+                    if v == w:
+                        continue
+                    for travel, conditions in travels(v, other_hop, w, hop, tm):
+                        disjunct(start(w, hop), end(v, other_hop), travel, conditions + same_arm + [(first, False)])
+        return model, makespan, wafers, tasks, arm_ids
+    
+    # ---- 求解与调度 ----
+    
+    def solve(self) -> Dict:
+        """求解子问题，返回按模型解生成的调度（与run_simulation相同结构）及模型的最优值与界
+        
+        子问题不清洁、不换片。调度按解中的腔室、手臂与各段开始时刻生成，不经环境重放，完工时间即模型的目标值；
+        按引擎规则校验有违规、求解器没有给出可行解或贪心调度完工更早时，改用子问题的贪心调度。
+        """
+        began = time.perf_counter()
+        self.sub_env = self.env.sub_environment(self.wafer_configs, swap=False, cleaning='off')
+        greedy_env = self.sub_env.fork()
+        self.greedy_time = complete_greedily(greedy_env)
+        # 时间窗口取贪心调度完工时间再留一条最长路径的余量，贪心未能完成时取逐片依次走完全程的时间
+        tables = [RouteTable(self.sub_env, wafer.process_type_id, self.sub_env.get_loadport_name(wafer))
+                  for wafer in self.sub_env.wafers]
+        longest = max(float(times.max()) for times in self.sub_env.topology.move_times.values())
+        horizon = min(self.greedy_time + max(table.length for table in tables),
+                      sum(table.length + longest * len(table.hops) for table in tables))
+        
+        model, makespan, wafers, tasks, arm_ids = self._build(horizon)
+        result = model.solve({makespan: 1.0}, self.time_limit, self.mip_rel_gap)
+        self.solve_time = time.perf_counter() - began
+        if result.status == 0:
+            self.status = 'Optimal'
+        else:
+            self.status = 'TimeLimit' if result.x is not None else 'NoSolution'
+        self.objective = None if result.x is None else float(result.fun)
+        bound = getattr(result, 'mip_dual_bound', None)
+        self.dual_bound = None if bound is None or not math.isfinite(bound) else float(bound)
+        
+        self.plan, self.move_log, self.violations = [], None, []
+        if result.x is not None:
+            route, arms, starts = self._decode(result.x, wafers, tasks, arm_ids)
+            self.move_log, dispatches = self._emit(wafers, route, arms, starts)
+            self.violations = schedule_violations(self.sub_env, self.move_log.to_dicts())
+            self.plan = sorted((dispatch_time, wafers[w][0].wafer_id, hop, route[w][hop + 1])
+                               for (w, hop), dispatch_time in dispatches.items() if hop < len(route[w]) - 2)
+        self.greedy_env = None
+        if self.move_log is None or self.violations or self.greedy_time < self.move_log.total_time():
+            self.greedy_env, self.move_log = greedy_env, greedy_env.move_log
+            self.violations = greedy_env.constraint_violations
+        
+        summary = {
+            'TotalTime': self.move_log.total_time(),
+            'CompletedWafers': len(wafers) if self.greedy_env is None else greedy_env.finished_count,
+            'TotalWafers': len(wafers),
+            'ConstraintViolations': self.violations,
+            'MILPStatus': self.status,
+            'MILPObjective': self.objective,
+            'MILPBound': self.dual_bound,
+            'ProvenOptimal': self.status == 'Optimal' and self.greedy_env is None,
+            'GreedyTime': self.greedy_time,
+            'SolveTime': self.solve_time,
+            'Fallback': self.greedy_env is not None,
+            'Cleaning': self.sub_env.cleaning,
+            'Swap': self.sub_env.swap,
+            'Wafers': [wafer.wafer_id for wafer in self.sub_env.wafers],
+        }
+        return {'MoveList': self.move_log.to_dicts(sort=True), **summary}
+    
+    def _decode(self, x: np.ndarray, wafers: List, tasks: List, arm_ids: Dict[str, List[str]]):
+        """解中各片的腔室选择、各段的手臂与开始时刻
+        
+        按解中各腔室与手臂上的先后次序重新推出各段的最早开始时刻，消去求解器在大M约束上的数值误差，
+        所得完工时间不晚于解的目标值。返回(各片路径上的模块, {(片, 段): 手臂}, {(片, 段): 开始时刻})。
+        """
+        env = self.sub_env
+        topology = env.topology
+        open_time = DOOR_PARAMS['open_time']
+        
+        def selected(options: Dict) -> str:
+            return max(options, key=lambda key: 1.0 if options[key] is None else x[options[key]])
+        
+        route = [[selected(names) for names in item[3]] for item in wafers]
+        arms = {(w, hop): arm_ids[tm][selected(dict(enumerate(assigned)))] for w, hop, assigned, tm in tasks}
+        planned = {(w, hop): float(x[var]) for w, item in enumerate(wafers) for hop, var in enumerate(item[6])}
+        
+        def hop_time(w: int, hop: int) -> float:
+            return wafers[w][1].hop_time[route[w][hop], route[w][hop + 1]]
+        
+        def place_offset(w: int, hop: int) -> float:
+            tm, positions = wafers[w][5][hop], topology.positions[wafers[w][5][hop]]
+            return topology.pick_times[tm] + topology.move_time(tm, positions[route[w][hop]],
+                                                                positions[route[w][hop + 1]])
+        
+        # 各段开始时刻的下限：(前一段或None, 后一段, 间隔)，前一段为None时间隔为绝对下限
+        lags = []
+        for w, (wafer, table, modules, choice, pairs, tms, _) in enumerate(wafers):
+            for hop in range(len(tms) - 1):
+                stay = table.stay(hop, route[w][hop], route[w][hop + 1], route[w][hop + 2])
+                lags.append(((w, hop), (w, hop + 1), hop_time(w, hop) + stay))
+        order = sorted(range(len(wafers)), key=lambda w: (wafers[w][0].lot_id, wafers[w][0].wafer_num))
+        previous = {}
+        for w in order:
+            wafer, _, modules, *_ = wafers[w]
+            if modules[0][0] in previous:
+                lags.append(((previous[modules[0][0]], 0), (w, 0), 0.0))
+            previous[modules[0][0]] = w
+            key = wafer.lot_id, wafer.process_type
+            if key in previous:
+                lags.extend(((previous[key], step), (w, step), 0.0)
+                            for step, names in enumerate(modules[1:-1]) if all(name.startswith('PM') for name in names))
+            previous[key] = w
+        
+        for name, chamber in env.chambers.items():
+            uses = sorted(((w, step) for w, path in enumerate(route) for step, module in enumerate(path[1:-1])
+                           if module == name), key=planned.get)
+            can_pump_vent = getattr(chamber, 'can_pump_vent', False)
+            vacuum = bool(getattr(chamber, 'is_vacuum', True))
+            for i, (b, b_step) in enumerate(uses):
+                tms = wafers[b][5]
+                if can_pump_vent and (tms[b_step] != 'TM1') != vacuum:
+                    conditioning = chamber.pump_time if tms[b_step] != 'TM1' else chamber.vent_time
+                    lags.append((None, (b, b_step), conditioning - place_offset(b, b_step)))
+                for a, a_step in uses[:i]:
+                    pick_end = topology.pick_times[wafers[a][5][a_step + 1]]
+                    gap = 0.0
+                    if can_pump_vent and (wafers[a][5][a_step + 1] != 'TM1') != (tms[b_step] != 'TM1'):
+                        conditioning = chamber.pump_time if tms[b_step] != 'TM1' else chamber.vent_time
+                        gap = max(0.0, conditioning - open_time) + open_time - place_offset(b, b_step)
+                    lags.append(((a, a_step + 1), (b, b_step), pick_end + gap))
+        
+        for arm_id in {arm_id for arm_id in arms.values()}:
+            tm = env.robot_arms[arm_id].arm_type
+            positions = topology.positions[tm]
+            arm_tasks = sorted((key for key, assigned in arms.items() if assigned == arm_id), key=planned.get)
+            for i, (v, other_hop) in enumerate(arm_tasks):
+                source = positions[route[v][other_hop]]
+                lags.append((None, (v, other_hop),
+                             topology.move_time(tm, env.robot_arms[arm_id].current_position, source)))
+                for w, hop in arm_tasks[:i]:
+                    lags.append(((w, hop), (v, other_hop),
+                                 hop_time(w, hop) + topology.move_time(tm, positions[route[w][hop + 1]], source)))
+        
+        # 各间隔都沿解中的先后次序，按解的开始时刻依次推进求最长路，开始时刻相同的几段再推进几遍
+        starts = dict.fromkeys(planned, 0.0)
+        lags.sort(key=lambda lag: planned[lag[1]])
+        for _ in range(len(starts)):
+            changed = False
+            for earlier, later, lag in lags:
+                time_needed = lag if earlier is None else starts[earlier] + lag
+                if time_needed > starts[later]:
+                    starts[later], changed = time_needed, True
+            if not changed:
+                break
+        return route, arms, starts
+    
+    def _emit(self, wafers: List, route: List[List[str]], arms: Dict[Tuple[int, int], str],
+              starts: Dict[Tuple[int, int], float]) -> Tuple[MoveLog, Dict[Tuple[int, int], float]]:
+        """按各段的腔室、手臂与开始时刻生成移动记录，返回(移动记录, {(片, 段): 派发时刻})
+        
+        除各片的搬运链外，补上空臂转动与LoadLock放片前的抽充气。
+        """
+        env = self.sub_env
+        topology, codes = env.topology, env.move_log.module_codes
+        open_time = DOOR_PARAMS['open_time']
+        records = []
+        for w, (wafer, _, _, _, _, tms, _) in enumerate(wafers):
+            path = route[w]
+            for hop, tm in enumerate(tms):
+                positions, arm = topology.positions[tm], codes[arms[w, hop]]
+                t = starts[w, hop]
+                records.append((t, t + topology.pick_times[tm], PICK, arm, w))
+                t += topology.pick_times[tm]
+                move_time = topology.move_time(tm, positions[path[hop]], positions[path[hop + 1]])
+                if move_time > 0:
+                    records.append((t, t + move_time, TRANS, arm, w))
+                    t += move_time
+                records.append((t, t + topology.place_times[tm], PLACE, arm, w))
+                place_start, t = t, t + topology.place_times[tm]
+                if hop == len(tms) - 1:
+                    break
+                code, chamber = codes[path[hop + 1]], env.chambers[path[hop + 1]]
+                records.append((place_start - open_time, place_start, PREPARE, code, w))
+                records.append((t, t + DOOR_PARAMS['close_time'], COMPLETE, code, w))
+                t += DOOR_PARAMS['close_time']
+                process_time = PROCESS_TIME_TABLE.item(wafer.process_type_id, hop)
+                if process_time > 0:
+                    records.append((t, t + process_time, PROCESS, code, w))
+                    t += process_time
+                place_vacuum, pick_vacuum = tm != 'TM1', tms[hop + 1] != 'TM1'
+                if place_vacuum != pick_vacuum and getattr(chamber, 'can_pump_vent', False):
+                    conditioning = chamber.pump_time if pick_vacuum else chamber.vent_time
+                    records.append((t, t + conditioning, PUMP if pick_vacuum else VENT, code, w))
+        
+        dispatches = {}
+        for arm_id in {arm_id for arm_id in arms.values()}:
+            tm = env.robot_arms[arm_id].arm_type
+            positions = topology.positions[tm]
+            position = env.robot_arms[arm_id].current_position
+            for w, hop in sorted((key for key, assigned in arms.items() if assigned == arm_id), key=starts.get):
+                move_time = topology.move_time(tm, position, positions[route[w][hop]])
+                if move_time > 0:
+                    records.append((starts[w, hop] - move_time, starts[w, hop], TRANS, codes[arm_id], w))
+                dispatches[w, hop] = starts[w, hop] - move_time
+                position = positions[route[w][hop + 1]]
+        
+        for name, chamber in env.chambers.items():
+            uses = sorted(((w, step) for w, path in enumerate(route) for step, module in enumerate(path[1:-1])
+                           if module == name), key=starts.get)
+            vacuum = bool(getattr(chamber, 'is_vacuum', True))
+            for w, step in uses:
+                tms = wafers[w][5]
+                tm, positions = tms[step], topology.positions[tms[step]]
+                place_start = starts[w, step] + topology.pick_times[tm] + topology.move_time(
+                    tm, positions[route[w][step]], positions[name])
+                if getattr(chamber, 'can_pump_vent', False) and (tm != 'TM1') != vacuum:
+                    conditioning = chamber.pump_time if tm != 'TM1' else chamber.vent_time
+                    records.append((place_start - conditioning, place_start, PUMP if tm != 'TM1' else VENT,
+                                    codes[name], w))
+                vacuum = tms[step + 1] != 'TM1'
+        
+        block = np.zeros(len(records), dtype=MOVE_DTYPE)
+        for field, values in zip(('StartTime', 'EndTime', 'MoveType', 'ModuleID', 'WaferID'), zip(*records)):
+            block[field] = values
+        block = block[np.lexsort((block['MoveType'], block['StartTime']))]
+        block['MoveID'] = np.arange(len(block))
+        block['SlotID'] = 1
+        move_log = MoveLog(env.move_log.module_names, env.move_log.wafer_ids, capacity=max(len(block), 1))
+        move_log.extend(block)
+        return move_log, dispatches
+    
+    def warm_start(self, env: Optional[FabEnvironment] = None, horizon: Optional[float] = None) -> Dict:
+        """以子问题的最优调度开头完成整个任务
+        
+        按模型解中派发时刻不晚于horizon的派发重放（默认到子问题最后一片出片），其余按环境的派发规则贪心完成；
+        求解器未给出可行解时没有计划，即整个任务按派发规则贪心完成。env默认为构造时的环境，须处于初始状态。
+        """
+        if self.plan is None:
+            self.solve()
+        env = self.env if env is None else env
+        if horizon is None:
+            horizon = max((start for start, _, step, _ in self.plan if step == 0), default=0.0)
+        replay_plan(env, [item for item in self.plan if item[0] <= horizon])
+        return {'MoveList': env.move_log.to_dicts(sort=True), **env._result_summary()}
+    
+    def save_results(self, filename: str, result_format: str = 'json') -> Dict:
+        """求解子问题并保存调度结果文件，返回汇总信息"""
+        result = self.solve()
+        summary = {key: value for key, value in result.items() if key != 'MoveList'}
+        summary.update(bound_report(self.sub_env, summary['TotalTime']))
+        with ResultWriter(filename, result_format) as writer:
+            writer.close(self.move_log, summary)
+        
+        print(f"结果已保存到 {filename}")
+        model = f"最优值 {self.objective:.2f}秒" if self.objective is not None else "未找到可行解"
+        if self.dual_bound is not None:
+            model += f", 界 {self.dual_bound:.2f}秒"
+        print(f"子问题: {len(summary['Wafers'])}片晶圆(不清洁、不换片), 模型{self.status}, {model}, 求解 {self.solve_time:.2f}秒")
+        print(f"完工时间: {summary['TotalTime']:.2f}秒 (贪心 {self.greedy_time:.2f}秒)"
+              + (", 已证明最优" if summary['ProvenOptimal'] else "")
+              + (", 已改用贪心调度" if summary['Fallback'] else ""))
+        return summary
+
+
+def replay_plan(env: FabEnvironment, plan: List[Tuple[float, str, int, str]]):
+    """按计划在环境中派发后贪心完成
+    
+    plan为(开始时刻, 晶圆编号, 工艺步, 腔室)。每项不早于计划时刻派发，同一晶圆与同一腔室的各项按计划先后进行，
+    不能立即送入时等待环境的下一事件；空闲PM的下一片计划晶圆需要换工艺或片数清洁时立即清洁，不等到晶圆就绪。
+    计划项用完后按环境的派发规则完成其余搬运。
+    """
+    index_of = {wafer.wafer_id: index for index, wafer in enumerate(env.wafers)}
+    pending = sorted(plan)
+    while pending and not env.is_deadlocked():
+        _clean_ahead(env, pending, index_of)
+        dispatched = False
+        blocked = set()
+        for item in list(pending):
+            planned, wafer_id, step, name = item
+            if planned > env.current_time + 1e-9:
+                break
+            wafer = env.wafers[index_of[wafer_id]]
+            if wafer_id in blocked or name in blocked:
+                continue
+            if wafer.current_step == step and env.dispatch_wafer(wafer, env.chambers[name]):
+                pending.remove(item)
+                dispatched = True
+            else:
+                blocked.update((wafer_id, name))
+        env.dispatch_exits()
+        if dispatched:
+            continue
+        next_event = env.event_queue.peek_time()
+        next_planned = next((item[0] for item in pending if item[0] > env.current_time + 1e-9), None)
+        if next_event is None and next_planned is None:
+            break
+        if next_planned is None or (next_event is not None and next_event <= next_planned):
+            env.advance_to_next_event()
+        else:
+            env.advance_time(next_planned - env.current_time)
+    complete_greedily(env)
+
+
+def _clean_ahead(env: FabEnvironment, pending: List[Tuple[float, str, int, str]], index_of: Dict[str, int]):
+    """空闲PM按下一片计划晶圆提前做换工艺或片数清洁"""
+    reserved = set(env._committed.values())
+    seen = set()
+    for _, wafer_id, _, name in pending:
+        if name in seen or not name.startswith('PM'):
+            continue
+        seen.add(name)
+        chamber = env.chambers[name]
+        if name in reserved or not env._free_mask.mask & (1 << (chamber.chamber_id - 1)):
+            continue
+        clean_type = env.clean_required(chamber, env.wafers[index_of[wafer_id]])
+        if clean_type in ('process_switch', 'wafer_count'):
+            env._start_clean(chamber, clean_type, index_of[wafer_id], env.current_time)
\ No newline at end of file
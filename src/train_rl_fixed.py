@@ -12,11 +12,12 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from training.multi_agent_trainer_fixed import MultiAgentTrainer
+from config.task_config import task_name
 
 def main():
     parser = argparse.ArgumentParser(description='修复后的多智能体强化学习训练')
-    parser.add_argument('--task', type=str, choices=['a', 'b', 'c', 'd'], 
-                       required=True, help='要训练的任务 (a, b, c, d)')
+    parser.add_argument('--task', type=task_name, required=True,
+                       help='要训练的任务 (a, b, c, d，或 gen:lots=400,size=25,mix=A:2/B:1,seed=0 生成任务)')
     parser.add_argument('--episodes', type=int, default=200,
                        help='训练回合数 (默认200)')
     parser.add_argument('--output_dir', type=str, default='output',
@@ -27,6 +28,16 @@ def main():
                        help='初始探索率 (默认0.8)')
     parser.add_argument('--max_steps', type=int, default=1500,
                        help='每回合最大步数 (默认1500)')
+    parser.add_argument('--time_skipping', action='store_true',
+                       help='跳过无决策时段，直接推进到下一个决策时刻')
+    parser.add_argument('--history', type=str, default='off',
+                       help='对象历史记录策略: off、ring:N、full (默认off)')
+    parser.add_argument('--target_gap', type=float, default=None,
+                       help='完工时间与下界的差距不超过该值（如0.05）时提前结束训练 (默认不提前结束)')
+    parser.add_argument('--num_envs', type=int, default=1,
+                       help='向量化环境副本数，大于1时同时训练多个回合 (默认1)')
+    parser.add_argument('--num_workers', type=int, default=1,
+                       help='向量化环境的工作进程数 (默认1)')
     
     args = parser.parse_args()
     
@@ -43,7 +54,12 @@ def main():
         'epsilon_end': 0.05,
         'epsilon_decay': 0.998,
         'save_interval': max(10, args.episodes // 10),  # 动态调整保存间隔
-        'log_interval': max(5, args.episodes // 20)     # 动态调整日志间隔
+        'log_interval': max(5, args.episodes // 20),    # 动态调整日志间隔
+        'time_skipping': args.time_skipping,
+        'history': args.history,
+        'target_gap': args.target_gap,
+        'num_envs': args.num_envs,
+        'num_workers': args.num_workers
     }
     
     print("="*60)
@@ -13,6 +13,8 @@ from agents.wafer_agent import WaferAgent
 from agents.chamber_agent import ChamberAgent
 from agents.robot_agent import RobotAgent
 from environment.fab_environment import FabEnvironment
+from environment.deadlock import DEADLOCK_PENALTY
+from environment.bounds import makespan_lower_bound, optimality_gap
 
 class MultiAgentTrainer:
     """多智能体训练器"""
@@ -21,8 +23,10 @@ class MultiAgentTrainer:
         self.task_name = task_name
         self.config = config or self._get_default_config()
         
-        # 创建环境
-        self.env = FabEnvironment(task_name)
+        # 创建环境，并保存初始状态快照用于每回合重置
+        self.env = FabEnvironment(task_name, history=self.config.get('history', 'off'))
+        self._initial_snapshot = self.env.snapshot()
+        self.lower_bound = makespan_lower_bound(self.env)['LowerBound']
         
         # 创建智能体
         self.wafer_agents = self._create_wafer_agents()
@@ -45,7 +49,10 @@ class MultiAgentTrainer:
             'epsilon_end': 0.01,
             'epsilon_decay': 0.995,
             'save_interval': 100,
-            'log_interval': 10
+            'log_interval': 10,
+            'history': 'off',  # 训练时不保留对象历史记录
+            'deadlock_penalty': DEADLOCK_PENALTY,  # 回合因死锁终止时扣除的奖励
+            'target_gap': None  # 完工时间与下界的差距不超过该值时提前结束训练，None为不提前结束
         }
     
     def _create_wafer_agents(self) -> Dict[str, WaferAgent]:
@@ -76,23 +83,8 @@ class MultiAgentTrainer:
         return agents
     
     def reset_environment(self):
-        """重置环境"""
-        self.env = FabEnvironment(self.task_name)
-        
-        # 重新关联智能体
-        for wafer_id, agent in self.wafer_agents.items():
-            for wafer in self.env.wafers:
-                if wafer.wafer_id == wafer_id:
-                    agent.wafer = wafer
-                    break
-        
-        for chamber_name, agent in self.chamber_agents.items():
-            if chamber_name in self.env.chambers:
-                agent.chamber = self.env.chambers[chamber_name]
-        
-        for arm_name, agent in self.robot_agents.items():
-            if arm_name in self.env.robot_arms:
-                agent.robot_arm = self.env.robot_arms[arm_name]
+        """重置环境：从初始快照恢复，智能体持有的对象保持不变，无需重新关联"""
+        self.env.restore(self._initial_snapshot)
     
     def train_episode(self) -> Dict:
         """训练一个回合"""
@@ -182,6 +174,10 @@ class MultiAgentTrainer:
             
             # 推进环境
             self.env.step()
+            if self.env.is_deadlocked():
+                # 死锁后不再有晶圆能推进，立即结束回合并扣除惩罚
+                episode_reward -= self.config.get('deadlock_penalty', DEADLOCK_PENALTY)
+                break
         
         # 更新探索率
         self._update_epsilon()
@@ -190,7 +186,8 @@ class MultiAgentTrainer:
             'episode_reward': episode_reward,
             'completion_time': self.env.current_time,
             'completed_wafers': len([w for w in self.env.wafers if w.is_completed()]),
-            'total_steps': step_count
+            'total_steps': step_count,
+            'deadlocked': self.env.is_deadlocked()
         }
     
     def _execute_actions_and_get_rewards(self, actions: Dict) -> Dict[str, float]:
@@ -292,9 +289,9 @@ class MultiAgentTrainer:
             self.episode_times.append(episode_result['completion_time'])
             
             # 记录最佳结果
-            if episode_result['completion_time'] < self.best_time:
+            if not episode_result['deadlocked'] and episode_result['completion_time'] < self.best_time:
                 self.best_time = episode_result['completion_time']
-                self.best_solution = self.env.move_list.copy()
+                self.best_solution = self.env.move_log.to_dicts(sort=True)
             
             # 日志输出
             if episode % self.config['log_interval'] == 0:
@@ -305,6 +302,11 @@ class MultiAgentTrainer:
             # 保存检查点
             if episode % self.config['save_interval'] == 0:
                 self.save_checkpoint(episode)
+            
+            if self._reached_target_gap(episode_result):
+                print(f"Episode {episode}: 完工时间{episode_result['completion_time']:.2f}与下界"
+                      f"{self.lower_bound:.2f}的差距已达到目标，提前结束训练")
+                break
         
         return {
             'best_time': self.best_time,
@@ -313,6 +315,13 @@ class MultiAgentTrainer:
             'episode_times': self.episode_times
         }
     
+    def _reached_target_gap(self, episode_result: Dict) -> bool:
+        """本回合完成了全部晶圆，且完工时间与下界的差距不超过target_gap"""
+        target_gap = self.config.get('target_gap')
+        return (target_gap is not None and not episode_result['deadlocked']
+                and episode_result['completed_wafers'] == len(self.env.wafers)
+                and optimality_gap(episode_result['completion_time'], self.lower_bound) <= target_gap)
+    
     def save_checkpoint(self, episode: int):
         """保存训练检查点"""
         checkpoint_dir = f"checkpoints/task_{self.task_name}"
@@ -341,6 +350,9 @@ class MultiAgentTrainer:
         result = {
             'MoveList': self.best_solution or [],
             'TotalTime': self.best_time,
+            'LowerBound': self.lower_bound,
+            'OptimalityGap': (optimality_gap(self.best_time, self.lower_bound)
+                              if self.best_time != float('inf') else None),
             'TrainingStats': {
                 'episodes': len(self.episode_rewards),
                 'final_avg_reward': np.mean(self.episode_rewards[-100:]) if self.episode_rewards else 0,
@@ -353,4 +365,7 @@ class MultiAgentTrainer:
             json.dump(result, f, indent=2, ensure_ascii=False)
         
         print(f"最终结果已保存到 {filename}")
+        if result['OptimalityGap'] is not None:
+            print(f"最佳完工时间: {self.best_time:.2f}秒, 下界: {self.lower_bound:.2f}秒, "
+                  f"差距: {result['OptimalityGap']:.2%}")
         return filename
\ No newline at end of file
@@ -17,6 +17,11 @@ from agents.wafer_agent_fixed import WaferAgent
 from agents.chamber_agent import ChamberAgent
 from agents.robot_agent import RobotAgent
 from environment.fab_environment import FabEnvironment
+from environment.deadlock import DEADLOCK_PENALTY
+from environment.bounds import makespan_lower_bound, optimality_gap
+from environment.vec_env import make_vec_env
+from config.equipment_config import EQUIPMENT_ID_TO_NAME
+from config.task_config import task_label
 
 class MultiAgentTrainer:
     """多智能体训练器"""
@@ -25,17 +30,27 @@ class MultiAgentTrainer:
         self.task_name = task_name
         self.config = config or self._get_default_config()
         
-        # 创建环境
-        self.env = FabEnvironment(task_name)
+        # 创建环境，并保存初始状态快照用于每回合重置
+        self.env = FabEnvironment(task_name, history=self.config.get('history', 'off'))
+        self._initial_snapshot = self.env.snapshot()
+        self.lower_bound = makespan_lower_bound(self.env)['LowerBound']
         
         # 创建智能体
         self.wafer_agents = self._create_wafer_agents()
         self.chamber_agents = self._create_chamber_agents()
         self.robot_agents = self._create_robot_agents()
         
+        # num_envs大于1时在向量化环境中同时训练多个回合，晶圆智能体按行号对应各副本的同一片晶圆
+        self.vec_env = None
+        if self.config.get('num_envs', 1) > 1:
+            self.vec_env = make_vec_env(task_name, self.config['num_envs'], self.config.get('num_workers', 1),
+                                        history=self.config.get('history', 'off'))
+            self._wafer_agent_rows = [self.wafer_agents[wafer.wafer_id] for wafer in self.env.wafers]
+        
         # 训练统计
         self.episode_rewards = []
         self.episode_times = []
+        self.episode_steps = []
         self.best_time = float('inf')
         self.best_solution = None
         
@@ -54,7 +69,13 @@ class MultiAgentTrainer:
             'epsilon_end': 0.05,  # 提高最终探索率
             'epsilon_decay': 0.998,  # 更慢的衰减
             'save_interval': 50,  # 更频繁保存
-            'log_interval': 10
+            'log_interval': 10,
+            'time_skipping': False,  # 直接跳到下一个决策时刻
+            'history': 'off',  # 训练时不保留对象历史记录
+            'deadlock_penalty': DEADLOCK_PENALTY,  # 回合因死锁终止时扣除的奖励
+            'target_gap': None,  # 完工时间与下界的差距不超过该值时提前结束训练，None为不提前结束
+            'num_envs': 1,  # 大于1时用向量化环境同时训练多个回合（跳时模式）
+            'num_workers': 1  # 向量化环境的工作进程数
         }
     
     def _create_wafer_agents(self) -> Dict[str, WaferAgent]:
@@ -88,23 +109,8 @@ class MultiAgentTrainer:
         return agents
     
     def reset_environment(self):
-        """重置环境"""
-        self.env = FabEnvironment(self.task_name)
-        
-        # 重新关联智能体
-        for wafer_id, agent in self.wafer_agents.items():
-            for wafer in self.env.wafers:
-                if wafer.wafer_id == wafer_id:
-                    agent.wafer = wafer
-                    break
-        
-        for chamber_name, agent in self.chamber_agents.items():
-            if chamber_name in self.env.chambers:
-                agent.chamber = self.env.chambers[chamber_name]
-        
-        for arm_name, agent in self.robot_agents.items():
-            if arm_name in self.env.robot_arms:
-                agent.robot_arm = self.env.robot_arms[arm_name]
+        """重置环境：从初始快照恢复，智能体持有的对象保持不变，无需重新关联"""
+        self.env.restore(self._initial_snapshot)
     
     def train_episode(self) -> Dict:
         """训练一个回合"""
@@ -113,24 +119,39 @@ class MultiAgentTrainer:
         episode_reward = 0.0
         step_count = 0
         completed_wafers = 0
+        time_skipping = self.config.get('time_skipping', False)
         
         try:
+            if time_skipping:
+                self.env.advance_to_next_decision()
+            
             while step_count < self.config['max_steps_per_episode']:
                 # 检查完成状态
-                current_completed = len([w for w in self.env.wafers if w.is_completed()])
-                if current_completed > completed_wafers:
-                    completed_wafers = current_completed
+                completed_wafers = self.env.finished_count
                 
-                if completed_wafers >= len(self.env.wafers):
+                if self.env.is_done():
                     break
                 
                 # 简化的智能体交互
+                moves_before = len(self.env.move_log)
                 step_reward = self._execute_simplified_step()
                 episode_reward += step_reward
                 step_count += 1
                 
                 # 推进环境时间
-                self.env.current_time += 1.0
+                if time_skipping:
+                    if len(self.env.move_log) == moves_before:
+                        # 本决策时刻全部选择等待，推迟到下一个事件
+                        self.env.advance_to_next_event()
+                    self.env.advance_to_next_decision()
+                else:
+                    self.env.advance_time(1.0)
+                    self.env.dispatch_exits()
+                
+                if self.env.is_deadlocked():
+                    # 死锁后不再有晶圆能推进，立即结束回合并扣除惩罚
+                    episode_reward -= self.config.get('deadlock_penalty', DEADLOCK_PENALTY)
+                    break
                 
                 # 每100步检查一次进度
                 if step_count % 100 == 0:
@@ -142,22 +163,66 @@ class MultiAgentTrainer:
             print(f"训练回合出错: {e}")
             # 继续训练，不中断
         
+        completed_wafers = self.env.finished_count
+        
         # 更新探索率
         self._update_epsilon()
         
         return {
             'episode_reward': episode_reward,
-            'completion_time': self.env.current_time,
+            'completion_time': self.env.current_time,  # 仿真时长，与决策步数分开记录
             'completed_wafers': completed_wafers,
-            'total_steps': step_count
+            'total_steps': step_count,
+            'deadlocked': self.env.is_deadlocked()
         }
     
+    def train_vectorized_episodes(self) -> List[Dict]:
+        """在向量化环境中同时训练num_envs个回合，各副本共享晶圆智能体的Q表
+        
+        每步为一个决策时刻，只有存在非等待动作的晶圆参与决策，奖励为该步推进的仿真时长的相反数
+        （死锁另扣惩罚），与VecFabEnv.step一致。返回各副本的回合结果。
+        """
+        obs, masks = self.vec_env.reset()
+        num_envs = self.vec_env.num_envs
+        episode_rewards = np.zeros(num_envs)
+        step_counts = np.zeros(num_envs, dtype=int)
+        dones = np.zeros(num_envs, dtype=bool)
+        
+        for _ in range(self.config['max_steps_per_episode']):
+            decisions = np.nonzero(masks[..., 1:].any(axis=-1) & ~dones[:, None])
+            states = obs[decisions]
+            actions = np.zeros(masks.shape[:2], dtype=np.int64)
+            for (i, row), state in zip(zip(*decisions), states):
+                agent = self._wafer_agent_rows[row]
+                actions[i, row] = agent.select_action(state, np.flatnonzero(masks[i, row]).tolist())
+            
+            active = ~dones
+            obs, rewards, dones, masks = self.vec_env.step(actions)
+            for (i, row), state in zip(zip(*decisions), states):
+                self._wafer_agent_rows[row].update_policy(state, actions[i, row], rewards[i], obs[i, row], dones[i])
+            episode_rewards += rewards
+            step_counts += active
+            if dones.all():
+                break
+        
+        self._update_epsilon()
+        
+        results = []
+        for i, summary in enumerate(self.vec_env.summaries()):
+            results.append({'episode_reward': episode_rewards[i], 'total_steps': int(step_counts[i]),
+                            'replica': i, **summary})
+        return results
+    
     def _execute_simplified_step(self) -> float:
         """执行简化的训练步骤"""
         total_reward = 0.0
         
         # 只训练部分智能体以提高效率
-        active_wafers = [w for w in self.env.wafers if not w.is_completed()]
+        if self.config.get('time_skipping', False):
+            # 跳时模式下只有存在非等待动作的晶圆参与决策
+            active_wafers = self.env.get_decision_wafers()
+        else:
+            active_wafers = [w for w in self.env.wafers if not w.is_completed()]
         
         # 随机选择一些晶圆进行训练
         if active_wafers:
@@ -213,14 +278,12 @@ class MultiAgentTrainer:
                     result['flexible_choice'] = True
                     result['follows_process_route'] = True
                     
-                    # 检查腔室是否可用
-                    available_chambers = self.env.get_available_chambers_for_wafer(agent.wafer)
-                    if available_chambers:
+                    # 所选腔室可立即送入时由环境执行搬运
+                    chamber_name = EQUIPMENT_ID_TO_NAME.get(flexible_options[action - 1])
+                    target_chamber = self.env.chambers.get(chamber_name)
+                    if target_chamber is not None and self.env.dispatch_wafer(agent.wafer, target_chamber):
                         result['chamber_available'] = True
-                        # 模拟步骤完成
-                        if np.random.random() < 0.3:  # 30%概率完成步骤
-                            result['step_completed'] = True
-                            agent.wafer.advance_step()
+                        result['step_completed'] = True
         
         except Exception as e:
             result['constraint_violation'] = True
@@ -246,15 +309,24 @@ class MultiAgentTrainer:
         
         best_episodes = []  # 记录最佳回合
         
-        for episode in range(self.config['episodes']):
+        episode = 0
+        stop = False
+        while episode < self.config['episodes'] and not stop:
             try:
-                episode_result = self.train_episode()
-                
+                batch = self.train_vectorized_episodes() if self.vec_env is not None else [self.train_episode()]
+            except Exception as e:
+                print(f"Episode {episode} 出错: {e}")
+                if self.vec_env is not None:
+                    self.vec_env.close()
+                raise
+            
+            for episode_result in batch[:self.config['episodes'] - episode]:
                 self.episode_rewards.append(episode_result['episode_reward'])
                 self.episode_times.append(episode_result['completion_time'])
+                self.episode_steps.append(episode_result['total_steps'])
                 
                 # 记录最佳结果
-                if episode_result['completed_wafers'] > 0:  # 只考虑有完成晶圆的回合
+                if episode_result['completed_wafers'] > 0 and not episode_result['deadlocked']:  # 只考虑有完成晶圆且未死锁的回合
                     completion_rate = episode_result['completed_wafers'] / len(self.env.wafers)
                     if completion_rate > 0.5 and episode_result['completion_time'] < self.best_time:
                         self.best_time = episode_result['completion_time']
@@ -263,23 +335,33 @@ class MultiAgentTrainer:
                 
                 # 日志输出
                 if episode % self.config['log_interval'] == 0:
-                    recent_rewards = self.episode_rewards[-10:] if len(self.episode_rewards) >= 10 else self.episode_rewards
+                    recent_rewards = self.episode_rewards[-10:] if len(self.episode_rewards) >= 10 \
+                        else self.episode_rewards
                     recent_times = self.episode_times[-10:] if len(self.episode_times) >= 10 else self.episode_times
+                    recent_steps = self.episode_steps[-10:]
                     
                     avg_reward = np.mean(recent_rewards) if recent_rewards else 0
                     avg_time = np.mean(recent_times) if recent_times else 0
+                    avg_steps = np.mean(recent_steps) if recent_steps else 0
                     
                     print(f"Episode {episode}: 奖励={avg_reward:.2f}, 时间={avg_time:.2f}, "
-                          f"完成={episode_result['completed_wafers']}/{len(self.env.wafers)}, "
+                          f"步数={avg_steps:.0f}, 完成={episode_result['completed_wafers']}/{len(self.env.wafers)}, "
                           f"最佳时间={self.best_time:.2f}")
                 
                 # 保存检查点
                 if episode % self.config['save_interval'] == 0 and episode > 0:
                     self.save_checkpoint(episode)
-            
-            except Exception as e:
-                print(f"Episode {episode} 出错: {e}")
-                continue
+                
+                if self._reached_target_gap(episode_result):
+                    print(f"Episode {episode}: 完工时间{episode_result['completion_time']:.2f}与下界"
+                          f"{self.lower_bound:.2f}的差距已达到目标，提前结束训练")
+                    stop = True
+                    break
+                
+                episode += 1
+        
+        if self.vec_env is not None:
+            self.vec_env.close()
         
         print(f"训练完成! 最佳回合: {best_episodes}")
         
@@ -288,37 +370,26 @@ class MultiAgentTrainer:
             'best_solution': self.best_solution,
             'episode_rewards': self.episode_rewards,
             'episode_times': self.episode_times,
+            'episode_steps': self.episode_steps,
             'best_episodes': best_episodes
         }
     
+    def _reached_target_gap(self, episode_result: Dict) -> bool:
+        """本回合完成了全部晶圆，且完工时间与下界的差距不超过target_gap"""
+        target_gap = self.config.get('target_gap')
+        return (target_gap is not None and not episode_result['deadlocked']
+                and episode_result['completed_wafers'] == len(self.env.wafers)
+                and optimality_gap(episode_result['completion_time'], self.lower_bound) <= target_gap)
+    
     def _generate_solution(self, episode_result: Dict) -> List[Dict]:
-        """生成解决方案"""
-        # 简化的解决方案生成
-        solution = []
-        move_id = 0
-        current_time = 0.0
-        
-        for wafer in self.env.wafers:
-            if wafer.is_completed():
-                # 为每个完成的晶圆生成基本的移动序列
-                for step in range(len(wafer.completed_steps)):
-                    solution.append({
-                        'StartTime': current_time,
-                        'EndTime': current_time + 10.0,
-                        'MoveID': move_id,
-                        'MoveType': 8,  # 处理动作
-                        'ModuleName': f'PM{wafer.completed_steps[step] if wafer.completed_steps[step] <= 10 else 1}',
-                        'MatID': wafer.wafer_id,
-                        'SlotID': 1
-                    })
-                    move_id += 1
-                    current_time += 10.0
-        
-        return solution
+        """生成解决方案：取环境（向量化时为对应副本）在本回合实际排定的移动序列"""
+        if 'replica' in episode_result:
+            return self.vec_env.solution(episode_result['replica'])
+        return self.env.move_log.to_dicts(sort=True)
     
     def save_checkpoint(self, episode: int):
         """保存训练检查点"""
-        checkpoint_dir = f"checkpoints/task_{self.task_name}"
+        checkpoint_dir = f"checkpoints/task_{task_label(self.task_name)}"
         os.makedirs(checkpoint_dir, exist_ok=True)
         
         checkpoint = {
@@ -326,6 +397,7 @@ class MultiAgentTrainer:
             'best_time': self.best_time,
             'episode_rewards': self.episode_rewards[-100:],  # 只保存最近100个
             'episode_times': self.episode_times[-100:],
+            'episode_steps': self.episode_steps[-100:],
             'config': self.config,
             'epsilon': self.wafer_agents[list(self.wafer_agents.keys())[0]].epsilon if self.wafer_agents else 0.1
         }
@@ -343,7 +415,7 @@ class MultiAgentTrainer:
         os.makedirs(output_dir, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(output_dir, f"rl_result_task_{self.task_name}_{timestamp}.json")
+        filename = os.path.join(output_dir, f"rl_result_task_{task_label(self.task_name)}_{timestamp}.json")
         
         # 确保有有效的解决方案
         if not self.best_solution:
@@ -352,10 +424,14 @@ class MultiAgentTrainer:
         result = {
             'MoveList': self.best_solution,
             'TotalTime': float(self.best_time) if self.best_time != float('inf') else 0.0,
+            'LowerBound': self.lower_bound,
+            'OptimalityGap': (optimality_gap(self.best_time, self.lower_bound)
+                              if self.best_time != float('inf') else None),
             'TrainingStats': {
                 'episodes': len(self.episode_rewards),
                 'final_avg_reward': float(np.mean(self.episode_rewards[-100:]) if self.episode_rewards else 0),
                 'final_avg_time': float(np.mean(self.episode_times[-100:]) if self.episode_times else 0),
+                'final_avg_steps': float(np.mean(self.episode_steps[-100:]) if self.episode_steps else 0),
                 'best_time': float(self.best_time) if self.best_time != float('inf') else 0.0,
                 'total_wafers': len(self.env.wafers),
                 'config': self.config
@@ -368,6 +444,8 @@ class MultiAgentTrainer:
             
             print(f"最终结果已保存到 {filename}")
             print(f"最佳完工时间: {result['TotalTime']:.2f}秒")
+            if result['OptimalityGap'] is not None:
+                print(f"完工时间下界: {self.lower_bound:.2f}秒, 差距: {result['OptimalityGap']:.2%}")
             return filename
         
         except Exception as e:
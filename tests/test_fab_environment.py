@@ -0,0 +1,733 @@
+#!/usr/bin/env python3
+"""
+制造环境仿真测试
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src'))
+
+from environment.fab_environment import FabEnvironment
+from environment.result_writer import ResultWriter, load_results
+from config.process_config import (PROCESS_ROUTES, PROCESS_TIMES, FLEXIBLE_CHAMBERS, PROCESS_TYPE_IDS,
+                                   ROUTE_TABLE, OPTION_MASK_TABLE, PROCESS_TIME_TABLE, get_step_options)
+
+
+@pytest.mark.parametrize('task_name', ['a', 'b', 'c', 'd'])
+def test_all_wafers_complete(task_name):
+    """测试所有晶圆完成并返回LoadPort"""
+    env = FabEnvironment(task_name)
+    result = env.run_simulation()
+
+    assert result['CompletedWafers'] == result['TotalWafers'] == 75
+    assert not result['ConstraintViolations']
+    assert all(wafer.status == 'completed' for wafer in env.wafers)
+
+
+def test_chambers_run_in_parallel():
+    """测试各腔室并行加工，完工时间远小于串行工艺时间之和"""
+    env = FabEnvironment('b')
+    result = env.run_simulation()
+
+    serial_time = sum(PROCESS_TIMES['B'].values()) * len(env.wafers)
+    assert result['TotalTime'] < serial_time / 2
+
+
+def test_no_overlap_on_resource_timelines():
+    """测试同一腔室的工艺及同一机械臂的动作在时间上互不重叠"""
+    env = FabEnvironment('c')
+    result = env.run_simulation()
+
+    timelines = {}
+    for move in result['MoveList']:
+        if move['MoveType'] in (1, 2, 3, 8):
+            timelines.setdefault(move['ModuleName'], []).append((move['StartTime'], move['EndTime']))
+
+    for intervals in timelines.values():
+        intervals.sort()
+        for (_, end), (start, _) in zip(intervals, intervals[1:]):
+            assert start >= end
+
+
+def test_decision_epoch_time_skipping():
+    """测试按决策时刻跳时推进：每个时刻都有可做决策，且能完成全部晶圆"""
+    env = FabEnvironment('d')
+    epochs = 0
+    
+    env.advance_to_next_decision()
+    while not env.is_done():
+        decision_wafers = env.get_decision_wafers()
+        assert decision_wafers
+        wafer = decision_wafers[0]
+        assert env.dispatch_wafer(wafer, env.get_dispatchable_chambers(wafer)[0])
+        env.advance_to_next_decision()
+        epochs += 1
+    
+    assert env.finished_count == len(env.wafers)
+    assert epochs < env.current_time
+
+
+def test_snapshot_restore_and_fork():
+    """测试快照恢复与分叉得到与原环境完全一致的后续仿真"""
+    env = FabEnvironment('c')
+    initial = env.snapshot()
+    for _ in range(200):
+        env.step()
+    
+    middle = env.snapshot()
+    branch = env.fork()
+    expected = env.run_simulation()
+    
+    assert branch.run_simulation()['MoveList'] == expected['MoveList']
+    
+    env.restore(middle)
+    assert env.run_simulation()['MoveList'] == expected['MoveList']
+    
+    env.restore(initial)
+    assert env.current_time == 0.0 and not env.move_list
+    assert all(wafer.current_step == 0 for wafer in env.wafers)
+    assert env.run_simulation()['TotalTime'] == expected['TotalTime']
+
+
+def test_overtaking_index_matches_scan():
+    """测试超片约束索引与逐片扫描结果一致，含快照恢复后的重建"""
+    env = FabEnvironment('a')
+    
+    def scan(wafer):
+        return not any(other.lot_id == wafer.lot_id and other.wafer_num < wafer.wafer_num and
+                       other.process_type == wafer.process_type and
+                       other.current_step == wafer.current_step and
+                       other.status != 'completed'
+                       for other in env.wafers)
+    
+    snap = None
+    for count in range(600):
+        for wafer in env.wafers:
+            assert env._overtaking_index.is_first_pending(wafer) == scan(wafer)
+        if count == 300:
+            snap = env.snapshot()
+        env.step()
+    
+    env.restore(snap)
+    for wafer in env.wafers:
+        assert env._overtaking_index.is_first_pending(wafer) == scan(wafer)
+
+
+def test_compiled_route_tables_match_config():
+    """测试编译后的路径、柔性选项位掩码和工艺时间表与原始配置一致"""
+    for process_type, route in PROCESS_ROUTES.items():
+        type_id = PROCESS_TYPE_IDS[process_type]
+        for step, chamber_id in enumerate(route):
+            options = next((group for group in FLEXIBLE_CHAMBERS.get(process_type, {}).values()
+                            if chamber_id in group), [chamber_id])
+            assert ROUTE_TABLE[type_id, step] == chamber_id
+            assert get_step_options(type_id, step) == options
+            assert OPTION_MASK_TABLE[type_id, step] == sum(1 << (option - 1) for option in options)
+            assert PROCESS_TIME_TABLE[type_id, step] == PROCESS_TIMES[process_type].get(chamber_id, 0)
+        assert ROUTE_TABLE[type_id, len(route):].sum() == 0
+
+
+def test_free_chamber_mask_matches_chamber_states():
+    """测试空闲腔室位掩码及批量可用掩码与逐个腔室检查一致"""
+    env = FabEnvironment('c')
+    snap = None
+    for count in range(400):
+        expected = sum(1 << (chamber.chamber_id - 1) for chamber in env.chambers.values()
+                       if chamber.can_accept_wafer(None))
+        assert env._free_mask.mask == expected
+        
+        masks = env.get_available_chamber_masks()
+        for wafer, mask in zip(env.wafers, masks.tolist()):
+            brute = sum(1 << (chamber.chamber_id - 1) for chamber in env.chambers.values()
+                        if not wafer.is_completed() and chamber.chamber_id in wafer.get_flexible_chamber_options()
+                        and chamber.can_accept_wafer(wafer))
+            assert mask == env.get_available_chamber_mask(wafer) == brute
+        if count == 200:
+            snap = env.snapshot()
+        env.step()
+    
+    env.restore(snap)
+    assert env._free_mask.mask == sum(1 << (chamber.chamber_id - 1) for chamber in env.chambers.values()
+                                      if chamber.can_accept_wafer(None))
+
+
+def test_fab_state_columns_back_object_views():
+    """测试对象属性是列式状态的视图，整厂向量化查询与逐个对象检查一致"""
+    env = FabEnvironment('d')
+    for _ in range(300):
+        env.step()
+    
+    columns = env.state.columns
+    wafer = env.wafers[10]
+    wafer.current_step = 2
+    assert columns['wafer_step'][10] == 2
+    assert columns['wafer_lot'].tolist() == [w.lot_id for w in env.wafers]
+    assert columns['wafer_num'].tolist() == [w.wafer_num for w in env.wafers]
+    
+    for chamber in env.chambers.values():
+        if chamber.current_wafer is not None:
+            assert columns['chamber_wafer'][env._chamber_index[chamber.chamber_name]] == \
+                env.wafers.index(chamber.current_wafer)
+        assert env.count_wafers_for_chamber(chamber.chamber_id) == sum(
+            1 for w in env.wafers if not w.is_completed() and w.can_enter_chamber(chamber.chamber_id))
+        assert env.count_wafers_at(chamber.chamber_name) == sum(
+            1 for w in env.wafers if w.current_location == chamber.chamber_name)
+    assert env.count_waiting_wafers() == sum(
+        1 for w in env.wafers if w.status == 'waiting' and not w.is_completed())
+    assert env.count_free_chambers() == sum(
+        1 for chamber in env.chambers.values() if chamber.can_accept_wafer(None))
+
+
+def test_move_log_snapshots_survive_branching():
+    """测试恢复到较早快照并继续仿真后，较晚快照中的移动记录不被覆盖"""
+    env = FabEnvironment('b')
+    for _ in range(100):
+        env.step()
+    early = env.snapshot()
+    for _ in range(100):
+        env.step()
+    late = env.snapshot()
+    late_moves = env.move_list
+    
+    env.restore(early)
+    env.run_simulation()
+    env.restore(late)
+    assert env.move_list == late_moves
+    assert set(late_moves[0]) == {'StartTime', 'EndTime', 'MoveID', 'MoveType', 'ModuleName', 'MatID', 'SlotID'}
+
+
+@pytest.mark.parametrize('result_format', ['json', 'ndjson'])
+def test_streamed_results_match_simulation(tmp_path, result_format):
+    """测试仿真过程中分块流式写出的结果与一次性导出的结果一致"""
+    expected = FabEnvironment('b').run_simulation()
+    
+    env = FabEnvironment('b')
+    filename = str(tmp_path / f'result.{result_format}')
+    with ResultWriter(filename, result_format, chunk_size=64) as writer:
+        summary = env.run_simulation(writer)
+        assert 0 < writer.moves_written < len(expected['MoveList'])
+        writer.close(env.move_log, summary)
+    
+    assert load_results(filename) == expected
+    
+    # 已有结果时不再继续仿真，汇总中另有完工时间下界与差距
+    from environment.bounds import bound_report
+    rerun_file = str(tmp_path / f'rerun.{result_format}')
+    env.save_results(rerun_file, result_format, rerun=False)
+    assert load_results(rerun_file) == {**expected, **bound_report(env, expected['TotalTime'])}
+
+
+def test_history_policies_bound_object_histories():
+    """测试历史记录策略：off不记录、ring:N限制条数、full全部保留，且不影响调度结果"""
+    results = {}
+    for policy in ['off', 'ring:3', 'full']:
+        env = FabEnvironment('a', history=policy)
+        results[policy] = env.run_simulation()
+        wafer, chamber, arm = env.wafers[0], env.chambers['PM7'], env.robot_arms['TM1']
+        histories = [wafer.move_history, wafer.processing_history, chamber.processing_history, arm.move_history]
+        if policy == 'off':
+            assert all(len(history) == 0 for history in histories)
+        elif policy == 'ring:3':
+            assert all(len(history) == 3 for history in histories)
+        else:
+            assert len(wafer.move_history) == len(wafer.process_route) + 1
+            assert len(wafer.processing_history) == len(wafer.process_route)
+            assert len(arm.move_history) > 3
+    assert results['off'] == results['ring:3'] == results['full']
+    
+    with pytest.raises(ValueError):
+        FabEnvironment('a', history='ring:0')
+
+
+def test_vec_env_replicas_share_columns_and_finish():
+    """测试向量化环境：副本状态是共享二维列的视图，观测与晶圆智能体一致，贪心策略下全部完工"""
+    from environment.vec_env import VecFabEnv
+    from agents.wafer_agent_fixed import WaferAgent
+    
+    vec_env = VecFabEnv('a', num_envs=3)
+    assert np.shares_memory(vec_env.columns['wafer_step'], vec_env.envs[2].state.columns['wafer_step'])
+    obs, masks = vec_env.reset()
+    assert obs.shape == (3, vec_env.num_agents, 20) and masks.shape == (3, vec_env.num_agents, 5)
+    
+    returns = np.zeros(3)
+    dones = np.zeros(3, dtype=bool)
+    for step in range(5000):
+        # 副本0、1取首个可送入腔室，副本2取最后一个
+        first = np.where(masks[..., 1:].any(axis=-1), masks[..., 1:].argmax(axis=-1) + 1, 0)
+        last = np.where(masks[..., 1:].any(axis=-1), 4 - masks[..., :0:-1].argmax(axis=-1), 0)
+        actions = np.vstack([first[:2], last[2:]])
+        if step == 10:
+            env = vec_env.envs[1]
+            for row in (0, 5, 40):
+                state = WaferAgent(env.wafers[row]).get_state(env)
+                assert np.allclose(obs[1, row, :13], state[:13])
+        obs, rewards, dones, masks = vec_env.step(actions)
+        returns += rewards
+        if dones.all():
+            break
+    
+    assert dones.all()
+    assert all(env.finished_count == len(env.wafers) for env in vec_env.envs)
+    assert np.allclose(-returns, [env.current_time for env in vec_env.envs])
+    assert vec_env.makespans()[0] == vec_env.makespans()[1]
+
+
+def test_parallel_vec_env_matches_vec_env():
+    """测试多进程向量化环境：与单进程版本逐步一致，越界动作按等待处理"""
+    from environment.vec_env import VecFabEnv, ParallelVecFabEnv, WAFER_ACTION_DIM
+    
+    serial, parallel = VecFabEnv('b', num_envs=3), ParallelVecFabEnv('b', num_envs=3, num_workers=2)
+    try:
+        (serial_obs, serial_masks), (parallel_obs, parallel_masks) = serial.reset(), parallel.reset()
+        for step in range(3000):
+            actions = np.where(serial_masks[..., 1:].any(axis=-1), serial_masks[..., 1:].argmax(axis=-1) + 1, 0)
+            if step < 5:
+                actions[:, 0] = [-1, WAFER_ACTION_DIM, 99]
+            serial_obs, serial_rewards, serial_dones, serial_masks = serial.step(actions)
+            parallel_obs, parallel_rewards, parallel_dones, parallel_masks = parallel.step(actions)
+            assert np.array_equal(serial_obs, parallel_obs) and np.array_equal(serial_masks, parallel_masks)
+            assert np.array_equal(serial_rewards, parallel_rewards) and np.array_equal(serial_dones, parallel_dones)
+            if serial_dones.all():
+                break
+        assert serial_dones.all()
+        assert np.array_equal(serial.makespans(), parallel.makespans())
+        assert parallel.solution(2) == serial.solution(2)
+    finally:
+        parallel.close()
+
+
+def test_observation_builder_matches_object_state_vectors():
+    """测试批量观测与各对象状态向量一致，且状态变化后重建"""
+    env = FabEnvironment('c')
+    for _ in range(150):
+        env.step()
+    observations = env.get_observations()
+    for chamber in env.chambers.values():
+        assert np.allclose(observations.chamber(chamber)[:8], chamber.get_state_vector(env.current_time)[:8])
+    for arm in env.robot_arms.values():
+        assert np.allclose(observations.arm(arm)[:7], arm.get_state_vector(env.current_time)[:7])
+    for wafer in env.wafers:
+        row = observations.wafer(wafer)
+        assert row[2] == wafer.current_step and row[9] == len(wafer.get_flexible_chamber_options())
+        assert row[10] == len(env.get_available_chambers_for_wafer(wafer))
+    
+    before = observations.wafers.copy()
+    env.step()
+    assert env.get_observations() is observations
+    assert not np.array_equal(before, observations.wafers)
+
+
+def test_generated_tasks_are_deterministic_and_complete():
+    """测试参数化生成任务：同种子结果相同，工艺取自给定组合，多批次共用LoadPort时全部完工"""
+    from config.task_config import generate_task, get_task_wafers, parse_task_spec
+    
+    spec = 'gen:lots=7,size=4-9,mix=B:2/D/E,seed=5'
+    assert parse_task_spec(spec) == {'lots': 7, 'lot_size': (4, 9), 'mix': {'B': 2.0, 'D': 1.0, 'E': 1.0}, 'seed': 5}
+    wafers = get_task_wafers(spec)
+    assert wafers == generate_task(7, (4, 9), {'B': 2.0, 'D': 1.0, 'E': 1.0}, seed=5)
+    assert wafers != generate_task(7, (4, 9), {'B': 2.0, 'D': 1.0, 'E': 1.0}, seed=6)
+    assert {wafer['process_type'] for wafer in wafers} <= {'B', 'D', 'E'}
+    assert {wafer['lot_id'] for wafer in wafers} == set(range(1, 8))
+    # 修改返回的配置不影响之后的调用
+    wafers[0]['process_type'] = 'Z'
+    assert get_task_wafers(spec)[0]['process_type'] != 'Z'
+    
+    env = FabEnvironment(spec)
+    result = env.run_simulation()
+    assert result['CompletedWafers'] == result['TotalWafers'] == len(wafers)
+    
+    with pytest.raises(ValueError):
+        get_task_wafers('gen:lots=3,mix=Z')
+
+
+def test_topology_transfer_matrix_and_engine_moves(tmp_path):
+    """测试拓扑编译：YAML布局与内置布局一致，跨TM经LoadLock交接，引擎移动时间取自时间表"""
+    import yaml
+    from config.topology import DEFAULT_LAYOUT, DEFAULT_TOPOLOGY, load_topology
+    
+    layout_file = tmp_path / 'layout.yaml'
+    layout_file.write_text(yaml.safe_dump(DEFAULT_LAYOUT), encoding='utf-8')
+    topology = load_topology(str(layout_file))
+    assert topology.modules == DEFAULT_TOPOLOGY.modules
+    assert np.array_equal(topology.transfer_times, DEFAULT_TOPOLOGY.transfer_times)
+    
+    # PM7(TM2)到PM1(TM3)经LLC交接：TM2转3格、TM3转1格，各一次取放
+    assert topology.transfer_path('PM7', 'PM1') == [('TM2', 'PM7', 'LLC'), ('TM3', 'LLC', 'PM1')]
+    assert topology.transfer_time('PM7', 'PM1') == (1.5 + 5 + 7) + (0.5 + 5 + 7)
+    assert topology.module_at('TM3', 5) == 'PM6' and topology.move_time('TM2', 0, 4) == 2.0
+    
+    env = FabEnvironment('b', topology=topology)
+    result = env.run_simulation()
+    assert result['CompletedWafers'] == 75
+    arm_moves = [move for move in result['MoveList'] if move['MoveType'] == 3]
+    assert {move['EndTime'] - move['StartTime'] for move in arm_moves} <= {0.5, 1.0, 1.5, 2.0}
+    assert all(move['EndTime'] - move['StartTime'] == 1.0 for move in arm_moves if move['ModuleName'] == 'TM1')
+
+
+def test_swap_mode_shortens_makespan():
+    """测试换片模式：只在PM处换片，全部晶圆完工且完工时间短于单片取放"""
+    results = {}
+    for swap in (False, True):
+        env = FabEnvironment('c', swap=swap)
+        swaps = []
+        execute_swap = env.execute_swap
+        env.execute_swap = lambda *args: swaps.append(args[1].chamber_name) or execute_swap(*args)
+        results[swap] = env.run_simulation()
+        assert results[swap]['CompletedWafers'] == 75
+        assert not results[swap]['ConstraintViolations']
+        assert bool(swaps) == swap
+        assert all(name.startswith('PM') for name in swaps)
+    
+    assert results[True]['TotalTime'] < results[False]['TotalTime']
+
+
+def test_loadlock_pump_vent_cycles():
+    """测试LLA/LLB抽充气：气氛切换交替进行，部分循环兼顾进出两个方向，且不与放片重叠"""
+    from config.equipment_config import MOVE_TYPES
+    
+    env = FabEnvironment('b')
+    result = env.run_simulation()
+    assert result['CompletedWafers'] == 75
+    
+    cycles = 0
+    for name in ('LLA', 'LLB'):
+        moves = sorted((move for move in result['MoveList'] if move['ModuleName'] == name),
+                       key=lambda move: move['StartTime'])
+        conditioning = [move for move in moves if move['MoveType'] in (MOVE_TYPES['PUMP'], MOVE_TYPES['VENT'])]
+        # 初始为大气，抽气与充气交替
+        assert [move['MoveType'] for move in conditioning] == [
+            (MOVE_TYPES['PUMP'], MOVE_TYPES['VENT'])[i % 2] for i in range(len(conditioning))]
+        doors = [move for move in moves if move['MoveType'] == MOVE_TYPES['PREPARE']]
+        for door in doors:
+            assert all(door['EndTime'] <= move['StartTime'] or door['EndTime'] >= move['EndTime']
+                       for move in conditioning)
+        cycles += len(conditioning)
+    
+    # 75片进出共150次跨越大气与真空
+    assert 0 < cycles < 2 * 150
+
+
+def test_cleaning_policies():
+    """测试PM清洁：清洁与工艺互不重叠，两次清洁之间不超过片数阈值，提前清洁不慢于按需清洁"""
+    from config.equipment_config import CLEAN_PARAMS, MOVE_TYPES
+    
+    results = {}
+    for cleaning in ('off', 'naive', 'opportunistic'):
+        result = FabEnvironment('a', cleaning=cleaning).run_simulation()
+        assert result['CompletedWafers'] == 75
+        results[cleaning] = result
+        
+        timelines = {}
+        for move in result['MoveList']:
+            if move['MoveType'] in (MOVE_TYPES['PROCESS'], MOVE_TYPES['CLEAN']) and move['ModuleName'].startswith('PM'):
+                timelines.setdefault(move['ModuleName'], []).append(move)
+        for moves in timelines.values():
+            moves.sort(key=lambda move: move['StartTime'])
+            assert all(later['StartTime'] >= earlier['EndTime'] for earlier, later in zip(moves, moves[1:]))
+            processed = 0
+            for move in moves:
+                processed = 0 if move['MoveType'] == MOVE_TYPES['CLEAN'] else processed + 1
+                assert cleaning == 'off' or processed <= CLEAN_PARAMS['wafer_count_threshold']
+    
+    assert not any(move['MoveType'] == MOVE_TYPES['CLEAN'] for move in results['off']['MoveList'])
+    assert results['off']['TotalTime'] < results['opportunistic']['TotalTime'] < results['naive']['TotalTime']
+    
+    with pytest.raises(ValueError):
+        FabEnvironment('a', cleaning='always')
+
+
+def test_compare_engine_variants():
+    """测试设置对比脚本：按各清洁策略与换片开关仿真内置调度，不计清洁最快，提前清洁不慢于按需清洁，换片快于单片取放"""
+    from compare_schedules import engine_variants
+    from environment.replay import compare_schedules
+    
+    summaries = compare_schedules(engine_variants('b'))
+    makespans = {label: summary['Makespan'] for label, summary in summaries.items()}
+    assert len(makespans) == 6
+    for swap in ('on', 'off'):
+        assert makespans[f'b cleaning=off swap={swap}'] < makespans[f'b cleaning=opportunistic swap={swap}'] \
+            <= makespans[f'b cleaning=naive swap={swap}']
+    for cleaning in ('off', 'naive', 'opportunistic'):
+        assert makespans[f'b cleaning={cleaning} swap=on'] < makespans[f'b cleaning={cleaning} swap=off']
+
+
+def test_deadlock_detection():
+    """测试死锁检测：绕过安全过滤后贪心派发陷入死锁时立即终止，默认安全过滤下不会死锁"""
+    env = FabEnvironment('b', swap=False, cleaning='off')
+    env.is_safe_move = lambda wafer, chamber: True
+    result = env.run_simulation()
+    assert env.is_deadlocked()
+    assert result['CompletedWafers'] < result['TotalWafers']
+    assert result['Deadlock'] == [env.wafers[i].wafer_id for i in sorted(env.deadlocked)]
+    # 死锁晶圆都已就绪，且下一步的可选腔室全被死锁集合中的晶圆占用
+    holders = {name: index for index, name in env._committed.items()}
+    for index in env.deadlocked:
+        wafer = env.wafers[index]
+        assert index in env._ready
+        options = env._step_option_names[wafer.process_type_id][wafer.current_step]
+        assert all(holders.get(name) in env.deadlocked for name in options)
+    
+    # 快照携带死锁状态
+    fresh = FabEnvironment('b', swap=False, cleaning='off')
+    fresh.restore(env.snapshot())
+    assert fresh.deadlocked == env.deadlocked
+    
+    env = FabEnvironment('b')
+    assert 'Deadlock' not in env.run_simulation()
+    assert not env.is_deadlocked()
+    env = FabEnvironment('b')
+    env.advance_to_next_decision()
+    for wafer in env.get_decision_wafers():
+        assert set(env.get_dispatchable_chambers(wafer)) <= set(env.get_safe_chambers(wafer))
+
+
+def test_robustness_evaluation():
+    """测试蒙特卡洛鲁棒性评估：时长不变时重放与计划一致，工艺延长沿腔室与晶圆链传播"""
+    from environment.robustness import PrecedenceNetwork, evaluate_robustness
+    
+    result = FabEnvironment('b').run_simulation()
+    report = evaluate_robustness(result['MoveList'], 50, variability={}, seed=0)
+    assert report['PlannedMakespan'] == result['TotalTime']
+    assert set(report['MakespanPercentiles'].values()) == {result['TotalTime']}
+    assert all(lateness['Mean'] == 0 for lateness in report['ChamberLateness'].values())
+    
+    report = evaluate_robustness(result['MoveList'], 200, variability={'PROCESS': 0.1}, seed=0)
+    percentiles = list(report['MakespanPercentiles'].values())
+    assert result['TotalTime'] <= percentiles[0] and percentiles == sorted(percentiles)
+    assert set(report['ChamberLateness']) == {move['ModuleName'] for move in result['MoveList']
+                                              if not move['ModuleName'].startswith('TM')}
+    
+    # x在PM1工艺后由TM2取走，y随后在PM1工艺；x的工艺延长10秒，取片与y的工艺都顺延
+    moves = [
+        {'StartTime': 0, 'EndTime': 10, 'MoveID': 1, 'MoveType': 8, 'ModuleName': 'PM1', 'MatID': 'x', 'SlotID': 1},
+        {'StartTime': 10, 'EndTime': 15, 'MoveID': 2, 'MoveType': 1, 'ModuleName': 'TM2_R1', 'MatID': 'x', 'SlotID': 1},
+        {'StartTime': 15, 'EndTime': 25, 'MoveID': 3, 'MoveType': 8, 'ModuleName': 'PM1', 'MatID': 'y', 'SlotID': 1},
+    ]
+    network = PrecedenceNetwork(moves)
+    ends = network.replay(np.array([[20.0], [5.0], [10.0]]))
+    assert ends[:, 0].tolist() == [20.0, 25.0, 30.0]
+    
+    # 双臂机械手的两个手指相互独立，R1上的延误不顺延R2
+    arm_moves = [
+        {'StartTime': 0, 'EndTime': 5, 'MoveID': 1, 'MoveType': 1, 'ModuleName': 'TM2_R1', 'MatID': 'x', 'SlotID': 1},
+        {'StartTime': 2, 'EndTime': 7, 'MoveID': 2, 'MoveType': 1, 'ModuleName': 'TM2_R2', 'MatID': 'z', 'SlotID': 1},
+    ]
+    ends = PrecedenceNetwork(arm_moves).replay(np.array([[15.0], [5.0]]))
+    assert ends[:, 0].tolist() == [15.0, 7.0]
+    
+    with pytest.raises(ValueError):
+        evaluate_robustness(moves, 10, distribution='cauchy')
+
+
+def test_schedule_replay_kpis():
+    """测试调度重放指标：周期、在制品、利用率、机械臂移动占比与排队时间"""
+    from environment.replay import ScheduleReplay
+    
+    def move(start, end, move_type, module, wafer):
+        return {'StartTime': start, 'EndTime': end, 'MoveID': 0, 'MoveType': move_type,
+                'ModuleName': module, 'MatID': wafer, 'SlotID': 1}
+    
+    moves = [
+        move(0, 4, 1, 'TM1', 'x'), move(4, 5, 3, 'TM1', 'x'), move(5, 9, 2, 'TM1', 'x'),
+        move(9, 19, 8, 'PM1', 'x'), move(25, 30, 1, 'TM2_R1', 'x'), move(30, 35, 2, 'TM2_R2', 'x'),
+        move(10, 14, 1, 'TM1', 'y'), move(14, 18, 2, 'TM1', 'y'), move(18, 28, 8, 'PM2', 'y'),
+        move(28, 33, 1, 'TM2_R1', 'y'), move(33, 36, 2, 'TM2_R2', 'y'),
+    ]
+    replay = ScheduleReplay.from_move_list(moves)
+    summary = replay.summary()
+    assert summary['Makespan'] == 36 and summary['Wafers'] == 2
+    assert summary['CycleTime'] == {'Mean': 30.5, 'Min': 26.0, 'Max': 35.0}
+    assert summary['WIP'] == {'Mean': 61 / 36, 'Max': 2}
+    assert replay.wip_at([5, 20, 35, 36]).tolist() == [1, 2, 1, 0]
+    # 双臂的两个手指分别统计，同一手指上的重叠区间只计一次
+    assert summary['Utilization']['TM2_R1'] == pytest.approx(8 / 36)
+    assert summary['Utilization']['TM2_R2'] == pytest.approx(6 / 36)
+    assert summary['Utilization']['PM1'] == pytest.approx(10 / 36)
+    assert summary['ArmTravelShare'] == {'TM1': pytest.approx(1 / 17), 'TM2_R1': 0.0, 'TM2_R2': 0.0}
+    assert summary['QueueTime'] == {'Mean': 3.0, 'Max': 6.0, 'Total': 6.0}
+    assert summary['ChamberQueueTime'] == {'PM1': 6.0, 'PM2': 0.0}
+    
+    # 直接读取环境记录与读取导出的MoveList结果一致
+    env = FabEnvironment('b', history='off')
+    result = env.run_simulation()
+    summary = ScheduleReplay.from_move_log(env.move_log).summary()
+    assert summary == ScheduleReplay.from_move_list(result['MoveList']).summary()
+    assert summary['Makespan'] == result['TotalTime'] and summary['Wafers'] == 75
+
+
+def test_dispatch_rules():
+    """测试派发规则库：各规则都能完成任务，fifo与默认调度一致，可传入自定义规则"""
+    from environment.dispatch_rules import DISPATCH_RULES, DispatchRule
+    
+    makespans = {}
+    for policy in DISPATCH_RULES:
+        env = FabEnvironment('c', history='off', policy=policy)
+        result = env.run_simulation()
+        assert result['CompletedWafers'] == 75 and not result['ConstraintViolations']
+        assert env.fork().policy is env.policy
+        makespans[policy] = result['TotalTime']
+    assert makespans['fifo'] == FabEnvironment('c', history='off').run_simulation()['TotalTime']
+    assert min(makespans.values()) < makespans['fifo']
+    
+    class LastLotFirst(DispatchRule):
+        def wafer_key(self, env, wafer):
+            return -wafer.lot_id, wafer.wafer_num
+    
+    env = FabEnvironment('c', history='off', policy=LastLotFirst())
+    assert env.run_simulation()['CompletedWafers'] == 75
+    
+    # 排序键依赖机械臂状态的规则每派发一片后重新排序其余候选
+    class CountingNearestArm(DISPATCH_RULES['nearest_arm']):
+        evaluations = 0
+        
+        def wafer_key(self, env, wafer):
+            self.evaluations += 1
+            return super().wafer_key(env, wafer)
+    
+    class StaticNearestArm(CountingNearestArm):
+        dynamic_key = False
+    
+    dynamic, static = CountingNearestArm(), StaticNearestArm()
+    for policy in (dynamic, static):
+        env = FabEnvironment('c', history='off', policy=policy)
+        env.advance_to_next_decision()
+        env.dispatch()
+    assert dynamic.evaluations > static.evaluations
+    with pytest.raises(ValueError):
+        FabEnvironment('c', policy='random')
+
+
+def test_beam_scheduler():
+    """测试束搜索：得到完整可重放的调度，完工时间不差于贪心且不低于下界"""
+    from solvers.beam_search import BeamScheduler, lower_bound
+    from environment.robustness import PrecedenceNetwork
+    
+    greedy = FabEnvironment('c', history='off').run_simulation()['TotalTime']
+    env = FabEnvironment('c', history='off')
+    env.advance_to_next_decision()
+    bound = lower_bound(env)
+    scheduler = BeamScheduler(env, beam_width=2, time_budget=3.0)
+    result = scheduler.solve()
+    assert result['CompletedWafers'] == 75 and not result['ConstraintViolations']
+    assert scheduler.levels > 0 and scheduler.expanded > 0
+    assert bound <= result['TotalTime'] <= greedy
+    
+    # 时长不变时按前后约束重放与计划一致
+    network = PrecedenceNetwork(result['MoveList'])
+    np.testing.assert_allclose(network.replay(network.duration[:, None])[:, 0], network.end)
+
+
+def test_cyclic_scheduler():
+    """测试循环调度：周期不低于资源负荷下界，展开结果通过规则校验且不晚于派发规则仿真，长批次也能快速展开"""
+    from solvers.cyclic import CyclicScheduler
+    from environment.robustness import PrecedenceNetwork
+    from environment.validation import schedule_violations
+    from config.equipment_config import MOVE_TYPES
+    
+    env = FabEnvironment('b', history='off')
+    scheduler = CyclicScheduler(env)
+    result = scheduler.solve()
+    assert scheduler.cycle_wafers == 2
+    assert scheduler.period >= scheduler.period_lower_bound()
+    assert result['CompletedWafers'] == 75 and result['CyclePeriod'] == scheduler.period
+    assert result['TotalTime'] >= 75 * scheduler.period
+    assert result['ConstraintViolations'] == []
+    # 默认设置下不晚于派发规则仿真；不清洁时不晚于同样不换片的仿真
+    assert result['TotalTime'] <= FabEnvironment('b', history='off').run_simulation()['TotalTime']
+    off = CyclicScheduler(FabEnvironment('b', history='off', cleaning='off')).solve()
+    assert off['ConstraintViolations'] == []
+    no_swap = FabEnvironment('b', history='off', cleaning='off', swap=False)
+    assert off['TotalTime'] <= no_swap.run_simulation()['TotalTime']
+    
+    # 同一模块上除开门外的移动不重叠，按前后约束重放与计划一致
+    move_list = result['MoveList']
+    moves = {}
+    for move in move_list:
+        if move['MoveType'] != MOVE_TYPES['PREPARE']:
+            moves.setdefault(move['ModuleName'], []).append((move['StartTime'], move['EndTime']))
+    for intervals in moves.values():
+        intervals.sort()
+        assert all(later[0] >= earlier[1] - 1e-9 for earlier, later in zip(intervals, intervals[1:]))
+    network = PrecedenceNetwork(move_list)
+    np.testing.assert_allclose(network.replay(network.duration[:, None])[:, 0], network.end)
+    
+    # 校验能发现违规：工艺被缩短
+    process = next(move for move in move_list if move['MoveType'] == MOVE_TYPES['PROCESS'])
+    process['EndTime'] -= 1
+    assert [violation['type'] for violation in schedule_violations(env, move_list)] == ['process']
+    
+    # 引擎逐个决策生成的调度（含换片与空闲清洁）通过校验
+    for task in ('a', 'd'):
+        env = FabEnvironment(task, history='off')
+        assert schedule_violations(env, env.run_simulation()['MoveList']) == []
+    
+    # 不逐个决策仿真，千片批次也能直接展开
+    env = FabEnvironment('gen:lots=40,size=25,mix=B', history='off', cleaning='off')
+    result = CyclicScheduler(env).solve()
+    assert result['CompletedWafers'] == 1000 and result['ConstraintViolations'] == []
+    assert result['TotalTime'] < 1000 * scheduler.period + 1000
+    
+    # 混合工艺与同一片多次进入同一PM的路径A不适用
+    with pytest.raises(ValueError):
+        CyclicScheduler(FabEnvironment('c', history='off'))
+    with pytest.raises(ValueError, match='PM7'):
+        CyclicScheduler(FabEnvironment('a', history='off'))
+
+
+def test_makespan_lower_bound(tmp_path):
+    """测试完工时间下界：不超过任何可行调度的完工时间，结果文件中带有下界与差距"""
+    from environment.bounds import makespan_lower_bound, optimality_gap, BOUND_COMPONENTS
+    
+    for task_name in ('a', 'b', 'c', 'd'):
+        bound = makespan_lower_bound(FabEnvironment(task_name, history='off'))
+        assert set(bound['Components']) == set(BOUND_COMPONENTS)
+        assert bound['LowerBound'] == max(bound['Components'].values())
+        greedy = FabEnvironment(task_name, history='off').run_simulation()['TotalTime']
+        assert 0 < bound['LowerBound'] <= greedy
+    
+    # 不清洁时PM组不计清洁时间，下界更小
+    assert makespan_lower_bound(FabEnvironment('b', history='off', cleaning='off'))['LowerBound'] \
+        < makespan_lower_bound(FabEnvironment('b', history='off'))['LowerBound']
+    assert optimality_gap(110.0, 100.0) == pytest.approx(0.1)
+    
+    env = FabEnvironment('b', history='off')
+    filename = str(tmp_path / 'result.json')
+    env.save_results(filename)
+    result = load_results(filename)
+    assert result['LowerBound'] == makespan_lower_bound(env)['LowerBound']
+    assert result['OptimalityGap'] == pytest.approx(optimality_gap(result['TotalTime'], result['LowerBound']))
+    assert result['OptimalityGap'] >= 0
+
+
+def test_milp_scheduler():
+    """测试小规模精确调度：子问题取各LoadPort先出片的晶圆，模型最优值不低于完工时间下界，可作为完整调度的开头"""
+    from solvers.milp import MILPScheduler
+    from environment.bounds import makespan_lower_bound
+    
+    # 子问题固定不清洁、不换片，与完整任务的设置无关
+    env = FabEnvironment('b', history='off')
+    scheduler = MILPScheduler(env, wafers=3, time_limit=60)
+    assert [wafer.wafer_id for wafer in scheduler.sub_env.wafers] == ['1.1', '2.1', '3.1']
+    result = scheduler.solve()
+    assert result['Cleaning'] == 'off' and result['Swap'] is False and env.cleaning == 'opportunistic'
+    assert result['MILPStatus'] == 'Optimal'
+    assert result['MILPBound'] == pytest.approx(result['MILPObjective'], abs=1e-3)
+    assert result['MILPObjective'] >= makespan_lower_bound(scheduler.sub_env)['LowerBound'] - 1e-6
+    assert result['CompletedWafers'] == 3 and not result['ConstraintViolations']
+    # 按模型解生成的调度通过校验，完工时间即模型最优值
+    assert not result['Fallback'] and result['ProvenOptimal']
+    assert result['TotalTime'] == pytest.approx(result['MILPObjective']) and result['TotalTime'] <= result['GreedyTime']
+    
+    # 以子问题的调度开头贪心完成整个任务
+    full = scheduler.warm_start()
+    assert full['CompletedWafers'] == 75 and not full['ConstraintViolations'] and 'Deadlock' not in full
+    
+    # 求解器未给出可行解时改用子问题的贪心调度
+    scheduler = MILPScheduler(FabEnvironment('b', history='off', cleaning='off'), wafers=3, time_limit=1e-3)
+    result = scheduler.solve()
+    assert result['MILPStatus'] == 'NoSolution' and result['Fallback'] and not result['ProvenOptimal']
+    assert result['TotalTime'] == result['GreedyTime'] and result['CompletedWafers'] == 3
\ No newline at end of file